@@ -1,71 +1,293 @@
-from datetime import date, datetime, timedelta
-from typing import List
-
-import pytz
-
-from grid_connection import GridConnection, PredictionType
-from historic_consumption_service import HistoricConsumptionService
-from prediction import PredictionService
-from solar_forecast import SolarForecastService
-
-
-def main():
-    solar_forecast_service = SolarForecastService()
-    historic_consumption_service = HistoricConsumptionService()
-
-    prediction_service = PredictionService(solar_forecast_service, historic_consumption_service)
-
-    connections = get_example_connections()
-
-    today = date.today()
-    days = [today + timedelta(days=i) for i in range(1, 3)]
-
-    for day in days:
-        for connection in connections:
-            print(day, connection)
-            predictions = prediction_service.make_prediction_for_day(connection, day)
-            print(predictions)
-
-
-def get_example_connections() -> List[GridConnection]:
-    """
-
-    Returns:
-        one connection of each type
-    """
-    return [GridConnection('example regular connection',
-                           '123456789012345678',
-                           pytz.utc.localize(datetime(2020, 1, 1)),
-                           pytz.utc.localize(datetime(2025, 1, 1)),
-                           PredictionType.regular,
-                           12324
-                           ),
-            GridConnection('example solar connection',
-                           '234567890123456789',
-                           pytz.utc.localize(datetime(2020, 1, 1)),
-                           pytz.utc.localize(datetime(2025, 1, 1)),
-                           PredictionType.solar,
-                           -12324,
-                           52.5,
-                           5.5,
-                           11,
-                           -10,
-                           987
-                           ),
-            GridConnection('example mixed connection',
-                           '345678901234567890',
-                           pytz.utc.localize(datetime(2020, 1, 1)),
-                           pytz.utc.localize(datetime(2025, 1, 1)),
-                           PredictionType.mixed_solar_regular,
-                           101,
-                           51.1,
-                           4.5,
-                           15,
-                           45,
-                           112
-                           ),
-            ]
-
-
-if __name__ == "__main__":
-    main()
+import argparse
+import logging
+import os
+from datetime import date, datetime, timedelta, timezone
+from functools import partial
+from itertools import chain
+from typing import List, Optional
+
+# Modules depending on pandas get imported once a command needs them, so
+# that e.g. --help or argument errors return quickly.
+from .grid_connection import GridConnection, PredictionType
+from .connection_loader import default_chunk_size, load_connections
+from .instrumentation import JsonLinesSink, LoggingSink, Metrics, PrometheusTextFileSink
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Predict day-ahead orders")
+    parser.add_argument(
+        "--connections",
+        help="portfolio export (.csv or .jsonl) to stream connections from "
+        "(one connection of each type if not given)",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=default_chunk_size,
+        help="number of connections to predict at once",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes (small fleets are predicted in process)",
+    )
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=2,
+        help="number of days from tomorrow on to predict (e.g. 7 for weekend "
+        "and holiday planning), predicted together",
+    )
+    parser.add_argument(
+        "--backtest",
+        nargs=2,
+        type=date.fromisoformat,
+        metavar=("FIRST_DAY", "LAST_DAY"),
+        help="instead of predicting, replay predictions of past delivery days "
+        "(ISO dates, inclusive) and report their errors per connection type",
+    )
+    parser.add_argument(
+        "--intraday",
+        action="store_true",
+        help="instead of predicting the next days, re-predict today from "
+        "metering data measured so far (e.g. every 15 minutes)",
+    )
+    parser.add_argument(
+        "--intraday-state",
+        metavar="PATH",
+        help="file (.npz) keeping intraday state between runs, so that each "
+        "run fetches only metering data arrived since the previous one",
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="ADDRESS",
+        help="instead of predicting once, keep running and serve predictions "
+        "over HTTP on HOST:PORT or a Unix socket path (see server)",
+    )
+    parser.add_argument(
+        "--warm-up",
+        action="store_true",
+        help="with --serve, predict all connections for the next --days "
+        "days before serving, so that the first requests find warm caches",
+    )
+    parser.add_argument(
+        "--batch-linger",
+        type=float,
+        metavar="SECONDS",
+        help="with --serve, how long a batch of requests waits for more "
+        "requests to predict together (2 ms by default)",
+    )
+    parser.add_argument(
+        "--output",
+        metavar="PATH",
+        help="write per-connection predictions to a file (.parquet, .arrow or "
+        ".csv) as they finish, instead of printing them",
+    )
+    parser.add_argument(
+        "--order",
+        metavar="PATH",
+        help="write predictions summed per balancing portfolio and hour to a "
+        "file (.parquet, .arrow or .csv)",
+    )
+    parser.add_argument(
+        "--metrics-log", action="store_true", help="log stage timings and counts"
+    )
+    parser.add_argument(
+        "--metrics-jsonl",
+        metavar="PATH",
+        help="append stage timings and counts to a JSON lines file",
+    )
+    parser.add_argument(
+        "--metrics-prometheus",
+        metavar="PATH",
+        help="write stage timings and counts to a Prometheus text file",
+    )
+    args = parser.parse_args()
+    if args.days < 1:
+        parser.error("--days should be at least 1")
+
+    sinks = []
+    if args.metrics_log:
+        logging.basicConfig(level=logging.INFO)
+        sinks.append(LoggingSink())
+    if args.metrics_jsonl:
+        sinks.append(JsonLinesSink(args.metrics_jsonl))
+    if args.metrics_prometheus:
+        sinks.append(PrometheusTextFileSink(args.metrics_prometheus))
+    if args.serve is not None and args.workers > 1:
+        parser.error("--serve predicts in process (--workers 1)")
+    if sinks and args.workers > 1:
+        parser.error("metrics are only collected when predicting in process (--workers 1)")
+    metrics = Metrics(sinks) if sinks else None
+
+    try:
+        run(args, metrics)
+    finally:
+        if metrics is not None:
+            metrics.flush()
+
+
+def run(args: argparse.Namespace, metrics: Optional[Metrics]):
+    from .runner import default_prediction_service, predict_chunks, predict_fleet
+
+    service_factory = partial(default_prediction_service, metrics)
+
+    if args.backtest is not None:
+        from .backtest import backtest
+
+        first_day, last_day = args.backtest
+        connections = (
+            get_example_connections()
+            if args.connections is None
+            else chain.from_iterable(load_connections(args.connections, args.chunk_size))
+        )
+        report = backtest(service_factory(), connections, first_day, last_day, args.chunk_size)
+        print(report.summary())
+        return
+
+    if args.serve is not None:
+        serve(args, service_factory())
+        return
+
+    if args.intraday:
+        from .intraday import IntradayPredictor
+
+        connections = (
+            get_example_connections()
+            if args.connections is None
+            else list(chain.from_iterable(load_connections(args.connections, args.chunk_size)))
+        )
+        prediction_service = service_factory()
+        predictor = None
+        if args.intraday_state and os.path.exists(args.intraday_state):
+            predictor = IntradayPredictor.load(
+                args.intraday_state, prediction_service, connections
+            )
+        if predictor is None:
+            predictor = IntradayPredictor(prediction_service, connections)
+        print(predictor.refresh())
+        if args.intraday_state:
+            predictor.save(args.intraday_state)
+        return
+
+    today = date.today()
+    days = [today + timedelta(days=i) for i in range(1, args.days + 1)]
+
+    if args.connections is None:
+        connections = get_example_connections()
+        predictions = predict_fleet(
+            connections, days, args.workers, args.chunk_size, service_factory
+        )
+        if args.output is None and args.order is None:
+            print(predictions)
+            return
+
+        from .order_output import OrderOutput
+
+        with OrderOutput(args.output, args.order) as output:
+            output.write(predictions, [c.balancing_portfolio for c in connections])
+        return
+
+    if args.output is None and args.order is None:
+        chunks = load_connections(args.connections, args.chunk_size)
+        for predictions in predict_chunks(chunks, days, args.workers, service_factory):
+            print(predictions)
+        return
+
+    from .order_output import OrderOutput
+
+    # Portfolios of connections whose predictions are not written yet (chunks
+    # may finish out of order when predicted by workers).
+    portfolios = {}
+
+    def remember_portfolios(chunks):
+        for chunk in chunks:
+            portfolios.update((c.ean_code, c.balancing_portfolio) for c in chunk)
+            yield chunk
+
+    chunks = remember_portfolios(load_connections(args.connections, args.chunk_size))
+    with OrderOutput(args.output, args.order) as output:
+        for predictions in predict_chunks(chunks, days, args.workers, service_factory):
+            output.write(predictions, [portfolios.pop(ean) for ean in predictions.index])
+
+
+def serve(args: argparse.Namespace, prediction_service):
+    import signal
+    import threading
+
+    from .connection_registry import ConnectionRegistry
+    from .server import PredictionServer, default_linger
+
+    connections = (
+        get_example_connections()
+        if args.connections is None
+        else chain.from_iterable(load_connections(args.connections, args.chunk_size))
+    )
+    registry = ConnectionRegistry.from_connections(connections)
+
+    linger = default_linger if args.batch_linger is None else args.batch_linger
+    logging.basicConfig(level=logging.INFO)
+
+    with PredictionServer(
+        prediction_service, registry, args.serve, linger, args.chunk_size
+    ) as server:
+        if args.warm_up:
+            server.warm_up(date.today() + timedelta(days=1), args.days)
+
+        def stop(*_):
+            # shutdown waits for serve_forever, running in this very thread
+            threading.Thread(target=server.shutdown).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        logging.getLogger(__name__).info(
+            "Serving predictions of %d connections on %s", len(registry), args.serve
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def get_example_connections() -> List[GridConnection]:
+    """
+
+    Returns:
+        one connection of each type
+    """
+    return [GridConnection('example regular connection',
+                           '123456789012345678',
+                           datetime(2020, 1, 1, tzinfo=timezone.utc),
+                           None,
+                           PredictionType.regular,
+                           12324
+                           ),
+            GridConnection('example solar connection',
+                           '234567890123456789',
+                           datetime(2020, 1, 1, tzinfo=timezone.utc),
+                           None,
+                           PredictionType.solar,
+                           -12324,
+                           52.5,
+                           5.5,
+                           11,
+                           -10,
+                           987
+                           ),
+            GridConnection('example mixed connection',
+                           '345678901234567890',
+                           datetime(2020, 1, 1, tzinfo=timezone.utc),
+                           None,
+                           PredictionType.mixed_solar_regular,
+                           101,
+                           51.1,
+                           4.5,
+                           15,
+                           45,
+                           112
+                           ),
+            ]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Async driver for PredictionService.
+
+All inputs of a batch (historic consumption, solar forecasts and backcasts)
+get requested concurrently - bounded by a semaphore and per-host connection
+limits, retried with backoff - into the caching services. The vectorized
+prediction then runs on warm caches without waiting on any further I/O.
+"""
+
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from pandas import DataFrame, Index, Series, concat
+
+from .connection_registry import activity_matrix, ean_codes_of
+from .consumption_cache import CachingHistoricConsumptionService
+from .grid_connection import GridConnection, PredictionType
+from .historic_consumption_service import HistoricConsumptionService, default_batch_size
+from .instrumentation import Metrics
+from .prediction import (
+    PredictionService,
+    consecutive_runs,
+    days_between,
+    group_by_prediction_type,
+)
+from .solar_forecast import SolarForecastService
+from .solar_forecast_cache import CachedSolarForecastService
+from .utils.aio import HostConnectionLimits, RetryPolicy, call_with_retry
+from .utils.datetime import get_prediction_range, slots_per_day
+from .weekday_profile import align_local_hours
+
+default_max_concurrency = 64
+default_max_connections_per_host = 16
+
+
+class AsyncPredictionService:
+    """
+    Overlaps all fetches needed by PredictionService for a batch
+    (see module docs).
+    """
+
+    def __init__(
+        self,
+        solar_forecast_service: SolarForecastService,
+        historic_consumption_service: HistoricConsumptionService,
+        max_concurrency: int = default_max_concurrency,
+        max_connections_per_host: int = default_max_connections_per_host,
+        batch_size: int = default_batch_size,
+        retry_policy: Optional[RetryPolicy] = None,
+        metrics: Optional[Metrics] = None,
+    ):
+        """
+        Args:
+            solar_forecast_service: gets wrapped in CachedSolarForecastService
+                unless it already is one
+            historic_consumption_service: gets wrapped in
+                CachingHistoricConsumptionService unless it already is one
+            max_concurrency: max number of requests in flight overall
+            max_connections_per_host: max number of requests in flight to
+                each of the services
+            batch_size: max number of connections per historic request
+            retry_policy: for transient failures of requests
+            metrics: see PredictionService
+        """
+        if not isinstance(solar_forecast_service, CachedSolarForecastService):
+            solar_forecast_service = CachedSolarForecastService(solar_forecast_service)
+        if not isinstance(historic_consumption_service, CachingHistoricConsumptionService):
+            historic_consumption_service = CachingHistoricConsumptionService(
+                historic_consumption_service
+            )
+
+        self.solar_forecast_service = solar_forecast_service
+        self.historic_consumption_service = historic_consumption_service
+        self.prediction_service = PredictionService(
+            solar_forecast_service, historic_consumption_service, metrics=metrics
+        )
+        self.max_concurrency = max_concurrency
+        self.max_connections_per_host = max_connections_per_host
+        self.batch_size = batch_size
+        self.retry_policy = retry_policy or RetryPolicy()
+
+    async def make_prediction_for_day(
+        self, connection: GridConnection, prediction_day: date
+    ) -> Series:
+        """
+        See PredictionService.make_prediction_for_day
+        """
+        await self.prefetch([connection], [prediction_day])
+        return self.prediction_service.make_prediction_for_day(connection, prediction_day)
+
+    async def make_predictions_for_fleet(
+        self, connections: Sequence[GridConnection], days: Sequence[date]
+    ) -> DataFrame:
+        """
+        See PredictionService.make_predictions_for_fleet
+        """
+        await self.prefetch(connections, days)
+        return self.prediction_service.make_predictions_for_fleet(connections, days)
+
+    async def make_prediction_for_range(
+        self,
+        connections: Union[GridConnection, Sequence[GridConnection]],
+        start_day: date,
+        n_days: int,
+    ) -> Union[Series, DataFrame]:
+        """
+        See PredictionService.make_prediction_for_range
+        """
+        if n_days >= 1:
+            await self.prefetch(
+                [connections] if isinstance(connections, GridConnection) else connections,
+                days_between(start_day, start_day + timedelta(days=n_days - 1)),
+            )
+        return self.prediction_service.make_prediction_for_range(connections, start_day, n_days)
+
+    async def prefetch(self, connections: Sequence[GridConnection], days: Sequence[date]):
+        """
+        Concurrently requests everything predictions of the connections on
+        the days need, warming up the caching services.
+
+        History is fetched in the same two stages as
+        PredictionService.fetch_weekday_history: the first choice days of
+        all connections (together with the solar forecasts), then the rest
+        of the days in reach for connections whose first choice days had
+        holidays, gaps or zero runs to skip.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        hosts = HostConnectionLimits(self.max_connections_per_host)
+
+        async def fetch(host: Hashable, call: Callable[..., Awaitable[Any]], *args: Any):
+            async with semaphore, hosts.connection(host):
+                return await call_with_retry(self.retry_policy, call, *args)
+
+        def history_fetches(
+            group: Sequence[GridConnection], history_days: Sequence[date]
+        ) -> List[Awaitable[DataFrame]]:
+            windows = [get_prediction_range(day) for day in history_days]
+            return [
+                fetch(
+                    self.historic_consumption_service,
+                    self.historic_consumption_service.aget_consumption_many,
+                    group[i : i + self.batch_size],
+                    windows,
+                    self.batch_size,
+                )
+                for i in range(0, len(group), self.batch_size)
+            ]
+
+        groups = group_by_prediction_type(connections)
+        with_history = list(groups[PredictionType.regular]) + list(
+            groups[PredictionType.mixed_solar_regular]
+        )
+        first_choice = self.prediction_service.history_days(days)
+        # further back for connections short of good days, also covered by
+        # the backcast
+        reach_days = self.prediction_service.reach_days(days)
+
+        first_fetches = history_fetches(with_history, first_choice) if first_choice else []
+        solar_fetches = [
+            fetch(self.solar_forecast_service, self.solar_forecast_service.apredict, *args)
+            for args in self.solar_requests(groups, days, reach_days).values()
+        ]
+        fetched = await asyncio.gather(*first_fetches, *solar_fetches)
+        if not first_fetches:
+            return
+
+        hourly = np.full((len(with_history), len(reach_days), slots_per_day), np.nan)
+        hourly[:, Index(reach_days).get_indexer(first_choice)] = align_local_hours(
+            concat(fetched[: len(first_fetches)], ignore_index=True),
+            ean_codes_of(with_history),
+            first_choice,
+        )
+        hourly[~activity_matrix(with_history, reach_days)] = np.nan
+        rows, rest = self.prediction_service.rest_of_history(
+            with_history, days, reach_days, hourly
+        )
+        if len(rows):
+            await asyncio.gather(*history_fetches([with_history[row] for row in rows], rest))
+
+    def solar_requests(
+        self,
+        groups: Dict[PredictionType, List[GridConnection]],
+        days: Sequence[date],
+        history_days: Sequence[date],
+    ) -> Dict[Tuple[Hashable, ...], Tuple[Any, ...]]:
+        """
+        Returns:
+            arguments of SolarForecastService.predict calls the prediction
+            will make, deduplicated by cached profile
+        """
+        requests = {}
+        with_solar = list(groups[PredictionType.solar]) + list(
+            groups[PredictionType.mixed_solar_regular]
+        )
+        for connection in with_solar:
+            active_days = [day for day in days if connection.is_active_on(day)]
+            # the same runs of days as PredictionService.solar_fleet_production
+            for first_day, last_day in consecutive_runs(active_days):
+                add_solar_request(
+                    requests,
+                    self.solar_forecast_service,
+                    connection,
+                    get_prediction_range(first_day)[0],
+                    get_prediction_range(last_day)[1],
+                )
+
+        if history_days:
+            first_day, last_day = self.prediction_service.solar_backcast.window_for(history_days)
+            for connection in groups[PredictionType.mixed_solar_regular]:
+                add_solar_request(
+                    requests,
+                    self.solar_forecast_service,
+                    connection,
+                    get_prediction_range(first_day)[0],
+                    get_prediction_range(last_day)[1],
+                )
+
+        return requests
+
+
+def add_solar_request(
+    requests: Dict[Tuple[Hashable, ...], Tuple[Any, ...]],
+    service: CachedSolarForecastService,
+    connection: GridConnection,
+    time_start: datetime,
+    time_end: datetime,
+):
+    """
+    Adds arguments of a SolarForecastService.predict call for the connection,
+    unless a request for the same cached profile is there already.
+    """
+    args = (
+        time_start,
+        time_end,
+        connection.latitude,
+        connection.longitude,
+        connection.solar_plane_declination,
+        connection.solar_plane_azimuth,
+        connection.solar_rated_power,
+    )
+    requests.setdefault(service.profile_key(*args[:-1]), args)
@@ -0,0 +1,219 @@
+"""
+Backtesting: replays day-ahead predictions over a historic period and
+compares them with the consumption actually measured.
+
+Each delivery day gets predicted as it would have been ordered the day
+before (see order_lead_days), averaging only same weekdays before that
+order day (picked by the weekday selector of the prediction service, see
+history_selection). History of a chunk of connections is fetched once for
+the whole period (plus the weeks the first days may look back on) and
+shared by all the overlapping weekday windows; averaging is done for all
+connections and days at once (see weekday_profile).
+
+Solar production of the delivery days is not replayed as it was forecast
+on the order day: the solar forecast service gets asked about days already
+past, which makes it a backcast from hindsight weather. Errors of solar and
+mixed connections are therefore optimistic and labelled as such in the
+report summary (see solar_predictions).
+"""
+
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+from pandas import DataFrame, Index
+
+from .connection_registry import activity_matrix, ean_codes_of
+from .grid_connection import GridConnection, PredictionType
+from .prediction import PredictionService, fleet_hours, group_by_prediction_type
+from .runner import chunked, default_chunk_size
+from .utils.datetime import get_prediction_hours, local_hour_slots
+
+# Orders for a delivery day are placed the day before.
+order_lead_days = 1
+# How solar production of each prediction type is predicted in a backtest
+# (see module docs), "none" for types without solar.
+solar_predictions = {
+    PredictionType.solar: "backcast",
+    PredictionType.mixed_solar_regular: "backcast",
+}
+
+
+class BacktestErrors:
+    """
+    Running sums of hourly prediction errors (predicted - actual kWh) of
+    one prediction type, accumulated over chunks of connections.
+    """
+
+    def __init__(self):
+        self.connections = 0
+        self.hours = 0
+        self.absolute_error = 0.0
+        self.error = 0.0
+        self.actual = 0.0
+
+    def add(self, predicted: np.ndarray, actual: np.ndarray):
+        """
+        Args:
+            predicted: (connections, hours) kWh, NaN where not predicted
+            actual: (connections, hours) kWh, NaN where not measured
+        """
+        compared = ~np.isnan(predicted) & ~np.isnan(actual)
+        errors = np.where(compared, predicted - actual, 0.0)
+
+        self.connections += int(compared.any(axis=1).sum())
+        self.hours += int(compared.sum())
+        self.absolute_error += float(np.abs(errors).sum())
+        self.error += float(errors.sum())
+        self.actual += float(np.where(compared, np.abs(actual), 0.0).sum())
+
+    @property
+    def mae(self) -> float:
+        return self.absolute_error / self.hours if self.hours else np.nan
+
+    @property
+    def bias(self) -> float:
+        return self.error / self.hours if self.hours else np.nan
+
+
+class BacktestReport:
+    """
+    Errors per prediction type of the delivery days [first_day; last_day].
+    """
+
+    def __init__(self, first_day: date, last_day: date):
+        self.first_day = first_day
+        self.last_day = last_day
+        self.errors: Dict[PredictionType, BacktestErrors] = {}
+
+    def errors_of(self, prediction_type: PredictionType) -> BacktestErrors:
+        return self.errors.setdefault(prediction_type, BacktestErrors())
+
+    def summary(self) -> DataFrame:
+        """
+        Returns:
+            per prediction type: number of connections and hours compared,
+            MAE and bias (mean error, positive for over-ordering) in kWh
+            per hour, MAE relative to the mean absolute actual kWh and how
+            solar production was predicted (see solar_predictions)
+        """
+        return DataFrame(
+            [
+                {
+                    "prediction_type": prediction_type.name,
+                    "connections": errors.connections,
+                    "hours": errors.hours,
+                    "mae": errors.mae,
+                    "bias": errors.bias,
+                    "relative_mae": (
+                        errors.absolute_error / errors.actual if errors.actual else np.nan
+                    ),
+                    "solar": solar_predictions.get(prediction_type, "none"),
+                }
+                for prediction_type, errors in sorted(
+                    self.errors.items(), key=lambda item: item[0].value
+                )
+            ],
+            columns=[
+                "prediction_type",
+                "connections",
+                "hours",
+                "mae",
+                "bias",
+                "relative_mae",
+                "solar",
+            ],
+        ).set_index("prediction_type")
+
+
+def backtest(
+    prediction_service: PredictionService,
+    connections: Iterable[GridConnection],
+    first_day: date,
+    last_day: date,
+    chunk_size: int = default_chunk_size,
+) -> BacktestReport:
+    """
+    Args:
+        prediction_service: its services get asked about the past - e.g.
+            with a StoredHistoricConsumptionService for repeated runs
+        connections: lazily consumed, in chunks of chunk_size
+        first_day: first delivery day to replay
+        last_day: last delivery day to replay (inclusive)
+    Returns:
+        errors of the predictions per prediction type
+    """
+    if last_day < first_day:
+        raise ValueError(f"Backtest period is empty: {first_day} - {last_day}")
+
+    report = BacktestReport(first_day, last_day)
+    days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+    history_days = backtest_history_days(days, prediction_service.weekday_selector.max_weeks_back)
+
+    for chunk in chunked(connections, chunk_size):
+        backtest_chunk(prediction_service, chunk, days, history_days, report)
+
+    return report
+
+
+def backtest_chunk(
+    prediction_service: PredictionService,
+    connections: Sequence[GridConnection],
+    days: Sequence[date],
+    history_days: Sequence[date],
+    report: BacktestReport,
+):
+    """
+    Predicts all the days for a chunk of connections from one shared fetch
+    of their history and adds the errors to the report.
+    """
+    with prediction_service.metrics.stage("historic_fetch"):
+        hourly = prediction_service.historic_consumption_service.get_hourly_consumption(
+            connections, history_days
+        )
+    # No historical data is assumed for days the connection was not active on
+    hourly[~activity_matrix(connections, history_days)] = np.nan
+
+    rows = Index(ean_codes_of(connections))
+    day_positions = Index(history_days).get_indexer(days)
+    order_days = [day - timedelta(days=order_lead_days) for day in days]
+
+    for prediction_type, group in group_by_prediction_type(connections).items():
+        group_rows = rows.get_indexer(ean_codes_of(group))
+        group_hourly = hourly[group_rows]
+        predicted = prediction_service.predict_group(
+            prediction_type, group, days, (history_days, group_hourly), anchors=order_days
+        )
+        actual = hours_of_days(group_hourly[:, day_positions], days)
+        report.errors_of(prediction_type).add(predicted.to_numpy(), actual)
+
+
+def backtest_history_days(days: Sequence[date], weeks_back: int) -> List[date]:
+    """
+    Args:
+        days: delivery days
+        weeks_back: how many weeks before its order day a delivery day may
+            look back on (see WeekdaySelector.max_weeks_back)
+    Returns:
+        consecutive days from the first weekday looked back on up to the
+        last delivery day (whose actuals get compared)
+    """
+    first_day = min(days) - timedelta(days=order_lead_days, weeks=weeks_back)
+    last_day = max(days)
+    return [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+
+
+def hours_of_days(hourly: np.ndarray, days: Sequence[date]) -> np.ndarray:
+    """
+    Args:
+        hourly: (connections, days, slots_per_day) kWh
+        days:
+    Returns:
+        (connections, hours) kWh on the UTC hours of the days (see fleet_hours)
+    """
+    hours = fleet_hours(days)
+    values = np.full((hourly.shape[0], len(hours)), np.nan)
+    for position, day in enumerate(days):
+        day_hours = get_prediction_hours(day)
+        values[:, hours.get_indexer(day_hours)] = hourly[:, position, local_hour_slots(day_hours)]
+    return values
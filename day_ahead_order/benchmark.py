@@ -0,0 +1,466 @@
+"""
+Benchmarks of the prediction hot paths on synthetic fleets.
+
+Every scenario runs in a fresh worker process (so that peak RSS and caches
+of one scenario do not leak into another) against stub services with
+injected latency (see fakes), and reports wall time, peak RSS and the
+number of requests made to the stub services. Results can be stored as a
+baseline and later runs compared against it:
+
+    python -m day_ahead_order.benchmark --save-baseline baseline.json
+    python -m day_ahead_order.benchmark --baseline baseline.json
+
+The startup scenario measures imports of the command line interface
+(python -X importtime -m day_ahead_order --help) and fails the run when
+they exceed the startup budget or pull in heavy modules.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pandas import DataFrame
+
+from .async_prediction import AsyncPredictionService
+from .connection_registry import ConnectionRegistry
+from .consumption_cache import CachingHistoricConsumptionService
+from .consumption_coalescing import CoalescingHistoricConsumptionService
+from .fakes import LatencyHistoricConsumptionService, LatencySolarForecastService
+from .grid_connection import GridConnection, PredictionType
+from .prediction import PredictionService
+from .runner import predict_fleet
+from .server import PredictionBatcher
+from .solar_forecast_cache import CachedSolarForecastService
+from .solar_forecast_coalescing import CoalescingSolarForecastService
+from .utils.datetime import get_prediction_hours
+
+# Share of each prediction type in synthetic fleets.
+fleet_composition = {
+    PredictionType.regular: 0.8,
+    PredictionType.solar: 0.1,
+    PredictionType.mixed_solar_regular: 0.1,
+}
+# Number of distinct solar sites (location and plane) in synthetic fleets.
+solar_sites = 50
+# Wall time above baseline * tolerance counts as a regression.
+default_tolerance = 1.2
+# Seconds importing the command line interface may take.
+default_startup_budget = 0.3
+# Modules the command line interface should not import before running a command.
+heavy_modules = ("numpy", "pandas")
+
+# (run, historic consumption stub, solar forecast stub) of a scenario
+PreparedScenario = Tuple[
+    Callable[[], object], LatencyHistoricConsumptionService, LatencySolarForecastService
+]
+
+
+def synthetic_fleet(size: int, seed: int = 0) -> List[GridConnection]:
+    """
+    Returns:
+        connections of all prediction types (see fleet_composition), with
+        solar connections spread over solar_sites sites
+    """
+    random = np.random.default_rng(seed)
+    types = random.choice(
+        list(fleet_composition), size=size, p=list(fleet_composition.values())
+    )
+    sites = random.integers(0, solar_sites, size=size)
+    site_latitudes = random.uniform(50.8, 53.5, size=solar_sites)
+    site_longitudes = random.uniform(3.4, 7.2, size=solar_sites)
+    site_declinations = random.uniform(10, 40, size=solar_sites)
+    site_azimuths = random.uniform(-90, 90, size=solar_sites)
+
+    connections = []
+    for i in range(size):
+        prediction_type, site = types[i], sites[i]
+        solar = prediction_type != PredictionType.regular
+        connections.append(
+            GridConnection(
+                f"synthetic connection {i}",
+                f"87{i:016d}",
+                date(2020, 1, 1),
+                None,
+                prediction_type,
+                float(random.uniform(1_000, 100_000)),
+                float(site_latitudes[site]) if solar else None,
+                float(site_longitudes[site]) if solar else None,
+                float(site_declinations[site]) if solar else None,
+                float(site_azimuths[site]) if solar else None,
+                float(random.uniform(5, 500)) if solar else None,
+            )
+        )
+    return connections
+
+
+def next_day_with_hours(hours: int) -> date:
+    """
+    Returns:
+        first day after today with the number of hours (23 or 25 on daylight
+        saving time transitions)
+    """
+    day = date.today() + timedelta(days=1)
+    while len(get_prediction_hours(day)) != hours:
+        day += timedelta(days=1)
+    return day
+
+
+def stub_services(latency: float) -> Tuple[LatencyHistoricConsumptionService, LatencySolarForecastService]:
+    return LatencyHistoricConsumptionService(latency), LatencySolarForecastService(latency)
+
+
+def single_prediction(prediction_type: PredictionType) -> Callable[[float], PreparedScenario]:
+    def prepare(latency: float) -> PreparedScenario:
+        historic, solar = stub_services(latency)
+        service = PredictionService(solar, historic)
+        connection = next(
+            c for c in synthetic_fleet(100) if c.prediction_type == prediction_type
+        )
+        day = date.today() + timedelta(days=1)
+        return lambda: service.make_prediction_for_day(connection, day), historic, solar
+
+    return prepare
+
+
+def fleet_prediction(size: int, day: Optional[Callable[[], date]] = None):
+    """
+    Fleet predictions with caching services (as run in production, see
+    runner.default_prediction_service), starting with empty caches.
+    """
+
+    def prepare(latency: float) -> PreparedScenario:
+        historic, solar = stub_services(latency)
+        service = PredictionService(
+            CachedSolarForecastService(solar), CachingHistoricConsumptionService(historic)
+        )
+        connections = synthetic_fleet(size)
+        days = [day() if day else date.today() + timedelta(days=1)]
+        return lambda: predict_fleet(connections, days, service_factory=lambda: service), historic, solar
+
+    return prepare
+
+
+def horizon_prediction(size: int, n_days: int):
+    """
+    Fleet predictions over a horizon of consecutive days from tomorrow on
+    (see PredictionService.make_prediction_for_range).
+    """
+
+    def prepare(latency: float) -> PreparedScenario:
+        historic, solar = stub_services(latency)
+        service = PredictionService(
+            CachedSolarForecastService(solar), CachingHistoricConsumptionService(historic)
+        )
+        connections = synthetic_fleet(size)
+        start_day = date.today() + timedelta(days=1)
+        return lambda: service.make_prediction_for_range(connections, start_day, n_days), historic, solar
+
+    return prepare
+
+
+def async_fleet_prediction(size: int):
+    """
+    Fleet predictions by AsyncPredictionService, fetching all inputs
+    concurrently before predicting (see async_prediction).
+    """
+
+    def prepare(latency: float) -> PreparedScenario:
+        historic, solar = stub_services(latency)
+        service = AsyncPredictionService(solar, historic)
+        connections = synthetic_fleet(size)
+        days = [date.today() + timedelta(days=1)]
+        return (
+            lambda: asyncio.run(service.make_predictions_for_fleet(connections, days)),
+            historic,
+            solar,
+        )
+
+    return prepare
+
+
+def cached_fleet_prediction(size: int, warm: bool):
+    """
+    Fleet predictions with the on-disk consumption cache, either empty
+    (cold) or filled by an earlier run over the same history (warm).
+    """
+
+    def prepare(latency: float) -> PreparedScenario:
+        historic, solar = stub_services(latency)
+        cache_dir = tempfile.mkdtemp(prefix="day-ahead-order-benchmark-")
+        connections = synthetic_fleet(size)
+        days = [date.today() + timedelta(days=1)]
+
+        def new_service() -> PredictionService:
+            return PredictionService(
+                CachedSolarForecastService(solar),
+                CachingHistoricConsumptionService(historic, cache_dir=cache_dir),
+            )
+
+        if warm:
+            new_service().make_predictions_for_fleet(connections, days)
+            historic.calls = solar.calls = 0
+
+        service = new_service()
+        return lambda: service.make_predictions_for_fleet(connections, days), historic, solar
+
+    return prepare
+
+
+def concurrent_jobs(size: int, jobs: int):
+    """
+    Fleet predictions of the same connections by several jobs at once
+    (threads sharing one PredictionService), with caching services on top
+    of coalescing ones (as in runner.default_prediction_service).
+    """
+
+    def prepare(latency: float) -> PreparedScenario:
+        historic, solar = stub_services(latency)
+        service = PredictionService(
+            CachedSolarForecastService(CoalescingSolarForecastService(solar)),
+            CachingHistoricConsumptionService(CoalescingHistoricConsumptionService(historic)),
+        )
+        connections = synthetic_fleet(size)
+        days = [date.today() + timedelta(days=1)]
+
+        def run():
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                for future in [
+                    executor.submit(service.make_predictions_for_fleet, connections, days)
+                    for _ in range(jobs)
+                ]:
+                    future.result()
+
+        return run, historic, solar
+
+    return prepare
+
+
+def served_requests(size: int, requests: int, clients: int):
+    """
+    Single-connection requests of concurrent clients to a warmed up
+    prediction server (see server.PredictionBatcher, without sockets).
+    Reports the median and 99th percentile latency of the requests.
+    """
+
+    def prepare(latency: float) -> PreparedScenario:
+        historic, solar = stub_services(latency)
+        service = PredictionService(
+            CachedSolarForecastService(solar), CachingHistoricConsumptionService(historic)
+        )
+        registry = ConnectionRegistry.from_connections(synthetic_fleet(size))
+        start_day = date.today() + timedelta(days=1)
+        batcher = PredictionBatcher(service, registry)
+        batcher.predict(np.arange(size), start_day, 2)
+        historic.calls = solar.calls = 0
+
+        def request(position: int) -> float:
+            started = time.perf_counter()
+            batcher.predict(np.array([position]), start_day, 2)
+            return time.perf_counter() - started
+
+        def run():
+            positions = np.random.default_rng(0).integers(0, size, requests)
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                latencies = list(executor.map(request, positions))
+            batcher.close()
+            return {
+                "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+                "p99_ms": 1000 * float(np.percentile(latencies, 99)),
+            }
+
+        return run, historic, solar
+
+    return prepare
+
+
+def startup(latency: float) -> PreparedScenario:
+    historic, solar = stub_services(latency)
+    return measure_startup, historic, solar
+
+
+def measure_startup() -> Dict[str, float]:
+    """
+    Returns:
+        seconds spent importing modules by `python -m day_ahead_order --help`
+        and number of heavy_modules among them
+    """
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "day_ahead_order", "--help"],
+        cwd=package_parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    total_us = 0
+    imported = set()
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imported.add(name.strip())
+        # nested imports are already part of the cumulative time of the
+        # top level one (indented by two spaces per level)
+        if not name[1:].startswith(" "):
+            total_us += int(cumulative)
+
+    return {
+        "import_seconds": total_us / 1_000_000,
+        "heavy_imports": sum(module in imported for module in heavy_modules),
+    }
+
+
+scenarios: Dict[str, Callable[[float], PreparedScenario]] = {
+    "startup": startup,
+    "single-regular": single_prediction(PredictionType.regular),
+    "single-solar": single_prediction(PredictionType.solar),
+    "single-mixed": single_prediction(PredictionType.mixed_solar_regular),
+    "fleet-1k": fleet_prediction(1_000),
+    "fleet-10k": fleet_prediction(10_000),
+    "fleet-100k": fleet_prediction(100_000),
+    "dst-spring-1k": fleet_prediction(1_000, lambda: next_day_with_hours(23)),
+    "dst-autumn-1k": fleet_prediction(1_000, lambda: next_day_with_hours(25)),
+    "horizon-7d-1k": horizon_prediction(1_000, 7),
+    "horizon-14d-1k": horizon_prediction(1_000, 14),
+    "async-fleet-1k": async_fleet_prediction(1_000),
+    "async-fleet-10k": async_fleet_prediction(10_000),
+    "cache-cold-10k": cached_fleet_prediction(10_000, warm=False),
+    "cache-warm-10k": cached_fleet_prediction(10_000, warm=True),
+    "concurrent-jobs-1k": concurrent_jobs(1_000, jobs=4),
+    "served-requests-10k": served_requests(10_000, requests=1_000, clients=16),
+}
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def run_scenario(name: str, latency: float) -> Dict[str, float]:
+    """
+    Runs a scenario (in the calling process).
+
+    Returns:
+        wall time (seconds), peak RSS (MB) of the process and requests
+        made to the stub services
+    """
+    run, historic, solar = scenarios[name](latency)
+    started = time.perf_counter()
+    outcome = run()
+    seconds = time.perf_counter() - started
+    return {
+        "seconds": seconds,
+        "peak_rss_mb": peak_rss_mb(),
+        "historic_calls": historic.calls,
+        "solar_calls": solar.calls,
+        # scenarios may report measurements of their own
+        **(outcome if isinstance(outcome, dict) else {}),
+    }
+
+
+def run_benchmarks(names: Sequence[str], latency: float = 0.0, repeat: int = 1) -> DataFrame:
+    """
+    Runs each scenario `repeat` times, each time in a fresh process.
+
+    Returns:
+        results indexed by scenario, with the fastest of the repeats
+    """
+    results = {}
+    for name in names:
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                runs.append(executor.submit(run_scenario, name, latency).result())
+        results[name] = min(runs, key=lambda result: result["seconds"])
+        print(f"{name}: {results[name]['seconds']:.3f}s", file=sys.stderr)
+
+    return DataFrame.from_dict(results, orient="index")
+
+
+def compare(results: DataFrame, baseline: DataFrame, tolerance: float = default_tolerance) -> DataFrame:
+    """
+    Returns:
+        results with baseline wall time, ratio to it and whether the
+        scenario counts as a regression
+    """
+    compared = results.copy()
+    compared["baseline_seconds"] = baseline["seconds"].reindex(results.index)
+    compared["ratio"] = compared["seconds"] / compared["baseline_seconds"]
+    compared["regression"] = compared["ratio"] > tolerance
+    return compared
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark day-ahead order predictions")
+    parser.add_argument(
+        "scenarios",
+        nargs="*",
+        help=f"scenarios to run (all if none given): {', '.join(scenarios)}",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds each stub service request takes"
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="runs per scenario (fastest counts)")
+    parser.add_argument("--save-baseline", metavar="PATH", help="store results as baseline (JSON)")
+    parser.add_argument("--baseline", metavar="PATH", help="compare results with a stored baseline")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=default_tolerance,
+        help="wall time ratio to the baseline counting as a regression",
+    )
+    parser.add_argument(
+        "--startup-budget",
+        type=float,
+        default=default_startup_budget,
+        help="seconds importing the command line interface may take",
+    )
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in scenarios]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    results = run_benchmarks(args.scenarios or list(scenarios), args.latency, args.repeat)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(results.to_dict(orient="index"), file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = DataFrame.from_dict(json.load(file), orient="index")
+        results = compare(results, baseline, args.tolerance)
+
+    print(results.to_string(float_format="{:.3f}".format))
+
+    failed = args.baseline and results["regression"].any()
+    if "startup" in results.index:
+        startup_result = results.loc["startup"]
+        if startup_result["import_seconds"] > args.startup_budget:
+            print(
+                f"startup: imports took {startup_result['import_seconds']:.3f}s, "
+                f"over the budget of {args.startup_budget:.3f}s",
+                file=sys.stderr,
+            )
+            failed = True
+        if startup_result["heavy_imports"] > 0:
+            print(f"startup: imports some of {', '.join(heavy_modules)}", file=sys.stderr)
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Streaming loader of the connection portfolio from CSV or JSONL exports.
+
+Rows are parsed lazily and handed out in chunks, so memory stays flat
+regardless of portfolio size and predictions of the first chunks can start
+before the whole file is read.
+
+Fields (CSV columns or JSON object keys) are named after GridConnection
+arguments. prediction_type is a PredictionType name (e.g. "regular");
+active_from and active_until are ISO dates (or datetimes), empty or
+missing for open-ended contracts. balancing_portfolio is optional.
+
+EAN codes have to be unique within a file: the only state kept across
+chunks are the EAN codes seen so far (with their line numbers), so that a
+duplicate gets rejected as soon as it is read.
+"""
+
+import csv
+import json
+import os
+from datetime import date, datetime
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .grid_connection import GridConnection, PredictionType
+
+default_chunk_size = 1000
+
+solar_fields = (
+    "latitude",
+    "longitude",
+    "solar_plane_declination",
+    "solar_plane_azimuth",
+    "solar_rated_power",
+)
+
+
+def load_connections(
+    path: str, chunk_size: int = default_chunk_size
+) -> Iterator[List[GridConnection]]:
+    """
+    Args:
+        path: .csv or .jsonl file
+        chunk_size: max number of connections per yielded chunk
+    Yields:
+        chunks of connections, in order of the file
+    Raises:
+        ValueError: for unsupported files, invalid rows or duplicate EAN
+            codes (with line number)
+    """
+    rows = read_rows(path)
+    # line each EAN code was first seen on
+    seen: Dict[str, int] = {}
+    while True:
+        chunk = []
+        for line, row in islice(rows, chunk_size):
+            connection = parse_connection(path, line, row)
+            first_line = seen.setdefault(connection.ean_code, line)
+            if first_line != line:
+                raise ValueError(
+                    f"{path}:{line}: duplicate ean_code {connection.ean_code}, "
+                    f"first on line {first_line}"
+                )
+            chunk.append(connection)
+        if not chunk:
+            return
+        yield chunk
+
+
+def read_rows(path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Yields:
+        (line number, raw fields) of each row
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline="", encoding="utf-8") as file:
+        if extension == ".csv":
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+        elif extension in (".jsonl", ".ndjson"):
+            for line, text in enumerate(file, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    yield line, json.loads(text)
+                except json.JSONDecodeError as error:
+                    raise ValueError(f"{path}:{line}: invalid JSON: {error}") from error
+        else:
+            raise ValueError(f"Unsupported connection file (expected .csv or .jsonl): {path}")
+
+
+def parse_connection(path: str, line: int, row: Any) -> GridConnection:
+    """
+    Raises:
+        ValueError: for an invalid row, prefixed with its location
+            (path:line)
+    """
+    try:
+        if not isinstance(row, dict):
+            raise ValueError(f"expected an object, got {type(row).__name__}")
+
+        prediction_type = parse_prediction_type(required(row, "prediction_type"))
+        solar = {field: optional_float(row.get(field)) for field in solar_fields}
+        if prediction_type != PredictionType.regular:
+            missing = [field for field, value in solar.items() if value is None]
+            if missing:
+                raise ValueError(
+                    f"{', '.join(missing)} required for {prediction_type.name} connections"
+                )
+
+        return GridConnection(
+            required(row, "name"),
+            required(row, "ean_code"),
+            optional_day(row.get("active_from")),
+            optional_day(row.get("active_until")),
+            prediction_type,
+            float(required(row, "standard_yearly_consumption")),
+            **solar,
+            balancing_portfolio=row.get("balancing_portfolio") or None,
+        )
+    except (ValueError, TypeError) as error:
+        raise ValueError(f"{path}:{line}: {error}") from error
+
+
+def parse_prediction_type(value: Any) -> PredictionType:
+    if isinstance(value, str) and value in PredictionType.__members__:
+        return PredictionType[value]
+    raise ValueError(
+        f"prediction_type should be one of "
+        f"{', '.join(t.name for t in PredictionType)}, got {value!r}"
+    )
+
+
+def required(row: Dict[str, Any], field: str) -> Any:
+    value = row.get(field)
+    if value is None or value == "":
+        raise ValueError(f"{field} is required")
+    return value
+
+
+def optional_float(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+def optional_day(value: Any) -> Optional[date]:
+    if value is None or value == "":
+        return None
+    if len(value) > len("YYYY-MM-DD"):
+        return datetime.fromisoformat(value)
+    return date.fromisoformat(value)
@@ -0,0 +1,241 @@
+"""
+Columnar registry of grid connections for portfolios of 100k+ EANs.
+
+Attributes of all connections are kept in NumPy arrays, so that questions
+like "which connections are active on day D" get answered for the whole
+portfolio at once. Code working with single connections gets lightweight
+GridConnection views.
+"""
+
+from collections.abc import Sequence as SequenceABC
+from datetime import date
+from typing import Dict, Iterable, Optional, Sequence, Union
+
+import numpy as np
+
+from .grid_connection import GridConnection, PredictionType
+from .utils.datetime import as_calendar_day
+
+prediction_types = {prediction_type.value: prediction_type for prediction_type in PredictionType}
+
+
+class ConnectionRegistry(SequenceABC):
+    """
+    Immutable, array-backed sequence of GridConnection (with unique EAN codes).
+    """
+
+    def __init__(
+        self,
+        names: np.ndarray,
+        ean_codes: np.ndarray,
+        active_from: np.ndarray,
+        active_until: np.ndarray,
+        prediction_types: np.ndarray,
+        standard_yearly_consumption: np.ndarray,
+        latitude: np.ndarray,
+        longitude: np.ndarray,
+        solar_plane_declination: np.ndarray,
+        solar_plane_azimuth: np.ndarray,
+        solar_rated_power: np.ndarray,
+        balancing_portfolios: np.ndarray,
+    ):
+        """
+        Args:
+            names: (object)
+            ean_codes: (object)
+            active_from: (datetime64[D], NaT if not known) calendar days
+            active_until: (datetime64[D], NaT if not known) calendar days
+            prediction_types: (int8) PredictionType values
+            standard_yearly_consumption: (float64)
+            latitude: (float64, NaN if not known)
+            longitude: (float64, NaN if not known)
+            solar_plane_declination: (float64, NaN if not known)
+            solar_plane_azimuth: (float64, NaN if not known)
+            solar_rated_power: (float64, NaN if not known)
+            balancing_portfolios: (object, None if not known)
+
+            see GridConnection
+        """
+        self.names = names
+        self.ean_codes = ean_codes
+        self.active_from = active_from
+        self.active_until = active_until
+        self.prediction_types = prediction_types
+        self.standard_yearly_consumption = standard_yearly_consumption
+        self.latitude = latitude
+        self.longitude = longitude
+        self.solar_plane_declination = solar_plane_declination
+        self.solar_plane_azimuth = solar_plane_azimuth
+        self.solar_rated_power = solar_rated_power
+        self.balancing_portfolios = balancing_portfolios
+
+        self.positions: Dict[str, int] = {ean: i for i, ean in enumerate(ean_codes)}
+        if len(self.positions) != len(ean_codes):
+            raise ValueError("EAN codes of connections in a registry should be unique")
+
+    @classmethod
+    def from_connections(cls, connections: Iterable[GridConnection]) -> "ConnectionRegistry":
+        connections = list(connections)
+        return cls(
+            names=np.array([c.name for c in connections], dtype=object),
+            ean_codes=np.array([c.ean_code for c in connections], dtype=object),
+            active_from=calendar_days([c.active_from for c in connections]),
+            active_until=calendar_days([c.active_until for c in connections]),
+            prediction_types=np.array(
+                [c.prediction_type.value for c in connections], dtype=np.int8
+            ),
+            standard_yearly_consumption=np.array(
+                [c.standard_yearly_consumption for c in connections], dtype=np.float64
+            ),
+            latitude=optional_floats([c.latitude for c in connections]),
+            longitude=optional_floats([c.longitude for c in connections]),
+            solar_plane_declination=optional_floats(
+                [c.solar_plane_declination for c in connections]
+            ),
+            solar_plane_azimuth=optional_floats([c.solar_plane_azimuth for c in connections]),
+            solar_rated_power=optional_floats([c.solar_rated_power for c in connections]),
+            balancing_portfolios=np.array(
+                [c.balancing_portfolio for c in connections], dtype=object
+            ),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ean_codes)
+
+    def __getitem__(self, position: Union[int, slice]):
+        if isinstance(position, slice):
+            return self.take(np.arange(len(self))[position])
+        return self.connection(position)
+
+    def __contains__(self, connection) -> bool:
+        return getattr(connection, "ean_code", None) in self.positions
+
+    def connection(self, position: int) -> GridConnection:
+        """
+        Returns:
+            GridConnection view of the connection at the position
+        """
+        return GridConnection(
+            self.names[position],
+            self.ean_codes[position],
+            optional_day(self.active_from[position]),
+            optional_day(self.active_until[position]),
+            prediction_types[int(self.prediction_types[position])],
+            float(self.standard_yearly_consumption[position]),
+            optional_float(self.latitude[position]),
+            optional_float(self.longitude[position]),
+            optional_float(self.solar_plane_declination[position]),
+            optional_float(self.solar_plane_azimuth[position]),
+            optional_float(self.solar_rated_power[position]),
+            self.balancing_portfolios[position],
+        )
+
+    def by_ean(self, ean_code: str) -> Optional[GridConnection]:
+        position = self.positions.get(ean_code)
+        return None if position is None else self.connection(position)
+
+    def take(self, positions: np.ndarray) -> "ConnectionRegistry":
+        """
+        Returns:
+            registry of the connections at the positions
+        """
+        return ConnectionRegistry(
+            self.names[positions],
+            self.ean_codes[positions],
+            self.active_from[positions],
+            self.active_until[positions],
+            self.prediction_types[positions],
+            self.standard_yearly_consumption[positions],
+            self.latitude[positions],
+            self.longitude[positions],
+            self.solar_plane_declination[positions],
+            self.solar_plane_azimuth[positions],
+            self.solar_rated_power[positions],
+            self.balancing_portfolios[positions],
+        )
+
+    def active_on(self, day: date) -> np.ndarray:
+        """
+        Returns:
+            boolean mask of connections active on the day (see GridConnection.is_active_on)
+        """
+        return self.activity_matrix([day])[:, 0]
+
+    def activity_matrix(self, days: Sequence[date]) -> np.ndarray:
+        """
+        Returns:
+            boolean (connections, days) - whether a connection is active on a day
+        """
+        return active_between(self.active_from, self.active_until, days)
+
+    def group_by_prediction_type(self) -> Dict[PredictionType, "ConnectionRegistry"]:
+        return {
+            prediction_types[int(value)]: self.take(np.flatnonzero(self.prediction_types == value))
+            for value in np.unique(self.prediction_types)
+        }
+
+
+def active_between(
+    active_from: np.ndarray, active_until: np.ndarray, days: Sequence[date]
+) -> np.ndarray:
+    """
+    Args:
+        active_from: (datetime64[D], NaT if open-ended)
+        active_until: (datetime64[D], NaT if open-ended)
+        days:
+    Returns:
+        boolean (connections, days) - whether a connection is active on a day
+    """
+    days = np.array(days, dtype="datetime64[D]")[np.newaxis, :]
+    active_from = active_from[:, np.newaxis]
+    active_until = active_until[:, np.newaxis]
+
+    # comparisons with NaT are always False
+    return ~(days < active_from) & ~(days > active_until)
+
+
+def activity_matrix(connections: Sequence[GridConnection], days: Sequence[date]) -> np.ndarray:
+    """
+    Returns:
+        boolean (connections, days) - whether a connection is active on a day
+    """
+    if isinstance(connections, ConnectionRegistry):
+        return connections.activity_matrix(days)
+
+    return active_between(
+        calendar_days([c.active_from for c in connections]),
+        calendar_days([c.active_until for c in connections]),
+        days,
+    )
+
+
+def calendar_days(moments: Sequence[Optional[date]]) -> np.ndarray:
+    return np.array(
+        [
+            np.datetime64("NaT") if moment is None else as_calendar_day(moment)
+            for moment in moments
+        ],
+        dtype="datetime64[D]",
+    )
+
+
+def optional_floats(values: Sequence[Optional[float]]) -> np.ndarray:
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+def optional_float(value: np.float64) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+def optional_day(value: np.datetime64) -> Optional[date]:
+    return None if np.isnat(value) else value.astype(date)
+
+
+def ean_codes_of(connections: Sequence[GridConnection]) -> np.ndarray:
+    """
+    Returns:
+        (object) EAN codes of the connections
+    """
+    if isinstance(connections, ConnectionRegistry):
+        return connections.ean_codes
+    return np.array([c.ean_code for c in connections], dtype=object)
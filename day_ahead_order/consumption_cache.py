@@ -0,0 +1,448 @@
+"""
+Caching layer around HistoricConsumptionService.
+
+Metering data of days which have already passed does not change (see
+HistoricConsumptionService), so it gets cached per (EAN, local calendar day):
+first in an in-process LRU, then optionally on disk in a SQLite database
+with size-based eviction.
+
+Metering data may arrive late though, so days within the settling period
+before today (as well as days from today onwards) are always fetched, and
+so are days the platform returned only some (or none) of the intervals of.
+"""
+
+import asyncio
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pandas import DataFrame, DatetimeIndex, Series, concat, factorize
+
+from .grid_connection import GridConnection
+from .historic_consumption_service import (
+    HistoricConsumptionService,
+    default_batch_size,
+    empty_consumption_frame,
+)
+from .utils.cache import CacheStats, LruCache
+from .utils.calendar_index import calendar_index
+from .utils.datetime import (
+    as_calendar_day,
+    default_timezone,
+    get_prediction_hours,
+    get_prediction_range,
+)
+
+# (interval starts as UTC datetime64[ns], kWh per interval) of one EAN on one day
+DayConsumption = Tuple[np.ndarray, np.ndarray]
+
+default_memory_entries = 100_000
+default_disk_bytes = 1024**3
+# Days before today metering data may still arrive for.
+default_settling_days = 2
+# Metering data comes in 15 minute intervals.
+intervals_per_hour = 4
+# Older SQLite builds allow at most 999 parameters per statement.
+max_query_parameters = 900
+
+
+class DiskDayStore:
+    """
+    SQLite-backed store of DayConsumption entries, evicting least recently
+    read entries once the stored arrays exceed max_bytes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = default_disk_bytes):
+        os.makedirs(directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        self.db = sqlite3.connect(
+            os.path.join(directory, "historic_consumption.sqlite"),
+            check_same_thread=False,
+        )
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS consumption (
+                ean TEXT NOT NULL,
+                day TEXT NOT NULL,
+                starts BLOB NOT NULL,
+                kwh BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (ean, day)
+            )
+            """
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS consumption_accessed ON consumption (accessed)"
+        )
+        self.db.commit()
+        (stored,) = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM consumption"
+        ).fetchone()
+        self.size = stored
+
+    def get(self, ean: str, day: date) -> Optional[DayConsumption]:
+        return self.get_many([(ean, day)]).get((ean, day))
+
+    def get_many(
+        self, keys: Sequence[Tuple[str, date]]
+    ) -> Dict[Tuple[str, date], DayConsumption]:
+        """
+        Returns:
+            stored entries of the (EAN, day) pairs, marked as read in one
+            transaction
+        """
+        eans_by_day: Dict[date, List[str]] = defaultdict(list)
+        for ean, day in keys:
+            eans_by_day[day].append(ean)
+
+        found: Dict[Tuple[str, date], DayConsumption] = {}
+        with self.lock:
+            for day, eans in eans_by_day.items():
+                for start in range(0, len(eans), max_query_parameters):
+                    batch = eans[start : start + max_query_parameters]
+                    rows = self.db.execute(
+                        "SELECT ean, starts, kwh FROM consumption "
+                        f"WHERE day = ? AND ean IN ({', '.join('?' * len(batch))})",
+                        (day.isoformat(), *batch),
+                    ).fetchall()
+                    for ean, starts, kwh in rows:
+                        found[(ean, day)] = (
+                            np.frombuffer(starts, dtype="datetime64[ns]"),
+                            np.frombuffer(kwh, dtype=np.float64),
+                        )
+
+            if found:
+                now = time.time()
+                self.db.executemany(
+                    "UPDATE consumption SET accessed = ? WHERE ean = ? AND day = ?",
+                    [(now, ean, day.isoformat()) for ean, day in found],
+                )
+                self.db.commit()
+
+        return found
+
+    def put_many(self, entries: Dict[Tuple[str, date], DayConsumption]):
+        now = time.time()
+        rows = [
+            (
+                ean,
+                day.isoformat(),
+                starts.tobytes(),
+                kwh.tobytes(),
+                starts.nbytes + kwh.nbytes,
+                now,
+            )
+            for (ean, day), (starts, kwh) in entries.items()
+        ]
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO consumption VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self.db.commit()
+            (self.size,) = self.db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM consumption"
+            ).fetchone()
+            self.evict()
+
+    def evict(self):
+        """
+        Drops least recently read entries until the store fits in max_bytes.
+        """
+        while self.size > self.max_bytes:
+            evicted = self.db.execute(
+                "SELECT rowid, size FROM consumption ORDER BY accessed LIMIT 1000"
+            ).fetchall()
+            if not evicted:
+                break
+            self.db.executemany(
+                "DELETE FROM consumption WHERE rowid = ?",
+                [(rowid,) for rowid, _ in evicted],
+            )
+            self.size -= sum(size for _, size in evicted)
+        self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class CacheLookup:
+    """
+    Outcome of looking up a bulk request in the cache: cached days and
+    requests to make for the rest.
+    """
+
+    def __init__(self):
+        self.cached_eans: List[str] = []
+        self.cached_days: List[DayConsumption] = []
+        # (connections, days to cache or None if not cacheable, windows)
+        self.requests: List[
+            Tuple[List[GridConnection], Optional[Tuple[date, ...]], List[Tuple[datetime, datetime]]]
+        ] = []
+
+
+class CachingHistoricConsumptionService(HistoricConsumptionService):
+    """
+    HistoricConsumptionService answering from cache where possible and
+    asking the wrapped service only about (EAN, day) pairs not seen before.
+    """
+
+    def __init__(
+        self,
+        service: HistoricConsumptionService,
+        max_memory_entries: int = default_memory_entries,
+        cache_dir: Optional[str] = None,
+        max_disk_bytes: int = default_disk_bytes,
+        settling_days: int = default_settling_days,
+    ):
+        """
+        Args:
+            service: service to fetch from on cache misses
+            max_memory_entries: (EAN, day) pairs to keep in process memory
+            cache_dir: directory for the on-disk store (not used if None)
+            max_disk_bytes: size of consumption data to keep on disk
+            settling_days: days before today which do not get cached, as
+                their metering data may still be incomplete
+        """
+        super().__init__()
+        self.service = service
+        self.settling_days = settling_days
+        self.memory = LruCache(max_memory_entries)
+        self.disk = DiskDayStore(cache_dir, max_disk_bytes) if cache_dir else None
+        self.stats = CacheStats()
+
+    def get_consumption(
+        self, connection: GridConnection, time_start: datetime, time_end: datetime
+    ) -> Series:
+        """
+        See HistoricConsumptionService.get_consumption. Only requests
+        covering exactly one local day get cached.
+        """
+        day = as_calendar_day(time_start)
+        if not self.is_cacheable(day, (time_start, time_end)):
+            return self.service.get_consumption(connection, time_start, time_end)
+
+        consumption = self.get_consumption_many([connection], [(time_start, time_end)])
+        return Series(
+            index=DatetimeIndex(consumption["interval_start"]).tz_convert(
+                time_start.tzinfo
+            ),
+            data=consumption["kwh"].to_numpy(),
+        )
+
+    def get_consumption_many(
+        self,
+        connections: Sequence[GridConnection],
+        windows: Sequence[Tuple[datetime, datetime]],
+        batch_size: int = default_batch_size,
+    ) -> DataFrame:
+        """
+        See HistoricConsumptionService.get_consumption_many.
+
+        Connections missing the same set of days get fetched together, so
+        a cold cache still results in one bulk request.
+        """
+        lookup = self.lookup_many(connections, windows)
+        fetched = [
+            self.service.get_consumption_many(group, request_windows, batch_size)
+            for group, _, request_windows in lookup.requests
+        ]
+        return self.complete(lookup, fetched)
+
+    async def aget_consumption_many(
+        self,
+        connections: Sequence[GridConnection],
+        windows: Sequence[Tuple[datetime, datetime]],
+        batch_size: int = default_batch_size,
+    ) -> DataFrame:
+        """
+        Async variant of get_consumption_many, awaiting all requests for
+        cache misses concurrently.
+        """
+        lookup = self.lookup_many(connections, windows)
+        fetched = await asyncio.gather(
+            *(
+                self.service.aget_consumption_many(group, request_windows, batch_size)
+                for group, _, request_windows in lookup.requests
+            )
+        )
+        return self.complete(lookup, fetched)
+
+    def lookup_many(
+        self,
+        connections: Sequence[GridConnection],
+        windows: Sequence[Tuple[datetime, datetime]],
+    ) -> "CacheLookup":
+        # full days get looked up, any other window goes to the service as it is
+        day_windows: Dict[date, Tuple[datetime, datetime]] = {}
+        uncacheable = []
+        for window in windows:
+            day = as_calendar_day(window[0])
+            if self.is_cacheable(day, window):
+                day_windows[day] = window
+            else:
+                uncacheable.append(window)
+        cacheable = list(day_windows)
+
+        lookup = CacheLookup()
+        missing_by_days: Dict[Tuple[date, ...], List[GridConnection]] = defaultdict(list)
+
+        cached = self.lookup(
+            [(connection.ean_code, day) for connection in connections for day in cacheable]
+        )
+        for connection in connections:
+            missing_days = []
+            for day in cacheable:
+                entry = cached.get((connection.ean_code, day))
+                if entry is None:
+                    missing_days.append(day)
+                else:
+                    lookup.cached_eans.append(connection.ean_code)
+                    lookup.cached_days.append(entry)
+            if missing_days:
+                missing_by_days[tuple(missing_days)].append(connection)
+
+        for missing_days, group in missing_by_days.items():
+            lookup.requests.append(
+                (group, missing_days, [day_windows[day] for day in missing_days])
+            )
+        if uncacheable:
+            lookup.requests.append((list(connections), None, uncacheable))
+
+        return lookup
+
+    def complete(self, lookup: "CacheLookup", fetched: Sequence[DataFrame]) -> DataFrame:
+        """
+        Stores fetched responses to the lookup requests and combines them
+        with cached days.
+        """
+        frames = (
+            [consumption_frame(lookup.cached_eans, lookup.cached_days)]
+            if lookup.cached_days
+            else []
+        )
+        for (group, days, _), consumption in zip(lookup.requests, fetched):
+            if days is not None:
+                self.store(consumption, group, days)
+            frames.append(consumption)
+
+        if not frames:
+            return empty_consumption_frame()
+        return concat(frames, ignore_index=True)
+
+    # noinspection PyMethodMayBeStatic
+    def is_cacheable(self, day: date, window: Tuple[datetime, datetime]) -> bool:
+        """
+        Returns:
+            whether the window is a full local day which has passed longer
+            than settling_days ago
+        """
+        settled = date.today() - timedelta(days=self.settling_days)
+        return day < settled and tuple(window) == get_prediction_range(day)
+
+    def lookup(
+        self, keys: Sequence[Tuple[str, date]]
+    ) -> Dict[Tuple[str, date], DayConsumption]:
+        """
+        Returns:
+            cached entries of the (EAN, day) pairs, from memory or else
+            from disk (read in one go)
+        """
+        found: Dict[Tuple[str, date], DayConsumption] = {}
+        not_in_memory = []
+        for key in keys:
+            entry = self.memory.get(key)
+            if entry is None:
+                not_in_memory.append(key)
+            else:
+                found[key] = entry
+        memory_hits = len(found)
+
+        stored = {}
+        if self.disk is not None and not_in_memory:
+            stored = self.disk.get_many(not_in_memory)
+            for key, entry in stored.items():
+                self.memory.put(key, entry)
+            found.update(stored)
+
+        self.stats.add(memory_hits, len(stored), len(keys) - len(found))
+        return found
+
+    def store(
+        self,
+        consumption: DataFrame,
+        connections: Sequence[GridConnection],
+        days: Sequence[date],
+    ):
+        """
+        Caches fetched consumption per (EAN, day), only for days the
+        platform returned all intervals of (see expected_intervals).
+        """
+        requested = {(connection.ean_code, day) for connection in connections for day in days}
+        expected = {day: expected_intervals(day) for day in days}
+        entries: Dict[Tuple[str, date], DayConsumption] = {}
+
+        starts = utc_datetime64(consumption["interval_start"])
+        interval_codes, interval_starts = factorize(consumption["interval_start"])
+        local_days = DatetimeIndex(interval_starts).tz_convert(default_timezone).date
+        kwh = consumption["kwh"].to_numpy(dtype=np.float64)
+
+        groups = consumption.groupby(
+            [consumption["ean"].to_numpy(), local_days[interval_codes]]
+        ).indices
+        for key, positions in groups.items():
+            if key in requested and len(positions) == expected[key[1]]:
+                entries[key] = (starts[positions], kwh[positions])
+
+        for key, entry in entries.items():
+            self.memory.put(key, entry)
+        if self.disk is not None and entries:
+            self.disk.put_many(entries)
+
+
+def expected_intervals(day: date) -> int:
+    """
+    Returns:
+        number of metering intervals of a local day (fewer or more on days
+        of daylight saving time transitions)
+    """
+    index = calendar_index()
+    hours = len(index.hours_of(day)) if index.covers(day) else len(get_prediction_hours(day))
+    return hours * intervals_per_hour
+
+
+def utc_datetime64(moments: Series) -> np.ndarray:
+    """
+    Returns:
+        timezone-aware moments as naive UTC datetime64[ns] array
+    """
+    return np.asarray(
+        DatetimeIndex(moments).tz_convert("UTC").tz_localize(None),
+        dtype="datetime64[ns]",
+    )
+
+
+def consumption_frame(
+    ean_codes: Sequence[str], days: Sequence[DayConsumption]
+) -> DataFrame:
+    """
+    Returns:
+        long-format consumption frame (see get_consumption_many) of
+        (non-empty list of) cached days
+    """
+    return DataFrame(
+        {
+            "ean": np.repeat(ean_codes, [len(kwh) for _, kwh in days]),
+            "interval_start": DatetimeIndex(
+                np.concatenate([starts for starts, _ in days])
+            ).tz_localize("UTC"),
+            "kwh": np.concatenate([kwh for _, kwh in days]),
+        }
+    )
@@ -0,0 +1,351 @@
+"""
+Coalescing of concurrent requests to HistoricConsumptionService.
+
+Jobs running at once in a process (e.g. the day-ahead run, a backtest and
+ad-hoc predictions of a single connection) ask about the same connections
+and days at the same moment. Every (EAN, window) a caller asks about is
+either taken from a fetch in flight covering it or added to a new flight,
+so that the wrapped service gets asked about each of them once, however
+many callers need it.
+
+A flight merges overlapping windows of an EAN into one wider window and
+asks about connections with the same (merged) windows in one bulk
+request. Each caller gets exactly the windows it asked for sliced out of
+the flights. With a linger, a new flight waits that long for other callers
+to add to it before fetching, so that requests arriving at the same moment
+become one.
+
+Meant to sit underneath CachingHistoricConsumptionService, which keeps
+what got fetched; flights only live while in the air.
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pandas import DataFrame, DatetimeIndex, Index, Series, concat, factorize
+
+from .consumption_cache import utc_datetime64
+from .grid_connection import GridConnection
+from .historic_consumption_service import (
+    HistoricConsumptionService,
+    default_batch_size,
+    empty_consumption_frame,
+)
+from .utils.single_flight import FlightAbandoned, flight_future, settle
+
+# (time_start, time_end), both inclusive (see HistoricConsumptionService.get_consumption)
+Window = Tuple[datetime, datetime]
+
+
+class ConsumptionFlight:
+    """
+    A fetch of consumption of some EANs over their (merged) windows,
+    shared by all callers needing part of it.
+    """
+
+    def __init__(self):
+        self.connections: Dict[str, GridConnection] = {}
+        self.windows: Dict[str, Tuple[Window, ...]] = {}
+        # callers having added (EAN, window) pairs to the flight
+        self.contributors = 0
+        self.future = flight_future()
+        # (windows of an EAN so far, added windows) -> merged windows, so
+        # that EANs with the same windows share (and compare as) one tuple
+        self.merged: Dict[Tuple[Tuple[Window, ...], Tuple[Window, ...]], Tuple[Window, ...]] = {}
+
+    def add(self, connection: GridConnection, windows: Tuple[Window, ...]):
+        ean = connection.ean_code
+        self.connections[ean] = connection
+        key = (self.windows.get(ean, ()), windows)
+        merged = self.merged.get(key)
+        if merged is None:
+            merged = self.merged[key] = merge_windows(key[0] + windows)
+        self.windows[ean] = merged
+
+    def requests(self) -> List[Tuple[List[GridConnection], List[Window]]]:
+        """
+        Returns:
+            (connections, windows) of the requests to make - one per set
+            of windows shared by connections
+        """
+        groups: Dict[Tuple[Window, ...], List[GridConnection]] = defaultdict(list)
+        for ean, connection in self.connections.items():
+            groups[self.windows[ean]].append(connection)
+        return [(group, list(windows)) for windows, group in groups.items()]
+
+
+class CallerPlan:
+    """
+    Where the (EAN, window) pairs a caller asks about come from.
+    """
+
+    def __init__(self, windows: Sequence[Window]):
+        self.windows = tuple(windows)
+        # flight the caller has to make, if any
+        self.flight: Optional[ConsumptionFlight] = None
+        # flight -> window -> EANs to take from it
+        self.parts: Dict[ConsumptionFlight, Dict[Window, List[str]]] = defaultdict(
+            lambda: defaultdict(list)
+        )
+
+    def is_whole_flight(self) -> bool:
+        """
+        Returns:
+            whether the caller needs exactly what its own flight fetches,
+            nobody else added to it and no windows got merged
+        """
+        if self.flight is None or len(self.parts) != 1 or self.flight.contributors != 1:
+            return False
+        return all(windows == self.windows for windows in self.flight.windows.values())
+
+
+class CoalescingHistoricConsumptionService(HistoricConsumptionService):
+    """
+    HistoricConsumptionService sharing fetches in flight between concurrent
+    callers, be they threads or async tasks (see module docs).
+    """
+
+    def __init__(self, service: HistoricConsumptionService, linger: float = 0.0):
+        """
+        Args:
+            service: service to fetch from
+            linger: (seconds) a new flight waits for other callers to add
+                to it before fetching
+        """
+        super().__init__()
+        self.service = service
+        self.linger = linger
+        self.lock = Lock()
+        # flights in the air, by EAN they fetch
+        self.flights: Dict[str, List[ConsumptionFlight]] = defaultdict(list)
+        # flight still accepting (EAN, window) pairs while lingering
+        self.open_flight: Optional[ConsumptionFlight] = None
+
+    def get_consumption(
+        self, connection: GridConnection, time_start: datetime, time_end: datetime
+    ) -> Series:
+        """
+        See HistoricConsumptionService.get_consumption
+        """
+        consumption = self.get_consumption_many([connection], [(time_start, time_end)])
+        return Series(
+            index=DatetimeIndex(consumption["interval_start"]).tz_convert(
+                time_start.tzinfo
+            ),
+            data=consumption["kwh"].to_numpy(),
+        )
+
+    def get_consumption_many(
+        self,
+        connections: Sequence[GridConnection],
+        windows: Sequence[Tuple[datetime, datetime]],
+        batch_size: int = default_batch_size,
+    ) -> DataFrame:
+        """
+        See HistoricConsumptionService.get_consumption_many
+        """
+        while True:
+            plan = self.plan(connections, windows)
+            if plan.flight is not None:
+                if self.linger:
+                    time.sleep(self.linger)
+                self.close(plan.flight)
+                try:
+                    frames = [
+                        self.service.get_consumption_many(group, request_windows, batch_size)
+                        for group, request_windows in plan.flight.requests()
+                    ]
+                except BaseException as error:
+                    self.land(plan.flight, error=error)
+                    raise
+                self.land(plan.flight, frames)
+
+            try:
+                results = {flight: flight.future.result() for flight in plan.parts}
+            except FlightAbandoned:
+                continue
+            return self.slice(plan, results)
+
+    async def aget_consumption_many(
+        self,
+        connections: Sequence[GridConnection],
+        windows: Sequence[Tuple[datetime, datetime]],
+        batch_size: int = default_batch_size,
+    ) -> DataFrame:
+        """
+        Async variant of get_consumption_many. Waiting for flights made by
+        other threads does not block the event loop.
+        """
+        while True:
+            plan = self.plan(connections, windows)
+            if plan.flight is not None:
+                if self.linger:
+                    await asyncio.sleep(self.linger)
+                self.close(plan.flight)
+                try:
+                    frames = await asyncio.gather(
+                        *(
+                            self.service.aget_consumption_many(group, request_windows, batch_size)
+                            for group, request_windows in plan.flight.requests()
+                        )
+                    )
+                except BaseException as error:
+                    self.land(plan.flight, error=error)
+                    raise
+                self.land(plan.flight, frames)
+
+            try:
+                results = {
+                    flight: await asyncio.wrap_future(flight.future) for flight in plan.parts
+                }
+            except FlightAbandoned:
+                continue
+            return self.slice(plan, results)
+
+    def plan(
+        self, connections: Sequence[GridConnection], windows: Sequence[Window]
+    ) -> CallerPlan:
+        """
+        Takes (EAN, window) pairs from flights in the air covering them and
+        adds the rest to the open flight (or a new one, made by the caller).
+        """
+        plan = CallerPlan(windows)
+        # (merged windows of a flight, windows) -> whether each is covered
+        covered_memo: Dict[Tuple[Tuple[Window, ...], Tuple[Window, ...]], Tuple[bool, ...]] = {}
+
+        with self.lock:
+            contributed_to = set()
+            for connection in connections:
+                ean = connection.ean_code
+                missing = plan.windows
+                for flight in self.flights.get(ean, ()):
+                    key = (flight.windows[ean], missing)
+                    covered = covered_memo.get(key)
+                    if covered is None:
+                        covered = covered_memo[key] = tuple(
+                            covers(flight.windows[ean], window) for window in missing
+                        )
+                    for window, is_covered in zip(missing, covered):
+                        if is_covered:
+                            plan.parts[flight][window].append(ean)
+                    missing = tuple(w for w, is_covered in zip(missing, covered) if not is_covered)
+                    if not missing:
+                        break
+                if not missing:
+                    continue
+
+                flight = self.open_flight or plan.flight
+                if flight is None:
+                    flight = plan.flight = ConsumptionFlight()
+                    if self.linger:
+                        self.open_flight = flight
+                if ean not in flight.connections:
+                    self.flights[ean].append(flight)
+                flight.add(connection, missing)
+                contributed_to.add(flight)
+                for window in missing:
+                    plan.parts[flight][window].append(ean)
+
+            for flight in contributed_to:
+                flight.contributors += 1
+
+        return plan
+
+    def close(self, flight: ConsumptionFlight):
+        """
+        Stops the flight from accepting more (EAN, window) pairs.
+        """
+        with self.lock:
+            if self.open_flight is flight:
+                self.open_flight = None
+
+    def land(
+        self,
+        flight: ConsumptionFlight,
+        frames: Optional[Sequence[DataFrame]] = None,
+        error: Optional[BaseException] = None,
+    ):
+        """
+        Removes the flight from the air and hands its outcome to everyone
+        waiting for it.
+        """
+        with self.lock:
+            for ean in flight.connections:
+                flights = self.flights[ean]
+                flights.remove(flight)
+                if not flights:
+                    del self.flights[ean]
+
+        if error is not None:
+            settle(flight.future, error)
+        elif frames:
+            flight.future.set_result(concat(frames, ignore_index=True))
+        else:
+            flight.future.set_result(empty_consumption_frame())
+
+    # noinspection PyMethodMayBeStatic
+    def slice(self, plan: CallerPlan, results: Dict[ConsumptionFlight, DataFrame]) -> DataFrame:
+        """
+        Returns:
+            rows of the flights' results the caller asked for, window by
+            window (as the wrapped service would have returned them)
+        """
+        if plan.is_whole_flight():
+            return results[plan.flight]
+
+        frames = []
+        for flight, eans_by_window in plan.parts.items():
+            consumption = results[flight]
+            ean_codes, unique_eans = factorize(consumption["ean"])
+            starts = utc_datetime64(consumption["interval_start"])
+            unique_eans = Index(unique_eans)
+
+            positions = []
+            # windows of a caller mostly share the same EANs
+            ean_masks: Dict[Tuple[str, ...], np.ndarray] = {}
+            for window, eans in eans_by_window.items():
+                eans = tuple(eans)
+                ean_mask = ean_masks.get(eans)
+                if ean_mask is None:
+                    selected = np.zeros(len(unique_eans), dtype=bool)
+                    found = unique_eans.get_indexer(eans)
+                    selected[found[found >= 0]] = True
+                    ean_mask = ean_masks[eans] = selected[ean_codes]
+                time_start, time_end = utc_datetime64(Series(window))
+                positions.append(
+                    np.flatnonzero(ean_mask & (starts >= time_start) & (starts <= time_end))
+                )
+            frames.append(consumption.take(np.concatenate(positions)))
+
+        if not frames:
+            return empty_consumption_frame()
+        return concat(frames, ignore_index=True)
+
+
+def merge_windows(windows: Sequence[Window]) -> Tuple[Window, ...]:
+    """
+    Returns:
+        sorted windows, overlapping ones merged into one
+    """
+    merged: List[Window] = []
+    for time_start, time_end in sorted(windows):
+        if merged and time_start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], time_end))
+        else:
+            merged.append((time_start, time_end))
+    return tuple(merged)
+
+
+def covers(windows: Sequence[Window], window: Window) -> bool:
+    """
+    Returns:
+        whether one of the (merged) windows contains the window
+    """
+    return any(
+        time_start <= window[0] and window[1] <= time_end for time_start, time_end in windows
+    )
@@ -0,0 +1,114 @@
+"""
+Stub services with injected latency, standing in for the metering platform
+and the solar forecast provider when benchmarking.
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from threading import Lock
+from typing import Sequence, Tuple
+
+from pandas import DataFrame, Series, concat
+
+from .grid_connection import GridConnection
+from .historic_consumption_service import (
+    HistoricConsumptionService,
+    default_batch_size,
+    empty_consumption_frame,
+)
+from .solar_forecast import SolarForecastService
+
+
+class LatencyHistoricConsumptionService(HistoricConsumptionService):
+    """
+    Mocked HistoricConsumptionService taking `latency` seconds per request
+    and counting requests made to it.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+        # benchmarks make requests from many threads at once
+        self.lock = Lock()
+
+    def count_call(self):
+        with self.lock:
+            self.calls += 1
+
+    def get_consumption(
+        self, connection: GridConnection, time_start: datetime, time_end: datetime
+    ) -> Series:
+        self.count_call()
+        time.sleep(self.latency)
+        return super().get_consumption(connection, time_start, time_end)
+
+    async def aget_consumption(
+        self, connection: GridConnection, time_start: datetime, time_end: datetime
+    ) -> Series:
+        self.count_call()
+        await asyncio.sleep(self.latency)
+        return super().get_consumption(connection, time_start, time_end)
+
+    def get_consumption_batch(
+        self,
+        connections: Sequence[GridConnection],
+        windows: Sequence[Tuple[datetime, datetime]],
+    ) -> DataFrame:
+        self.count_call()
+        time.sleep(self.latency)
+        return super().get_consumption_batch(connections, windows)
+
+    async def aget_consumption_many(
+        self,
+        connections: Sequence[GridConnection],
+        windows: Sequence[Tuple[datetime, datetime]],
+        batch_size: int = default_batch_size,
+    ) -> DataFrame:
+        batches = await asyncio.gather(
+            *(
+                self.aget_consumption_batch(connections[i : i + batch_size], windows)
+                for i in range(0, len(connections), batch_size)
+            )
+        )
+        if not batches:
+            return empty_consumption_frame()
+        return concat(batches, ignore_index=True)
+
+    async def aget_consumption_batch(
+        self,
+        connections: Sequence[GridConnection],
+        windows: Sequence[Tuple[datetime, datetime]],
+    ) -> DataFrame:
+        self.count_call()
+        await asyncio.sleep(self.latency)
+        return super().get_consumption_batch(connections, windows)
+
+
+class LatencySolarForecastService(SolarForecastService):
+    """
+    Mocked SolarForecastService taking `latency` seconds per request and
+    counting requests made to it.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = 0
+        # benchmarks make requests from many threads at once
+        self.lock = Lock()
+
+    def count_call(self):
+        with self.lock:
+            self.calls += 1
+
+    def predict(self, *args) -> Series:
+        self.count_call()
+        time.sleep(self.latency)
+        return super().predict(*args)
+
+    async def apredict(self, *args) -> Series:
+        self.count_call()
+        await asyncio.sleep(self.latency)
+        return super().predict(*args)
@@ -2,6 +2,8 @@ from datetime import date
 from enum import Enum
 from typing import Optional
 
+from .utils.datetime import as_calendar_day
+
 
 class PredictionType(Enum):
     regular = 1
@@ -14,6 +16,21 @@ class GridConnection:
     Model class for a single (EAN) connection to the grid.
     """
 
+    __slots__ = (
+        "name",
+        "ean_code",
+        "active_from",
+        "active_until",
+        "prediction_type",
+        "standard_yearly_consumption",
+        "latitude",
+        "longitude",
+        "solar_plane_declination",
+        "solar_plane_azimuth",
+        "solar_rated_power",
+        "balancing_portfolio",
+    )
+
     def __init__(
         self,
         name: str,
@@ -27,6 +44,7 @@ class GridConnection:
         solar_plane_declination: Optional[float] = None,
         solar_plane_azimuth: Optional[float] = None,
         solar_rated_power: Optional[float] = None,
+        balancing_portfolio: Optional[str] = None,
     ):
         """
 
@@ -45,6 +63,8 @@ class GridConnection:
             solar_plane_declination: (degrees) of solar installation
             solar_plane_azimuth: (degrees) of solar installation
             solar_rated_power: (kWp) of solar installation
+            balancing_portfolio: portfolio the connection is ordered for
+                (day-ahead orders are submitted per portfolio and hour)
         """
         self.name = name
         self.ean_code = ean_code
@@ -57,9 +77,10 @@ class GridConnection:
         self.solar_plane_declination = solar_plane_declination
         self.solar_plane_azimuth = solar_plane_azimuth
         self.solar_rated_power = solar_rated_power
+        self.balancing_portfolio = balancing_portfolio
 
     def __str__(self):
-        return f"{self.name} <self.ean>"
+        return f"{self.name} <{self.ean_code}>"
 
     def is_active_on(self, day: date) -> bool:
         """
@@ -68,10 +89,10 @@ class GridConnection:
         Returns true if the grid connection is active (orders can be sent
         and it makes sense to offer consumption predictions).
         """
-        if self.active_from is not None and day < self.active_from:
+        if self.active_from is not None and day < as_calendar_day(self.active_from):
             return False
 
-        if self.active_until is not None and day > self.active_until:
+        if self.active_until is not None and day > as_calendar_day(self.active_until):
             return False
 
         return True
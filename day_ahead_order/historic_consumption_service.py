@@ -1,8 +1,18 @@
-from datetime import datetime
+import asyncio
+from datetime import date, datetime
+from functools import partial
+from typing import List, Sequence, Tuple
 
-from pandas import Series, date_range
+import numpy as np
+from pandas import concat, DataFrame, DatetimeIndex, Series, date_range
 
-from grid_connection import GridConnection
+from .connection_registry import ean_codes_of
+from .grid_connection import GridConnection
+from .utils.datetime import get_prediction_range
+from .weekday_profile import align_local_hours
+
+# Max number of connections to ask the metering platform about in one request.
+default_batch_size = 1000
 
 
 class HistoricConsumptionService:
@@ -36,12 +46,135 @@ class HistoricConsumptionService:
         #   we would get confusing results when passing for the same time period
         #   expressed in different time zones (e.g., in CET and UTC).
         #
-        # TODO: [Artūrs] replace freq="15T" with "15min"
-        #  With pandas 2.2.3 results in
+        # NOTE: [Artūrs] freq="15T" results in (with pandas 2.2.3)
         #  FutureWarning: 'T' is deprecated and will be removed in a future version, please use 'min' instead.
-        ix_range = date_range(time_start, time_end, freq="15T")
+        ix_range = date_range(time_start, time_end, freq="15min")
 
         # data is mocked for now
         data = [ix.dayofweek + (ix.hour / 2) for ix in ix_range]
 
         return Series(index=ix_range, data=data)
+
+    async def aget_consumption(
+        self, connection: GridConnection, time_start: datetime, time_end: datetime
+    ) -> Series:
+        """
+        Async variant of get_consumption.
+
+        The stub runs get_consumption in the default executor; a client of
+        the real platform would await its HTTP request here instead.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.get_consumption, connection, time_start, time_end
+        )
+
+    def get_consumption_many(
+        self,
+        connections: Sequence[GridConnection],
+        windows: Sequence[Tuple[datetime, datetime]],
+        batch_size: int = default_batch_size,
+    ) -> DataFrame:
+        """
+        Gets the historic consumption of many connections over several time
+        windows, in as few requests to the platform as possible (one per
+        batch of `batch_size` connections).
+
+        Args:
+            connections:
+            windows: (time_start, time_end) pairs, with the same meaning as
+                for get_consumption. Expected not to overlap.
+            batch_size: max number of connections per request
+        Returns:
+            Long-format frame with columns
+            - ean: EAN code of the connection
+            - interval_start: beginning of the 15 minute interval
+            - kwh: consumption (kWh) during the interval
+        """
+        batches = [
+            self.get_consumption_batch(connections[i : i + batch_size], windows)
+            for i in range(0, len(connections), batch_size)
+        ]
+        if not batches:
+            return empty_consumption_frame()
+
+        return concat(batches, ignore_index=True)
+
+    async def aget_consumption_many(
+        self,
+        connections: Sequence[GridConnection],
+        windows: Sequence[Tuple[datetime, datetime]],
+        batch_size: int = default_batch_size,
+    ) -> DataFrame:
+        """
+        Async variant of get_consumption_many (see aget_consumption).
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            None,
+            partial(self.get_consumption_many, connections, windows, batch_size),
+        )
+
+    def get_hourly_consumption(
+        self, connections: Sequence[GridConnection], days: Sequence[date]
+    ) -> np.ndarray:
+        """
+        Gets the historic consumption of many connections over whole local
+        days, summed per hour.
+
+        Returns:
+            kWh of shape (connections, days, slots_per_day), lined up on
+            local hour slots (see weekday_profile.align_local_hours)
+        """
+        consumption = self.get_consumption_many(
+            connections, [get_prediction_range(day) for day in days]
+        )
+        return align_local_hours(consumption, ean_codes_of(connections), days)
+
+    # noinspection PyMethodMayBeStatic
+    def get_consumption_batch(
+        self,
+        connections: Sequence[GridConnection],
+        windows: Sequence[Tuple[datetime, datetime]],
+    ) -> DataFrame:
+        """
+        A single request to the platform, see get_consumption_many.
+        """
+        ix_range = window_intervals(windows)
+
+        # data is mocked for now (the same way as in get_consumption)
+        data = np.asarray(ix_range.dayofweek + ix_range.hour / 2, dtype=float)
+        tiled = np.tile(np.arange(len(ix_range)), len(connections))
+
+        return DataFrame(
+            {
+                "ean": np.repeat([c.ean_code for c in connections], len(ix_range)),
+                "interval_start": ix_range[tiled],
+                "kwh": data[tiled],
+            }
+        )
+
+
+def empty_consumption_frame() -> DataFrame:
+    """
+    Returns:
+        long-format consumption frame without rows (see get_consumption_many)
+    """
+    return DataFrame(
+        {
+            "ean": np.array([], dtype=object),
+            "interval_start": DatetimeIndex([], tz="UTC"),
+            "kwh": np.array([], dtype=float),
+        }
+    )
+
+
+def window_intervals(windows: Sequence[Tuple[datetime, datetime]]) -> DatetimeIndex:
+    """
+    Returns:
+        beginnings of all 15 minute intervals within the windows
+    """
+    ranges: List[DatetimeIndex] = [
+        date_range(time_start, time_end, freq="15min") for time_start, time_end in windows
+    ]
+    if not ranges:
+        return DatetimeIndex([], tz="UTC")
+    return ranges[0].append(ranges[1:])
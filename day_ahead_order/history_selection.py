@@ -0,0 +1,237 @@
+"""
+Holiday- and anomaly-aware selection of the past same weekdays to average.
+
+Instead of blindly taking the last weekdays_to_average same weekdays,
+days unlike a regular one get skipped and the selection reaches further
+back (up to max_weeks_back weeks) for as many good days as needed:
+
+- public holidays (looked up in the precomputed calendar index, the same
+  for all connections),
+- metering gaps and zero runs, detected in the fetched history of each
+  connection (see detect_anomalies).
+
+Days without any data count as not good either. Everything is evaluated
+for all connections and prediction days at once, on boolean arrays of
+shape (connections, prediction days, historic days). Connections left
+without any good day in reach fall back to the blind selection.
+"""
+
+from datetime import date, timedelta
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from .utils.calendar_index import calendar_index
+from .utils.datetime import (
+    get_prediction_hours,
+    last_weekday_before,
+    local_hour_slots,
+    slots_per_day,
+)
+from .utils.day_classes import DayClass
+
+# How many past same weekdays get averaged for regular connections.
+weekdays_to_average = 3
+# How far back good days get looked for.
+default_max_weeks_back = 8
+# Consecutive hours of exactly zero kWh taken for a metering outage.
+default_zero_run_hours = 6
+# Days of these classes do not get averaged.
+default_skipped_classes = DayClass.holiday | DayClass.gap | DayClass.zero_run
+
+
+class WeekdaySelector:
+    """
+    Picks, for each connection and prediction day, the historic days to
+    average (see module docs).
+    """
+
+    def __init__(
+        self,
+        weekdays: int = weekdays_to_average,
+        max_weeks_back: int = default_max_weeks_back,
+        skipped_classes: DayClass = default_skipped_classes,
+        zero_run_hours: int = default_zero_run_hours,
+    ):
+        """
+        Args:
+            weekdays: number of same weekdays to average
+            max_weeks_back: how many same weekdays back to look for good
+                ones (at least `weekdays`)
+            skipped_classes: DayClass flags of days not to average
+            zero_run_hours: see detect_anomalies
+        """
+        if max_weeks_back < weekdays:
+            raise ValueError(
+                f"max_weeks_back ({max_weeks_back}) should be at least weekdays ({weekdays})"
+            )
+        self.weekdays = weekdays
+        self.max_weeks_back = max_weeks_back
+        self.skipped_classes = skipped_classes
+        self.zero_run_hours = zero_run_hours
+
+    def reach_days(self, days: Sequence[date], anchor: Optional[date] = None) -> List[date]:
+        """
+        Returns:
+            sorted historic days any selection for the days may use: the
+            last max_weeks_back same weekdays of each before the anchor
+            (today by default)
+        """
+        reach = set()
+        for weekday in {day.weekday() for day in days}:
+            last = last_weekday_before(weekday, anchor)
+            reach.update(last - timedelta(weeks=weeks) for weeks in range(self.max_weeks_back))
+        return sorted(reach)
+
+    def first_choice_days(
+        self, days: Sequence[date], anchor: Optional[date] = None
+    ) -> List[date]:
+        """
+        Returns:
+            sorted historic days selected when the history of connections
+            has no anomalies: the last `weekdays` same weekdays before the
+            anchor which are not skipped by their calendar class
+        """
+        reach = self.reach_days(days, anchor)
+        calendar_good = (
+            calendar_index().classes_of(reach) & int(self.skipped_classes)
+        ) == 0
+        chosen = []
+        for weekday in {day.weekday() for day in days}:
+            good = [
+                day
+                for day, is_good in zip(reversed(reach), reversed(calendar_good))
+                if is_good and day.weekday() == weekday
+            ]
+            chosen.extend(good[: self.weekdays])
+        return sorted(chosen)
+
+    def good_days(self, hourly: np.ndarray, history_days: Sequence[date]) -> np.ndarray:
+        """
+        Args:
+            hourly: (connections, historic days, slots_per_day) kWh, see
+                HistoricConsumptionService.get_hourly_consumption
+            history_days:
+        Returns:
+            boolean (connections, historic days) - days with data, of no
+            skipped class
+        """
+        classes = calendar_index().classes_of(history_days)[np.newaxis, :] | detect_anomalies(
+            hourly, history_days, self.zero_run_hours
+        )
+        has_data = ~np.isnan(hourly).all(axis=2)
+        return has_data & ((classes & int(self.skipped_classes)) == 0)
+
+    def windows(
+        self,
+        hourly: np.ndarray,
+        history_days: Sequence[date],
+        days: Sequence[date],
+        anchors: Optional[Sequence[date]] = None,
+    ) -> np.ndarray:
+        """
+        Args:
+            hourly: (connections, historic days, slots_per_day) kWh
+            history_days: sorted historic days (e.g. reach_days)
+            days: prediction days
+            anchors: day before which to look for each prediction day
+                (today by default, e.g. order days when backtesting)
+        Returns:
+            boolean (connections, prediction days, historic days) - which
+            historic days to average for each connection and prediction day
+            (see weekday_profile.masked_weekday_mean)
+        """
+        if anchors is None:
+            anchors = [date.today()] * len(days)
+
+        history = np.asarray(history_days, dtype="datetime64[D]")
+        # days back from the anchor of each prediction day
+        offsets = (
+            np.asarray(anchors, dtype="datetime64[D]")[:, np.newaxis] - history[np.newaxis, :]
+        ).astype(np.int64)
+        same_weekday = (
+            weekday_of(history)[np.newaxis, :]
+            == weekday_of(np.asarray(days, dtype="datetime64[D]"))[:, np.newaxis]
+        )
+        candidates = same_weekday & (offsets > 0) & (offsets <= 7 * self.max_weeks_back)
+        blind = same_weekday & (offsets > 0) & (offsets <= 7 * self.weekdays)
+
+        selectable = candidates[np.newaxis] & self.good_days(hourly, history_days)[:, np.newaxis]
+        # number of selectable days at least as recent as each historic day
+        # (history_days are sorted, the most recent come last)
+        recency_rank = np.cumsum(selectable[..., ::-1], axis=2)[..., ::-1]
+        windows = selectable & (recency_rank <= self.weekdays)
+
+        nothing_good = ~windows.any(axis=2)
+        windows[nothing_good] = np.broadcast_to(blind, windows.shape)[nothing_good]
+        return windows
+
+    def short_of_days(
+        self, hourly: np.ndarray, history_days: Sequence[date], days: Sequence[date]
+    ) -> np.ndarray:
+        """
+        Returns:
+            boolean (connections) - whether the history has fewer good days
+            than `weekdays` for some of the prediction days
+        """
+        good = self.good_days(hourly, history_days)
+        history_weekdays = weekday_of(np.asarray(history_days, dtype="datetime64[D]"))
+        short = np.zeros(hourly.shape[0], dtype=bool)
+        for weekday in {day.weekday() for day in days}:
+            short |= good[:, history_weekdays == weekday].sum(axis=1) < self.weekdays
+        return short
+
+
+def detect_anomalies(
+    hourly: np.ndarray,
+    history_days: Sequence[date],
+    zero_run_hours: int = default_zero_run_hours,
+) -> np.ndarray:
+    """
+    Args:
+        hourly: (connections, historic days, slots_per_day) kWh
+        history_days:
+        zero_run_hours: consecutive hours of exactly zero kWh within a day
+            which count as a zero run
+    Returns:
+        DayClass flags (uint8) of shape (connections, historic days): gap
+        for days with some (but not all) of their hours missing, zero_run
+        for days with a zero run
+    """
+    present = ~np.isnan(hourly)
+    expected = expected_slots(history_days)[np.newaxis]
+    gaps = present.any(axis=2) & (expected & ~present).any(axis=2)
+
+    # wall clock hours in order (the repeated hour slot is left out)
+    zeros = (hourly[..., :24] == 0).astype(np.int64)
+    run_sums = np.cumsum(zeros, axis=2)
+    run_sums[..., zero_run_hours:] -= run_sums[..., :-zero_run_hours].copy()
+    zero_runs = (run_sums >= zero_run_hours).any(axis=2)
+
+    return (
+        np.where(gaps, int(DayClass.gap), 0) | np.where(zero_runs, int(DayClass.zero_run), 0)
+    ).astype(np.uint8)
+
+
+def expected_slots(days: Sequence[date]) -> np.ndarray:
+    """
+    Returns:
+        boolean (days, slots_per_day) - local hour slots each day has
+    """
+    index = calendar_index()
+    expected = np.zeros((len(days), slots_per_day), dtype=bool)
+    for position, day in enumerate(days):
+        if index.covers(day):
+            expected[position, index.slots_of(day)] = True
+        else:
+            expected[position, local_hour_slots(get_prediction_hours(day))] = True
+    return expected
+
+
+def weekday_of(days: np.ndarray) -> np.ndarray:
+    """
+    Returns:
+        weekdays (0 for Monday) of datetime64[D] days
+    """
+    # 1970-01-01 was a Thursday
+    return (days.astype(np.int64) + 3) % 7
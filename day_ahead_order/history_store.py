@@ -0,0 +1,341 @@
+"""
+Local store of 15 minute metering history in memory-mapped files.
+
+Each EAN gets a file of float32 kWh values on a continuous timeline of
+15 minute intervals, starting at local midnight of the store's first day.
+Local days take 92, 96 or 100 consecutive values (depending on daylight
+saving time), so the position of any day is known from the calendar index
+alone (see utils.calendar_index) and reading a day is a zero-copy slice of
+the mapped file. Intervals never written hold NaN.
+"""
+
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from pandas import (
+    DataFrame,
+    DatetimeIndex,
+    Series,
+    Timestamp,
+    date_range,
+    factorize,
+    to_timedelta,
+)
+
+from .connection_registry import ean_codes_of
+from .grid_connection import GridConnection
+from .historic_consumption_service import HistoricConsumptionService, empty_consumption_frame
+from .utils.cache import LruCache
+from .utils.calendar_index import CalendarIndex, calendar_index
+from .utils.datetime import default_timezone, get_prediction_range, slots_per_day
+
+interval = timedelta(minutes=15)
+intervals_per_hour = 4
+# Each mapped file keeps a file descriptor open.
+default_open_files = 1024
+
+
+class HistoryStore:
+    """
+    Memory-mapped 15 minute history per EAN (see module docs).
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        first_day: Optional[date] = None,
+        tzone: str = default_timezone,
+        max_open_files: int = default_open_files,
+    ):
+        """
+        Args:
+            directory: of the store, created if missing
+            first_day: first local day of the timeline. Required for a new
+                store, read from the store's metadata otherwise.
+            tzone: time zone days are experienced in
+            max_open_files: number of files kept mapped at once
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+        metadata_path = os.path.join(directory, "store.json")
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as file:
+                metadata = json.load(file)
+            if first_day is not None and first_day != date.fromisoformat(metadata["first_day"]):
+                raise ValueError(f"History store {directory} starts on {metadata['first_day']}")
+            first_day = date.fromisoformat(metadata["first_day"])
+            tzone = metadata["tzone"]
+        elif first_day is None:
+            raise ValueError("first_day is required to create a history store")
+        else:
+            with open(metadata_path, "w") as file:
+                json.dump({"first_day": first_day.isoformat(), "tzone": tzone}, file)
+
+        self.first_day = first_day
+        self.tzone = tzone
+        self.calendar: CalendarIndex = calendar_index(tzone)
+        if not self.calendar.covers(first_day):
+            raise ValueError(f"first_day {first_day} is outside of the calendar index")
+
+        # first interval of the timeline
+        self.origin = Timestamp(get_prediction_range(first_day, tzone)[0])
+        # (open) position of the first day's first hour in the calendar index
+        self.origin_hour = self.calendar.positions_of(first_day).start
+        self.mapped = LruCache(max_open_files)
+
+    def path(self, ean: str) -> str:
+        return os.path.join(self.directory, ean[-2:], f"{ean}.f32")
+
+    def values(self, ean: str) -> np.ndarray:
+        """
+        Returns:
+            (read-only, memory-mapped) whole timeline of the EAN, empty if
+            nothing was stored for it
+        """
+        values = self.mapped.get(ean)
+        if values is None:
+            path = self.path(ean)
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                return np.array([], dtype=np.float32)
+            values = np.memmap(path, dtype=np.float32, mode="r")
+            self.mapped.put(ean, values)
+        return values
+
+    def day_positions(self, day: date) -> slice:
+        """
+        Returns:
+            positions of the day's intervals on the timeline
+        Raises:
+            ValueError: for days outside of the calendar index
+        """
+        if not self.calendar.covers(day):
+            raise ValueError(
+                f"{day} is outside of the calendar index "
+                f"({self.calendar.first_day} - {self.calendar.last_day})"
+            )
+        hours = self.calendar.positions_of(day)
+        return slice(
+            (hours.start - self.origin_hour) * intervals_per_hour,
+            (hours.stop - self.origin_hour) * intervals_per_hour,
+        )
+
+    def day_values(self, ean: str, day: date) -> np.ndarray:
+        """
+        Returns:
+            zero-copy view of the day's 15 minute kWh (NaN where missing),
+            shorter than the day if the end of the timeline is within it
+        Raises:
+            ValueError: for days after the end of the calendar index
+        """
+        if day < self.first_day:
+            return np.array([], dtype=np.float32)
+        return self.values(ean)[self.day_positions(day)]
+
+    def interval_positions(self, moments: DatetimeIndex) -> np.ndarray:
+        """
+        Returns:
+            positions on the timeline of the intervals starting at the moments
+        """
+        return np.asarray((moments - self.origin) // interval, dtype=np.int64)
+
+    def range_values(
+        self, ean: str, time_start: datetime, time_end: datetime
+    ) -> Tuple[int, np.ndarray]:
+        """
+        Returns:
+            position of the first interval starting within [time_start;
+            time_end] and zero-copy view of the values of all of them
+        """
+        start = max(0, -(-(Timestamp(time_start) - self.origin) // interval))
+        stop = (Timestamp(time_end) - self.origin) // interval + 1
+        return start, self.values(ean)[start:max(start, stop)]
+
+    def hourly(self, ean: str, day: date) -> np.ndarray:
+        """
+        Returns:
+            kWh per hour of the day (23, 24 or 25 values), NaN for hours
+            without any data
+        Raises:
+            ValueError: for days outside of the calendar index
+        """
+        positions = self.day_positions(day)
+        values = np.full(positions.stop - positions.start, np.nan, dtype=np.float32)
+        stored = self.day_values(ean, day)
+        values[: len(stored)] = stored
+
+        quarters = values.reshape(-1, intervals_per_hour)
+        present = ~np.isnan(quarters)
+        return np.where(present.any(axis=1), np.nansum(quarters, axis=1), np.nan)
+
+    def hourly_many(self, ean_codes: Sequence[str], days: Sequence[date]) -> np.ndarray:
+        """
+        Returns:
+            kWh of shape (EANs, days, slots_per_day), lined up on local hour
+            slots (see weekday_profile.align_local_hours), NaN for hours
+            without any data
+        Raises:
+            ValueError: for days outside of the calendar index
+        """
+        intervals, slots = self.hour_positions(days)
+        hourly = np.full((len(ean_codes), len(days) * slots_per_day), np.nan)
+        quarters = np.empty(intervals.shape, dtype=np.float32)
+
+        for row, ean in enumerate(ean_codes):
+            values = self.values(ean)
+            stored = (intervals >= 0) & (intervals < len(values))
+            quarters.fill(np.nan)
+            quarters[stored] = values[intervals[stored]]
+            present = ~np.isnan(quarters)
+            hourly[row, slots] = np.where(
+                present.any(axis=1), np.nansum(quarters, axis=1), np.nan
+            )
+
+        return hourly.reshape(len(ean_codes), len(days), slots_per_day)
+
+    def hour_positions(self, days: Sequence[date]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            - positions on the timeline of the intervals of every hour of
+              the days, of shape (hours, intervals_per_hour); negative
+              before the first day
+            - positions of those hours in a flattened (days, slots_per_day)
+              array
+        Raises:
+            ValueError: for days outside of the calendar index
+        """
+        starts, slots = [], []
+        for column, day in enumerate(days):
+            positions = self.day_positions(day)
+            starts.append(np.arange(positions.start, positions.stop, intervals_per_hour))
+            slots.append(column * slots_per_day + np.asarray(self.calendar.slots_of(day)))
+        if not starts:
+            return np.empty((0, intervals_per_hour), dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        intervals = np.concatenate(starts)[:, np.newaxis] + np.arange(intervals_per_hour)
+        return intervals, np.concatenate(slots)
+
+    def append(self, consumption: DataFrame):
+        """
+        Writes 15 minute consumption (e.g. of the latest day's ingestion),
+        growing files as needed. Existing values of the same intervals get
+        overwritten (e.g. by late corrections).
+
+        Args:
+            consumption: long-format frame, as returned by
+                HistoricConsumptionService.get_consumption_many
+        """
+        if consumption.empty:
+            return
+
+        interval_codes, interval_starts = factorize(consumption["interval_start"])
+        positions = self.interval_positions(DatetimeIndex(interval_starts))[interval_codes]
+        kwh = consumption["kwh"].to_numpy(dtype=np.float32)
+
+        for ean, rows in consumption.groupby("ean").indices.items():
+            in_timeline = positions[rows] >= 0
+            self.write(ean, positions[rows][in_timeline], kwh[rows][in_timeline])
+
+    def write(self, ean: str, positions: np.ndarray, kwh: np.ndarray):
+        if len(positions) == 0:
+            return
+
+        path = self.path(ean)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        length = os.path.getsize(path) // 4 if os.path.exists(path) else 0
+        needed = int(positions.max()) + 1
+
+        with open(path, "ab") as file:
+            if needed > length:
+                file.write(np.full(needed - length, np.nan, dtype=np.float32).tobytes())
+
+        values = np.memmap(path, dtype=np.float32, mode="r+")
+        values[positions] = kwh
+        values.flush()
+        del values
+        # mapping of the old file length is outdated now
+        self.mapped.put(ean, np.memmap(path, dtype=np.float32, mode="r"))
+
+    def ingest(
+        self,
+        service: HistoricConsumptionService,
+        connections: Sequence[GridConnection],
+        days: Sequence[date],
+    ):
+        """
+        Daily ingestion: fetches the days' consumption of the connections
+        from the service and appends it to the store.
+        """
+        self.append(
+            service.get_consumption_many(
+                connections, [get_prediction_range(day, self.tzone) for day in days]
+            )
+        )
+
+
+class StoredHistoricConsumptionService(HistoricConsumptionService):
+    """
+    HistoricConsumptionService answering from a HistoryStore (e.g. for
+    backtests and re-runs). Days missing from the store have no data.
+    """
+
+    def __init__(self, store: HistoryStore):
+        super().__init__()
+        self.store = store
+
+    def get_consumption(
+        self, connection: GridConnection, time_start: datetime, time_end: datetime
+    ) -> Series:
+        """
+        See HistoricConsumptionService.get_consumption. Values are a
+        zero-copy view of the store.
+        """
+        start, values = self.store.range_values(connection.ean_code, time_start, time_end)
+        index = date_range(
+            self.store.origin + start * interval, periods=len(values), freq="15min"
+        ).tz_convert(time_start.tzinfo)
+        return Series(values, index=index, copy=False)
+
+    def get_consumption_many(
+        self,
+        connections: Sequence[GridConnection],
+        windows: Sequence[Tuple[datetime, datetime]],
+        batch_size: int = 0,
+    ) -> DataFrame:
+        """
+        See HistoricConsumptionService.get_consumption_many. Everything is
+        read locally, so batch_size does not matter.
+        """
+        eans, starts, kwh = [], [], []
+        for connection in connections:
+            for time_start, time_end in windows:
+                start, values = self.store.range_values(connection.ean_code, time_start, time_end)
+                eans.append(np.full(len(values), connection.ean_code, dtype=object))
+                starts.append(np.arange(start, start + len(values)))
+                kwh.append(values)
+
+        if not eans:
+            return empty_consumption_frame()
+
+        positions = np.concatenate(starts)
+        return DataFrame(
+            {
+                "ean": np.concatenate(eans),
+                "interval_start": self.store.origin
+                + to_timedelta(positions * interval.total_seconds(), unit="s"),
+                "kwh": np.concatenate(kwh).astype(np.float64),
+            }
+        )
+
+    def get_hourly_consumption(
+        self, connections: Sequence[GridConnection], days: Sequence[date]
+    ) -> np.ndarray:
+        """
+        See HistoricConsumptionService.get_hourly_consumption. Intervals
+        of all the days get gathered from each EAN's file at once (see
+        HistoryStore.hourly_many).
+        """
+        return self.store.hourly_many(ean_codes_of(connections), days)
@@ -0,0 +1,307 @@
+"""
+Per-stage timing and call counting of prediction runs.
+
+PredictionService records into a Metrics object: latency histograms of
+its stages (historic fetch, solar fetch, averaging, resampling), requests
+made to the services, how often each fallback tier fired and hit rates of
+the caches in front of the services. Snapshots of everything recorded get
+written to pluggable sinks on flush (a log, a JSON lines file or a text
+file for the Prometheus node exporter).
+
+Without a Metrics object, PredictionService records into null_metrics,
+which does nothing (a method call per stage and no clock reads).
+"""
+
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from threading import Lock
+from typing import Any, Dict, List, Sequence, Tuple
+
+from .utils.cache import CacheStats
+
+# Upper bounds (seconds) of the stage latency histogram buckets.
+default_buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+metric_prefix = "day_ahead_order"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        # one count per bucket and one for values above all of them
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class StageTimer:
+    """
+    Context manager observing the time spent within it (see Metrics.stage).
+    """
+
+    __slots__ = ("metrics", "labels", "started")
+
+    def __init__(self, metrics: "Metrics", labels: Labels):
+        self.metrics = metrics
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe_labels(
+            "stage_seconds", self.labels, time.perf_counter() - self.started
+        )
+
+
+class NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+no_stage = NoStage()
+
+
+class Metrics:
+    """
+    Thread-safe store of stage latency histograms, counters and watched
+    caches, written to sinks on flush.
+    """
+
+    enabled = True
+
+    def __init__(
+        self,
+        sinks: Sequence["MetricsSink"] = (),
+        buckets: Sequence[float] = default_buckets,
+    ):
+        self.sinks = list(sinks)
+        self.buckets = buckets
+        self.lock = Lock()
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.caches: Dict[str, CacheStats] = {}
+
+    def stage(self, stage: str, **labels: str):
+        """
+        Returns:
+            context manager recording time spent within it as latency of
+            the stage
+        """
+        return StageTimer(self, labels_of(stage=stage, **labels))
+
+    def observe(self, name: str, value: float, **labels: str):
+        self.observe_labels(name, labels_of(**labels), value)
+
+    def observe_labels(self, name: str, labels: Labels, value: float):
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def count(self, name: str, value: float = 1, **labels: str):
+        key = (name, labels_of(**labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def watch_cache(self, cache: str, stats: CacheStats):
+        """
+        Reports hit rate of the cache on every flush.
+        """
+        self.caches[cache] = stats
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns:
+            JSON serializable copy of everything recorded so far
+        """
+        with self.lock:
+            return {
+                "time": time.time(),
+                "histograms": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "buckets": list(histogram.buckets),
+                        "counts": list(histogram.counts),
+                        "count": histogram.count,
+                        "sum": histogram.sum,
+                    }
+                    for (name, labels), histogram in self.histograms.items()
+                ],
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self.counters.items()
+                ],
+                "caches": [
+                    {
+                        "cache": cache,
+                        "memory_hits": stats.memory_hits,
+                        "disk_hits": stats.disk_hits,
+                        "misses": stats.misses,
+                        "hit_rate": stats.hit_rate,
+                    }
+                    for cache, stats in self.caches.items()
+                ],
+            }
+
+    def flush(self):
+        """
+        Writes a snapshot to all sinks.
+        """
+        if not self.sinks:
+            return
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            sink.write(snapshot)
+
+
+class NullMetrics(Metrics):
+    """
+    Metrics recording nothing, used when instrumentation is disabled.
+    """
+
+    enabled = False
+
+    def stage(self, stage: str, **labels: str):
+        return no_stage
+
+    def observe_labels(self, name: str, labels: Labels, value: float):
+        pass
+
+    def count(self, name: str, value: float = 1, **labels: str):
+        pass
+
+    def watch_cache(self, cache: str, stats: CacheStats):
+        pass
+
+    def flush(self):
+        pass
+
+
+null_metrics = NullMetrics()
+
+
+class MetricsSink:
+    def write(self, snapshot: Dict[str, Any]):
+        raise NotImplementedError
+
+
+class LoggingSink(MetricsSink):
+    """
+    Logs a line per stage, counter and cache.
+    """
+
+    def __init__(self, logger: logging.Logger = logging.getLogger(metric_prefix)):
+        self.logger = logger
+
+    def write(self, snapshot: Dict[str, Any]):
+        for histogram in snapshot["histograms"]:
+            count = histogram["count"]
+            self.logger.info(
+                "%s%s: %d in %.3fs (mean %.3fs)",
+                histogram["name"],
+                histogram["labels"],
+                count,
+                histogram["sum"],
+                histogram["sum"] / count if count else 0.0,
+            )
+        for counter in snapshot["counters"]:
+            self.logger.info("%s%s: %g", counter["name"], counter["labels"], counter["value"])
+        for cache in snapshot["caches"]:
+            self.logger.info("cache %s: hit rate %.1f%%", cache["cache"], 100 * cache["hit_rate"])
+
+
+class JsonLinesSink(MetricsSink):
+    """
+    Appends each snapshot as a line of JSON.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, snapshot: Dict[str, Any]):
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(snapshot) + "\n")
+
+
+class PrometheusTextFileSink(MetricsSink):
+    """
+    Replaces a text file in Prometheus exposition format (e.g. for the
+    node exporter's textfile collector) with the latest snapshot.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, snapshot: Dict[str, Any]):
+        # Samples of a metric have to follow its TYPE line without samples
+        # of other metrics in between, whatever order the snapshot has.
+        families: Dict[str, Tuple[str, List[str]]] = {}
+
+        def samples_of(name: str, metric_type: str) -> List[str]:
+            return families.setdefault(name, (metric_type, []))[1]
+
+        for histogram in snapshot["histograms"]:
+            name = f"{metric_prefix}_{histogram['name']}"
+            samples = samples_of(name, "histogram")
+            labels = histogram["labels"]
+            cumulative = 0
+            bounds = [str(bound) for bound in histogram["buckets"]] + ["+Inf"]
+            for bound, count in zip(bounds, histogram["counts"]):
+                cumulative += count
+                samples.append(f"{name}_bucket{prometheus_labels(labels, le=bound)} {cumulative}")
+            samples.append(f"{name}_sum{prometheus_labels(labels)} {histogram['sum']}")
+            samples.append(f"{name}_count{prometheus_labels(labels)} {histogram['count']}")
+
+        for counter in snapshot["counters"]:
+            name = f"{metric_prefix}_{counter['name']}"
+            samples_of(name, "counter").append(
+                f"{name}{prometheus_labels(counter['labels'])} {counter['value']}"
+            )
+
+        for cache in snapshot["caches"]:
+            name = f"{metric_prefix}_cache_hit_ratio"
+            samples_of(name, "gauge").append(
+                f"{name}{prometheus_labels({'cache': cache['cache']})} {cache['hit_rate']}"
+            )
+
+        lines: List[str] = []
+        for name, (metric_type, samples) in families.items():
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(samples)
+
+        # The collector must never read a half written file.
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(temporary_path, self.path)
+
+
+def labels_of(**labels: Any) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def prometheus_labels(labels: Dict[str, str], **extra: str) -> str:
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
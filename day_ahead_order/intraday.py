@@ -0,0 +1,227 @@
+"""
+Intraday re-prediction of the current day for a fleet.
+
+The day-ahead prediction of the day is kept as the baseline. Each refresh
+(e.g. every 15 minutes) fetches only the metering intervals that arrived
+since the previous one and recomputes only the hours they fall into: an
+hour is the sum of its measured quarters plus the baseline's share of its
+quarters not measured yet. Hours without any measurement keep the
+baseline, so nothing gets re-averaged during the day.
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional, Sequence
+
+import numpy as np
+from pandas import DataFrame, DatetimeIndex, Index, Timestamp
+
+from .connection_registry import ean_codes_of
+from .grid_connection import GridConnection
+from .prediction import PredictionService
+from .utils.datetime import get_prediction_hours, get_prediction_range
+
+interval = timedelta(minutes=15)
+intervals_per_hour = 4
+# Intervals before the last fetched one to fetch again, for late metering data.
+default_late_intervals = 4
+
+
+class IntradayPredictor:
+    """
+    Keeps the baseline and the measured quarters of the day of a fleet
+    between refreshes.
+    """
+
+    def __init__(
+        self,
+        prediction_service: PredictionService,
+        connections: Sequence[GridConnection],
+        day: Optional[date] = None,
+        baseline: Optional[DataFrame] = None,
+        late_intervals: int = default_late_intervals,
+    ):
+        """
+        Args:
+            prediction_service: to predict the baseline with and to fetch
+                metering data from
+            connections: fleet, with unique EAN codes
+            day: local calendar day (today by default)
+            baseline: day-ahead predictions of the day (as returned by
+                make_predictions_for_fleet), predicted for connections
+                missing from it
+            late_intervals: intervals to fetch again on each refresh
+        """
+        self.prediction_service = prediction_service
+        self.connections = connections
+        self.day = date.today() if day is None else day
+        self.late_intervals = late_intervals
+
+        self.ean_codes = Index(ean_codes_of(connections), name="ean")
+        self.hours = get_prediction_hours(self.day)
+        self.day_start = Timestamp(get_prediction_range(self.day)[0])
+        self.day_end = self.day_start + len(self.hours) * timedelta(hours=1)
+
+        self.baseline = self.baseline_values(baseline)
+        # (connections, hours, quarters) measured kWh, NaN if not measured (yet)
+        self.quarters = np.full(
+            (len(connections), len(self.hours), intervals_per_hour), np.nan
+        )
+        self.values = self.baseline.copy()
+        # start of the first interval the next refresh has to fetch
+        self.fetch_from = self.day_start
+
+    def baseline_values(self, baseline: Optional[DataFrame]) -> np.ndarray:
+        """
+        Returns:
+            (connections, hours) kWh of the baseline, predicting it for
+            connections not in the given one
+        """
+        if baseline is None:
+            known = np.zeros(len(self.ean_codes), dtype=bool)
+            values = np.full((len(self.ean_codes), len(self.hours)), np.nan)
+        else:
+            known = self.ean_codes.isin(baseline.index)
+            values = baseline.reindex(index=self.ean_codes, columns=self.hours).to_numpy(
+                dtype=float, copy=True
+            )
+
+        if not known.all():
+            unknown = [c for c, held in zip(self.connections, known) if not held]
+            predicted = self.prediction_service.make_predictions_for_fleet(unknown, [self.day])
+            values[~known] = predicted.reindex(columns=self.hours).to_numpy(dtype=float)
+        return values
+
+    def refresh(self, now: Optional[datetime] = None) -> DataFrame:
+        """
+        Fetches metering intervals completed since the previous refresh and
+        updates the hours they fall into.
+
+        Args:
+            now: timezone-aware moment of the refresh (current time by default)
+        Returns:
+            DataFrame indexed by EAN code, columns are UTC hours of the day
+        """
+        now = Timestamp(datetime.now(timezone.utc) if now is None else now)
+        # start of the last interval completed by now
+        last_interval = min(now.floor(interval) - interval, self.day_end - interval)
+        first_interval = max(
+            self.day_start, self.fetch_from - self.late_intervals * interval
+        )
+
+        if last_interval >= first_interval:
+            metrics = self.prediction_service.metrics
+            metrics.count("service_requests_total", service="historic_consumption")
+            with metrics.stage("intraday_fetch"):
+                consumption = (
+                    self.prediction_service.historic_consumption_service.get_consumption_many(
+                        self.connections,
+                        [(first_interval.to_pydatetime(), last_interval.to_pydatetime())],
+                    )
+                )
+            with metrics.stage("intraday_update"):
+                self.update(consumption)
+            self.fetch_from = max(self.fetch_from, last_interval + interval)
+
+        return self.predictions()
+
+    def update(self, consumption: DataFrame):
+        """
+        Stores measured intervals and recomputes the hours they fall into.
+
+        Args:
+            consumption: long-format frame, as returned by
+                HistoricConsumptionService.get_consumption_many
+        """
+        if consumption.empty:
+            return
+
+        rows = self.ean_codes.get_indexer(consumption["ean"])
+        positions = np.asarray(
+            (DatetimeIndex(consumption["interval_start"]) - self.day_start) // interval,
+            dtype=np.int64,
+        )
+        kwh = consumption["kwh"].to_numpy(dtype=float)
+        valid = (rows >= 0) & (positions >= 0) & (positions < len(self.hours) * intervals_per_hour)
+        rows, positions, kwh = rows[valid], positions[valid], kwh[valid]
+
+        hours, quarters = np.divmod(positions, intervals_per_hour)
+        self.quarters[rows, hours, quarters] = kwh
+
+        touched = np.unique(hours)
+        measured = self.quarters[:, touched]
+        counts = (~np.isnan(measured)).sum(axis=2)
+        sums = np.nansum(measured, axis=2)
+        expected = self.baseline[:, touched] / intervals_per_hour
+        self.values[:, touched] = np.where(
+            counts == intervals_per_hour,
+            sums,
+            sums + (intervals_per_hour - counts) * expected,
+        )
+
+    def predictions(self) -> DataFrame:
+        return DataFrame(self.values, index=self.ean_codes, columns=self.hours, copy=True)
+
+    def measured_hours(self) -> np.ndarray:
+        """
+        Returns:
+            boolean (connections, hours) - whether all quarters of an hour
+            have been measured
+        """
+        return (~np.isnan(self.quarters)).all(axis=2)
+
+    def save(self, path: str):
+        """
+        Persists the state (as .npz), so that the next refresh may run in
+        another process (e.g. started by cron every 15 minutes).
+
+        The state gets written to exactly the path (np.savez would add .npz
+        to a path without it, which load would then not find).
+        """
+        with open(path, "wb") as file:
+            np.savez(
+                file,
+                day=np.datetime64(self.day, "D"),
+                ean_codes=np.asarray(self.ean_codes, dtype=str),
+                baseline=self.baseline,
+                quarters=self.quarters,
+                values=self.values,
+                fetch_from=np.datetime64(
+                    self.fetch_from.tz_convert("UTC").tz_localize(None), "ns"
+                ),
+            )
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        prediction_service: PredictionService,
+        connections: Sequence[GridConnection],
+        late_intervals: int = default_late_intervals,
+    ) -> Optional["IntradayPredictor"]:
+        """
+        Returns:
+            predictor with the saved state, None if the state is of another
+            day (than today) or of other connections
+        """
+        with np.load(path) as stored:
+            day = stored["day"].item()
+            if day != date.today() or list(stored["ean_codes"]) != list(
+                ean_codes_of(connections)
+            ):
+                return None
+
+            predictor = cls(
+                prediction_service,
+                connections,
+                day,
+                DataFrame(
+                    stored["baseline"],
+                    index=Index(ean_codes_of(connections), name="ean"),
+                    columns=get_prediction_hours(day),
+                ),
+                late_intervals,
+            )
+            predictor.quarters = stored["quarters"]
+            predictor.values = stored["values"]
+            predictor.fetch_from = Timestamp(stored["fetch_from"][()]).tz_localize("UTC")
+        return predictor
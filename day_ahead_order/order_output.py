@@ -0,0 +1,241 @@
+"""
+Output stage of fleet predictions: streams per-EAN predictions into a
+columnar file and sums them per balancing portfolio and hour for the
+day-ahead order, as batches of predictions finish.
+
+Files are written in long format (a row per EAN and hour), in the format
+given by their extension: Parquet (.parquet, a row group per batch),
+Arrow IPC (.arrow, .feather or .ipc, a record batch per batch) or CSV.
+Parquet and Arrow IPC need the optional pyarrow package.
+"""
+
+import os
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from pandas import DataFrame, DatetimeIndex
+
+formats = {
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+    ".csv": "csv",
+}
+# Portfolio of connections without one.
+unassigned_portfolio = "unassigned"
+
+# column name -> type, for schemas of the written files
+prediction_columns = {
+    "ean": "string",
+    "balancing_portfolio": "string",
+    "hour": "timestamp",
+    "kwh": "float",
+}
+order_columns = {
+    "balancing_portfolio": "string",
+    "hour": "timestamp",
+    "kwh": "float",
+}
+
+
+class TableWriter:
+    """
+    Appends long-format frames to a Parquet, Arrow IPC or CSV file.
+    """
+
+    def __init__(self, path: str, columns: Dict[str, str]):
+        """
+        Args:
+            path: of the file, its extension selects the format
+            columns: column name -> type ("string", "timestamp" or "float")
+        Raises:
+            ValueError: for unsupported extensions, or if pyarrow is missing
+                for Parquet or Arrow IPC
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in formats:
+            raise ValueError(
+                f"Unsupported output file (expected one of {', '.join(formats)}): {path}"
+            )
+        self.path = path
+        self.format = formats[extension]
+        self.columns = columns
+        self.writer = None
+        self.file = None
+
+        if self.format != "csv":
+            try:
+                import pyarrow
+            except ImportError:
+                raise ValueError(
+                    f"Writing {path} requires pyarrow, write a .csv file instead"
+                ) from None
+            types = {
+                "string": pyarrow.string(),
+                "timestamp": pyarrow.timestamp("ns", tz="UTC"),
+                "float": pyarrow.float64(),
+            }
+            self.schema = pyarrow.schema(
+                [(name, types[column_type]) for name, column_type in columns.items()]
+            )
+
+    def write(self, frame: DataFrame):
+        """
+        Args:
+            frame: with (at least) the columns of the writer
+        """
+        frame = frame[list(self.columns)]
+
+        if self.format == "csv":
+            if self.file is None:
+                self.file = open(self.path, "w", newline="", encoding="utf-8")
+                frame.iloc[:0].to_csv(self.file, index=False)
+            frame.to_csv(self.file, header=False, index=False, date_format="%Y-%m-%dT%H:%M:%SZ")
+            return
+
+        import pyarrow
+
+        table = pyarrow.Table.from_pandas(frame, schema=self.schema, preserve_index=False)
+        if self.writer is None:
+            if self.format == "parquet":
+                import pyarrow.parquet
+
+                self.writer = pyarrow.parquet.ParquetWriter(self.path, self.schema)
+            else:
+                import pyarrow.ipc
+
+                self.writer = pyarrow.ipc.new_file(self.path, self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        """
+        Finishes the file (an empty one with just the header or schema if
+        nothing was written).
+        """
+        if self.writer is None and self.file is None:
+            self.write(empty_frame(self.columns))
+        if self.writer is not None:
+            self.writer.close()
+        if self.file is not None:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PortfolioTotals:
+    """
+    Running sums of predicted kWh per balancing portfolio and hour.
+    """
+
+    def __init__(self):
+        self.totals: Optional[DataFrame] = None
+
+    def add(self, predictions: DataFrame, portfolios: Sequence[Optional[str]]):
+        """
+        Args:
+            predictions: indexed by EAN code, columns are UTC hours (see
+                PredictionService.make_predictions_for_fleet)
+            portfolios: balancing portfolio of each row
+        """
+        keys = [unassigned_portfolio if p is None else p for p in portfolios]
+        # NaN (e.g. of inactive connections) counts as nothing ordered
+        sums = predictions.groupby(np.asarray(keys, dtype=object)).sum()
+        self.totals = sums if self.totals is None else self.totals.add(sums, fill_value=0.0)
+
+    def frame(self) -> DataFrame:
+        """
+        Returns:
+            long-format frame with columns balancing_portfolio, hour and kwh
+        """
+        if self.totals is None:
+            return empty_frame(order_columns)
+        totals = self.totals.rename_axis(index="balancing_portfolio", columns="hour")
+        return totals.stack().rename("kwh").reset_index()
+
+
+class OrderOutput:
+    """
+    Output stage of a fleet run: per-EAN predictions get written as they
+    arrive, portfolio totals once all of them did.
+    """
+
+    def __init__(self, predictions_path: Optional[str] = None, order_path: Optional[str] = None):
+        """
+        Args:
+            predictions_path: file for per-EAN predictions (not written if None)
+            order_path: file for totals per balancing portfolio and hour
+                (not written if None)
+        """
+        self.predictions = (
+            TableWriter(predictions_path, prediction_columns) if predictions_path else None
+        )
+        self.order_path = order_path
+        self.totals = PortfolioTotals()
+
+    def write(self, predictions: DataFrame, portfolios: Sequence[Optional[str]]):
+        """
+        Args:
+            predictions: indexed by EAN code, columns are UTC hours
+            portfolios: balancing portfolio of each row
+        """
+        if self.predictions is not None:
+            self.predictions.write(long_predictions(predictions, portfolios))
+        if self.order_path is not None:
+            self.totals.add(predictions, portfolios)
+
+    def close(self, write_order: bool = True):
+        """
+        Args:
+            write_order: False to not write an order of incomplete totals
+                (e.g. when predicting failed)
+        """
+        if self.predictions is not None:
+            self.predictions.close()
+        if self.order_path is not None and write_order:
+            with TableWriter(self.order_path, order_columns) as order:
+                order.write(self.totals.frame())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        self.close(write_order=exc_type is None)
+
+
+def empty_frame(columns: Dict[str, str]) -> DataFrame:
+    """
+    Args:
+        columns: column name -> type, see TableWriter
+    Returns:
+        frame without rows, with columns of the types (so that it fits the
+        schema of a writer)
+    """
+    empty = {
+        "string": lambda: np.array([], dtype=object),
+        "timestamp": lambda: DatetimeIndex([], tz="UTC"),
+        "float": lambda: np.array([], dtype=float),
+    }
+    return DataFrame({name: empty[column_type]() for name, column_type in columns.items()})
+
+
+def long_predictions(predictions: DataFrame, portfolios: Sequence[Optional[str]]) -> DataFrame:
+    """
+    Returns:
+        a row per EAN and hour with a prediction, with columns of
+        prediction_columns
+    """
+    values = predictions.to_numpy(dtype=float)
+    rows, columns = np.nonzero(~np.isnan(values))
+    return DataFrame(
+        {
+            "ean": np.asarray(predictions.index, dtype=object)[rows],
+            "balancing_portfolio": np.asarray(portfolios, dtype=object)[rows],
+            "hour": predictions.columns[columns],
+            "kwh": values[rows, columns],
+        }
+    )
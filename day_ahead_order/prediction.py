@@ -1,13 +1,27 @@
-import pytz
-from datetime import date, datetime
-
-from pandas import concat as df_concat, DataFrame, Series, date_range
-
-from grid_connection import GridConnection, PredictionType
-from historic_consumption_service import HistoricConsumptionService
-from solar_forecast import SolarForecastService
-from utils.datetime import get_prediction_range, last_weekday_before
-from utils.general import is_empty_series
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from pandas import DataFrame, DatetimeIndex, Index, Series, factorize
+
+from .connection_registry import ConnectionRegistry, activity_matrix, ean_codes_of
+from .grid_connection import GridConnection, PredictionType
+from .historic_consumption_service import HistoricConsumptionService
+from .history_selection import WeekdaySelector
+from .instrumentation import Metrics, null_metrics
+from .rolling_profile import RollingWeekdayProfiles
+from .solar_backcast import SolarBackcast
+from .solar_forecast import SolarForecastService
+from .utils.cache import CacheStats
+from .utils.datetime import (
+    default_timezone,
+    get_prediction_hours,
+    get_prediction_range,
+    last_weekday_before,
+    slots_per_day,
+)
+from .weekday_profile import masked_weekday_mean, profile_for_hours
 
 
 class PredictionService:
@@ -19,9 +33,35 @@ class PredictionService:
         self,
         solar_forecast_service: SolarForecastService,
         historic_consumption_service: HistoricConsumptionService,
+        weekday_profiles: Optional[RollingWeekdayProfiles] = None,
+        metrics: Optional[Metrics] = None,
+        weekday_selector: Optional[WeekdaySelector] = None,
     ):
+        """
+        Args:
+            solar_forecast_service:
+            historic_consumption_service:
+            weekday_profiles: precomputed profiles of regular connections,
+                used instead of fetching their history while up to date
+            metrics: to record stage timings and counts into
+                (see instrumentation), nothing gets recorded if None
+            weekday_selector: picks the past same weekdays to average
+                (see history_selection)
+        """
         self.solar_forecast_service = solar_forecast_service
         self.historic_consumption_service = historic_consumption_service
+        self.weekday_profiles = weekday_profiles
+        self.weekday_selector = WeekdaySelector() if weekday_selector is None else weekday_selector
+        self.metrics = null_metrics if metrics is None else metrics
+        self.solar_backcast = SolarBackcast(solar_forecast_service, metrics=self.metrics)
+
+        for cache, service in (
+            ("historic_consumption", historic_consumption_service),
+            ("solar_forecast", solar_forecast_service),
+        ):
+            stats = getattr(service, "stats", None)
+            if isinstance(stats, CacheStats):
+                self.metrics.watch_cache(cache, stats)
 
     def make_prediction_for_day(
         self, connection: GridConnection, prediction_day: date
@@ -54,6 +94,7 @@ class PredictionService:
         # TODO: clarify policy or assume it, documenting my assumptions!
         if prediction_day < today:
             # TODO: allow to cross-check predictions with past consumption records?
+            #   (fleets can be replayed over past periods, see backtest)
             #   -> yes: assert prediction_day falls within connection [active_from; active_until] date range
             #   -> no: raise ValueError("Prediction day should be in future")
             # )
@@ -61,6 +102,7 @@ class PredictionService:
 
         if prediction_day == today:
             # TODO: allow partial predictions? It would kind of make sense...
+            #   (fleets can be re-predicted during the day, see intraday)
             #   -> yes:
             #      - fill hours already passed with historical data (for regular; available for solar connections?)
             #      - predict future hours using:
@@ -86,31 +128,14 @@ class PredictionService:
             )
 
         elif connection.prediction_type == PredictionType.solar:
-            # TODO: extract to method
-            full_day = get_prediction_range(prediction_day)
-            predict_from, predict_to = full_day.tz_convert("UTC")
-
-            # returned series already indexed by hour (as expected in API contract)
-            return self.solar_forecast_service(
-                predict_from,
-                predict_to,
-                connection.latitude,
-                connection.longitude,
-                connection.solar_plane_declination,
-                connection.solar_plane_azimuth,
-                connection.solar_rated_power,
-            )
+            return self.predict_solar_production(prediction_day, connection)
 
         elif connection.prediction_type == PredictionType.mixed_solar_regular:
-            # As defined in epic:
-            # • Collect solar forecast data from last 4 weeks
-            # • Collect historic consumption values
-            #   ^ suggests to extract previous two conditional branches to methods or classes!
-            # • Subtract solar forecast from historic values
-            # • Use remainder to make prediction as is done in “Regular”
-            # • Do a separate “Solar” prediction (see previous slide)
-            # • Add the two for the resulting prediction
-            pass
+            return (
+                self.predict_mixed_fleet_consumption([connection], [prediction_day])
+                .iloc[0]
+                .rename(None)
+            )
 
         else:
             # TODO: include valid values of prediction_type in exception msg
@@ -131,6 +156,472 @@ class PredictionService:
         nothing = Series(dtype=float)
         return nothing
 
+    def make_predictions_for_fleet(
+        self, connections: Sequence[GridConnection], days: Sequence[date]
+    ) -> DataFrame:
+        """
+        Makes predictions for many grid connections over many days at once.
+
+        Connections are grouped by their PredictionType, so that inputs for
+        each group get fetched together and averaged for the whole group
+        instead of building one Series per (connection, day) pair.
+
+        Args:
+            connections: connections with unique EAN codes
+            days: calendar days in Netherlands
+
+        Returns:
+            a DataFrame indexed by EAN code, with one column per UTC hour of
+            all the days. Hours of days a connection is not active on
+            (or hours which could not be predicted) are left as NaN.
+        """
+        hours = fleet_hours(days)
+        ean_codes = Index(ean_codes_of(connections), name="ean")
+        predictions = DataFrame(np.nan, index=ean_codes, columns=hours)
+
+        for prediction_type, group in group_by_prediction_type(connections).items():
+            self.metrics.count(
+                "connections_predicted_total", len(group), prediction_type=prediction_type.name
+            )
+            group_predictions = self.predict_group(prediction_type, group, days)
+            predictions.loc[group_predictions.index, group_predictions.columns] = (
+                group_predictions
+            )
+
+        return predictions
+
+    def predict_group(
+        self,
+        prediction_type: PredictionType,
+        connections: Sequence[GridConnection],
+        days: Sequence[date],
+        history: Optional[Tuple[Sequence[date], np.ndarray]] = None,
+        anchors: Optional[Sequence[date]] = None,
+    ) -> DataFrame:
+        """
+        Predicts connections of one PredictionType over the days.
+
+        Args:
+            prediction_type:
+            connections: connections of the prediction type
+            days: calendar days in Netherlands
+            history: (historic days, hourly kWh) of the connections fetched
+                already (e.g. by a backtest), otherwise history gets fetched
+                for the group (see fetch_weekday_history)
+            anchors: day before which history gets selected for each day
+                (see WeekdaySelector.windows), today by default
+        Returns:
+            DataFrame indexed by EAN code, columns are UTC hours of all days
+        """
+        if prediction_type == PredictionType.regular:
+            if history is None and anchors is None:
+                return self.predict_regular_fleet_consumption(connections, days)
+            if history is None:
+                history = self.fetch_weekday_history(connections, days)
+            return self.average_weekday_history(connections, days, *history, anchors=anchors)
+        if prediction_type == PredictionType.solar:
+            return self.predict_solar_fleet_production(connections, days)
+        if prediction_type == PredictionType.mixed_solar_regular:
+            return self.predict_mixed_fleet_consumption(connections, days, history, anchors)
+        raise ValueError(
+            f"Unexpected value for GridConnection.prediction_type: {prediction_type}"
+        )
+
+    def make_prediction_for_range(
+        self,
+        connections: Union[GridConnection, Sequence[GridConnection]],
+        start_day: date,
+        n_days: int,
+    ) -> Union[Series, DataFrame]:
+        """
+        Makes predictions over a horizon of consecutive days (e.g. D+1 to
+        D+7 for weekend and holiday planning).
+
+        All the days get predicted together (see make_predictions_for_fleet):
+        history is fetched once for the union of weekday windows (which
+        stops growing after a week, as later days share weekdays with
+        earlier ones), each distinct window gets averaged once, and solar
+        forecasts are requested once per connection for the whole horizon.
+
+        Args:
+            connections: a connection, or connections with unique EAN codes
+            start_day: first calendar day in Netherlands to predict
+            n_days: number of days to predict
+        Returns:
+            for a single connection, a time series of hourly kWh indexed by
+            UTC hours of all the days; otherwise a DataFrame as returned
+            by make_predictions_for_fleet
+        """
+        if n_days < 1:
+            raise ValueError(f"Expected to predict at least one day, got n_days={n_days}")
+
+        days = days_between(start_day, start_day + timedelta(days=n_days - 1))
+        if isinstance(connections, GridConnection):
+            return self.make_predictions_for_fleet([connections], days).iloc[0].rename(None)
+        return self.make_predictions_for_fleet(connections, days)
+
+    def predict_regular_fleet_consumption(
+        self, connections: Sequence[GridConnection], days: Sequence[date]
+    ) -> DataFrame:
+        """
+        Same algorithm as predict_regular_connection_consumption, but for a
+        group of regular connections and several days at once.
+
+        History of all connections for the union of weekday windows is
+        fetched in one bulk request, lined up on local hour slots and
+        averaged for all connections and days in one pass
+        (see weekday_profile). Connections whose weekday_profiles hold
+        exactly the days the weekday selector would average skip fetching
+        and averaging altogether (see RollingWeekdayProfiles.selected_by).
+
+        Returns:
+            DataFrame indexed by EAN code, columns are UTC hours of all days
+        """
+        if self.weekday_profiles is None:
+            history_days, hourly = self.fetch_weekday_history(connections, days)
+            return self.average_weekday_history(connections, days, history_days, hourly)
+
+        ean_codes = ean_codes_of(connections)
+        with self.metrics.stage("averaging"):
+            means, day_counts, _ = self.weekday_profiles.means(ean_codes, days)
+            known = self.weekday_profiles.selected_by(self.weekday_selector, ean_codes, days)
+        if not known.all():
+            unknown = [connection for connection, held in zip(connections, known) if not held]
+            history_days, hourly = self.fetch_weekday_history(unknown, days)
+            with self.metrics.stage("averaging"):
+                means[~known], day_counts[~known] = masked_weekday_mean(
+                    hourly, self.weekday_selector.windows(hourly, history_days, days)
+                )
+
+        return self.weekday_predictions(connections, days, means, day_counts)
+
+    def predict_mixed_fleet_consumption(
+        self,
+        connections: Sequence[GridConnection],
+        days: Sequence[date],
+        history: Optional[Tuple[Sequence[date], np.ndarray]] = None,
+        anchors: Optional[Sequence[date]] = None,
+    ) -> DataFrame:
+        """
+        Algorithm as defined in epic:
+
+        • Collect solar forecast data from last 4 weeks
+        • Collect historic consumption values
+        • Subtract solar forecast from historic values
+        • Use remainder to make prediction as is done in “Regular”
+        • Do a separate “Solar” prediction
+        • Add the two for the resulting prediction
+
+        The 4 week solar backcast is requested once per connection and reused
+        by consecutive prediction days (see SolarBackcast); subtraction and
+        averaging happen on the same local hour slots as for regular
+        connections.
+
+        Args:
+            connections:
+            days:
+            history: see predict_group
+            anchors: see predict_group; the backcast then covers the weeks
+                before the last of the days instead of before today
+        Returns:
+            DataFrame indexed by EAN code, columns are UTC hours of all days
+        """
+        if history is None:
+            history = self.fetch_weekday_history(connections, days)
+        history_days, hourly = history
+        backcast_anchor = None if anchors is None else max(days)
+        with self.metrics.stage("solar_fetch"):
+            remainder = hourly - self.solar_backcast.hourly(
+                connections, history_days, backcast_anchor
+            )
+
+        regular_part = self.average_weekday_history(
+            connections,
+            days,
+            history_days,
+            hourly,
+            PredictionType.mixed_solar_regular,
+            averaged=remainder,
+            anchors=anchors,
+        )
+        return regular_part + self.predict_solar_fleet_production(connections, days)
+
+    def fetch_weekday_history(
+        self, connections: Sequence[GridConnection], days: Sequence[date]
+    ) -> Tuple[List[date], np.ndarray]:
+        """
+        Fetches history of all connections for the union of weekday windows
+        of all the days in one bulk request. Connections short of good days
+        to average there (holidays, metering gaps, see history_selection)
+        get the rest of the days in reach of the weekday selector fetched
+        in a second bulk request.
+
+        Returns:
+            - historic days in reach of the weekday selector (sorted)
+            - hourly kWh lined up on local hour slots, of shape
+              (connections, historic days, slots_per_day), see
+              HistoricConsumptionService.get_hourly_consumption; NaN for
+              days not fetched
+        """
+        history_days = self.reach_days(days)
+        first_choice = self.history_days(days)
+        hourly = np.full((len(connections), len(history_days), slots_per_day), np.nan)
+        hourly[:, Index(history_days).get_indexer(first_choice)] = self.fetch_hourly(
+            connections, first_choice
+        )
+
+        rows, rest = self.rest_of_history(connections, days, history_days, hourly)
+        if len(rows):
+            hourly[np.ix_(rows, Index(history_days).get_indexer(rest))] = self.fetch_hourly(
+                [connections[row] for row in rows], rest
+            )
+
+        return history_days, hourly
+
+    def rest_of_history(
+        self,
+        connections: Sequence[GridConnection],
+        days: Sequence[date],
+        history_days: Sequence[date],
+        hourly: np.ndarray,
+    ) -> Tuple[np.ndarray, List[date]]:
+        """
+        Args:
+            connections:
+            days: prediction days
+            history_days: see reach_days
+            hourly: history of the first choice days (see history_days),
+                NaN elsewhere
+        Returns:
+            - rows of connections short of good days (see
+              WeekdaySelector.short_of_days) and active on some of the rest
+              of the days
+            - the rest of the days in reach (sorted), to fetch for them
+        """
+        rest = sorted(set(history_days) - set(self.history_days(days)))
+        rows = np.flatnonzero(self.weekday_selector.short_of_days(hourly, history_days, days))
+        if not rest or not len(rows):
+            return rows[:0], rest
+        rows = rows[activity_matrix([connections[row] for row in rows], rest).any(axis=1)]
+        return rows, rest
+
+    def fetch_hourly(
+        self, connections: Sequence[GridConnection], history_days: Sequence[date]
+    ) -> np.ndarray:
+        """
+        Returns:
+            hourly kWh of the connections on the days, NaN on days they were
+            not active on (see HistoricConsumptionService.get_hourly_consumption)
+        """
+        self.metrics.count("service_requests_total", service="historic_consumption")
+        with self.metrics.stage("historic_fetch"):
+            hourly = self.historic_consumption_service.get_hourly_consumption(
+                connections, history_days
+            )
+        # No historical data is assumed for days the connection was not active on
+        hourly[~activity_matrix(connections, history_days)] = np.nan
+        return hourly
+
+    def history_days(self, days: Sequence[date]) -> List[date]:
+        """
+        Returns:
+            sorted union of past same weekdays to average for all the days,
+            unless the history of a connection has anomalies there (see
+            WeekdaySelector.first_choice_days)
+        """
+        return self.weekday_selector.first_choice_days(days)
+
+    def reach_days(self, days: Sequence[date]) -> List[date]:
+        """
+        Returns:
+            sorted union of past same weekdays which may get averaged for
+            all the days (see WeekdaySelector.reach_days)
+        """
+        return self.weekday_selector.reach_days(days)
+
+    def average_weekday_history(
+        self,
+        connections: Sequence[GridConnection],
+        days: Sequence[date],
+        history_days: Sequence[date],
+        hourly: np.ndarray,
+        prediction_type: PredictionType = PredictionType.regular,
+        averaged: Optional[np.ndarray] = None,
+        anchors: Optional[Sequence[date]] = None,
+    ) -> DataFrame:
+        """
+        Averages hourly history of the past same weekdays of each day
+        (see fetch_weekday_history) for all connections in one pass.
+
+        Args:
+            connections:
+            days:
+            history_days:
+            hourly: history the weekday selector picks the days to average by
+            prediction_type:
+            averaged: values to average instead of hourly, of the same shape
+                (e.g. consumption without the solar backcast)
+            anchors: see WeekdaySelector.windows
+        Returns:
+            DataFrame indexed by EAN code, columns are UTC hours of all days
+        """
+        with self.metrics.stage("averaging"):
+            windows = self.weekday_selector.windows(hourly, history_days, days, anchors)
+            means, day_counts = masked_weekday_mean(
+                hourly if averaged is None else averaged, windows
+            )
+        return self.weekday_predictions(connections, days, means, day_counts, prediction_type)
+
+    def weekday_predictions(
+        self,
+        connections: Sequence[GridConnection],
+        days: Sequence[date],
+        means: np.ndarray,
+        day_counts: np.ndarray,
+        prediction_type: PredictionType = PredictionType.regular,
+    ) -> DataFrame:
+        """
+        Args:
+            connections:
+            days: prediction days
+            means: kWh of shape (connections, days, slots_per_day) averaged
+                over past same weekdays of each day
+            day_counts: (connections, days) number of past weekdays averaged
+            prediction_type: of the connections (to label metrics with)
+        Returns:
+            DataFrame indexed by EAN code, columns are UTC hours of all days
+        """
+        with self.metrics.stage("resampling"):
+            predictions = self.resample_weekday_means(connections, days, means, day_counts)
+
+        if self.metrics.enabled:
+            self.count_fallback_tiers(connections, days, day_counts, prediction_type)
+        return predictions
+
+    def resample_weekday_means(
+        self,
+        connections: Sequence[GridConnection],
+        days: Sequence[date],
+        means: np.ndarray,
+        day_counts: np.ndarray,
+    ) -> DataFrame:
+        """
+        Picks weekday means (on local hour slots) for the UTC hours of the
+        days, falling back to the yearly average (see weekday_predictions).
+        """
+        avg_hourly = np.array([self.avg_hourly_consumption(c) for c in connections])
+        active = activity_matrix(connections, days)
+        hours = fleet_hours(days)
+        day_positions = hour_day_positions(hours, days)
+
+        values = profile_for_hours(means, day_positions, hours)
+        # (1) & (2) are covered by the masked mean over as many of the
+        # last weekdays as have data. (3) If there are none at all, or
+        # some hour is not covered by any of them, use average yearly value.
+        values[(day_counts == 0)[:, day_positions]] = np.nan
+        values = np.where(np.isnan(values), avg_hourly[:, np.newaxis], values)
+        values[~active[:, day_positions]] = np.nan
+
+        return DataFrame(
+            values, index=Index(ean_codes_of(connections), name="ean"), columns=hours
+        )
+
+    def count_fallback_tiers(
+        self,
+        connections: Sequence[GridConnection],
+        days: Sequence[date],
+        day_counts: np.ndarray,
+        prediction_type: PredictionType,
+    ):
+        """
+        Counts (active connection, day) pairs predicted from all of the
+        weekdays the selector averages, from fewer of them, or from the
+        yearly average.
+        """
+        active = activity_matrix(connections, days)
+        counted = day_counts[active]
+        weekdays = self.weekday_selector.weekdays
+        tiers = (
+            ("weekdays", int((counted >= weekdays).sum())),
+            ("fewer_weekdays", int(((counted > 0) & (counted < weekdays)).sum())),
+            ("yearly_average", int((counted == 0).sum())),
+        )
+        for tier, count in tiers:
+            self.metrics.count(
+                "fallback_tier_total", count, prediction_type=prediction_type.name, tier=tier
+            )
+
+    def predict_solar_production(
+        self, prediction_day: date, connection: GridConnection
+    ) -> Series:
+        """
+        Returns:
+            solar forecast for the connection, already indexed by UTC hour
+            (as expected in API contract)
+        """
+        return self.predict_solar_production_between(prediction_day, prediction_day, connection)
+
+    def predict_solar_production_between(
+        self, first_day: date, last_day: date, connection: GridConnection
+    ) -> Series:
+        """
+        Returns:
+            solar forecast for the connection over the days (inclusive),
+            requested at once and indexed by UTC hour
+        """
+        predict_from, _ = get_prediction_range(first_day)
+        _, predict_to = get_prediction_range(last_day)
+
+        self.metrics.count("service_requests_total", service="solar_forecast")
+        return self.solar_forecast_service.predict(
+            predict_from,
+            predict_to,
+            connection.latitude,
+            connection.longitude,
+            connection.solar_plane_declination,
+            connection.solar_plane_azimuth,
+            connection.solar_rated_power,
+        )
+
+    def predict_solar_fleet_production(
+        self, connections: Sequence[GridConnection], days: Sequence[date]
+    ) -> DataFrame:
+        """
+        Returns:
+            DataFrame indexed by EAN code, columns are UTC hours of all days
+        """
+        with self.metrics.stage("solar_fetch"):
+            return self.solar_fleet_production(connections, days)
+
+    def solar_fleet_production(
+        self, connections: Sequence[GridConnection], days: Sequence[date]
+    ) -> DataFrame:
+        """
+        Requests the forecast of each run of consecutive days a connection
+        is active on at once (e.g. a whole horizon), instead of day by day.
+        """
+        days = sorted(set(days))
+        hours = fleet_hours(days)
+        values = np.full((len(connections), len(hours)), np.nan)
+        active = activity_matrix(connections, days)
+        # positions in hours of each run of days
+        run_columns: Dict[Tuple[date, date], np.ndarray] = {}
+
+        for row, connection in enumerate(connections):
+            active_days = [day for day, is_active in zip(days, active[row]) if is_active]
+            for first_day, last_day in consecutive_runs(active_days):
+                columns = run_columns.get((first_day, last_day))
+                if columns is None:
+                    columns = run_columns[(first_day, last_day)] = hours.get_indexer(
+                        fleet_hours(days_between(first_day, last_day))
+                    )
+                forecast = self.predict_solar_production_between(first_day, last_day, connection)
+                values[row, columns] = forecast.reindex(hours[columns]).to_numpy()
+
+        return DataFrame(
+            values, index=Index(ean_codes_of(connections), name="ean"), columns=hours
+        )
+
     def predict_regular_connection_consumption(
         self, prediction_day: date, connection: GridConnection
     ) -> Series:
@@ -143,80 +634,10 @@ class PredictionService:
             (2) If not available, use as many Mondays as available)
             (3) If no Mondays are present at all, use average yearly value (from GridConnection)
         """
-
-        # TODO: Refactor me, please!
-
-        # TODO: preconditions
-        # - if connection has active_from: ensure we do not request
-        #       historical weekday consumption before that
-        # - if connection has active_until:
-        #       - if connection expired before last weekday_of(prediction_day):
-        #           -> skip (1) and begin with (2), beginning from last weekday_of(prediction_day) before connection.active_until
-
-        # (1) attempt to average hourly historical consumption from last 3
-        #     weekdays the prediction_day falls in.
-        last_weekday = last_weekday_before(prediction_day.weekday())
-        last_3_weeks = [
-            last_weekday - timedelta(weeks=weeks_ago) for weeks_ago in range(3)
-        ]
-
-        # FIXME: Intuition suggests a data frame with one of axes consisting of
-        #   hourly periods (not anchored to date?) - but of the same hourly periods
-        #   as the prediction_day contains, as there could be 23 to 25 data points,
-        #   based on DST state of the day.
-        #
-        #   Other axis - labelled by...naive date the historical sample was taken from?
-        #   and consisting of hourly consumption for that day?
-        avg_consumption = DataFrame()
-
-        for day in last_3_weeks:
-            if not connection.is_active_on(day):
-                # TODO: recheck the assumption by Artūrs that there would be
-                #   no historical data for days when connection contract was
-                #   not active (yet or anymore)?
-                continue
-
-            time_start, time_end = get_prediction_range(day)
-
-            # Historical data gets sampled at granuality of 15 minutes.
-            # We are looking for hourly consumption:
-            hourly_consumption = (
-                self.historic_consumption_service.get_consumption(
-                    connection, time_start, time_end
-                )
-                .resample("1h")
-                .sum()
-            )
-
-            if is_empty_series(hourly_consumption):
-                continue
-
-            # TODO: append to avg_consumption in a way that the data points
-            #   could afterwards be averaged by hour
-            #   using:
-            #   (?) avg_consumption.groupby(...hourly component of all data points...).mean()
-
-        # TODO:
-        # if avg_consumption contains exactly 3 entries:
-        #    - group avg_consumption by hourly component of all data points
-        #    - avg_hourly_consumption =
-        #        average the values within each hourly group (.mean())
-        #    - build a new Series, indexed by hours in prediction_day, expfressed in UTC:
-        #        predict_from, predict_to = get_prediction_range(day)
-        #        hours = date_range(predict_from, predict_to, freq="1h")
-        #        return Series(index=hours, data=avg_hourly_consumption)
-        #
-        #       NOTE: [split-apply-combine](https://pandas.pydata.org/pandas-docs/stable/user_guide/groupby.html#group-by-split-apply-combine)
-        #
-        # else:
-        #    try as many weekdays as available of prediction_day.weekday() withing data period
-        #    from connection.active_from to earliest_of(connection.active_from, date.today())
-        #    (?) impose a sane limit on number of historical days to query for?
-
-        # Fall back to roughly approximating hourly production/consumption
-        # based upon avg yearly consumption for the grid connection in question.
-        return self.approximate_yearly_consumption_as_prediction(
-            connection, prediction_day
+        return (
+            self.predict_regular_fleet_consumption([connection], [prediction_day])
+            .iloc[0]
+            .rename(None)
         )
 
     def approximate_yearly_consumption_as_prediction(
@@ -225,8 +646,7 @@ class PredictionService:
         """
         Given a grid connection with a known annual consumption
         """
-        predict_from, predict_to = get_prediction_range(prediction_day)
-        hours = date_range(predict_from, predict_to, freq="1h")
+        hours = get_prediction_hours(prediction_day)
 
         avg_kwh_per_hour = self.avg_hourly_consumption(connection)
         return Series(index=hours, data=avg_kwh_per_hour)
@@ -249,3 +669,72 @@ class PredictionService:
         # NOTE: we assume that standard_yearly_consumption would contain zero
         #   if annual consumption is not known (yet) instead None or NaN
         return connection.standard_yearly_consumption / hours_per_year
+
+
+def group_by_prediction_type(
+    connections: Sequence[GridConnection],
+) -> Dict[PredictionType, List[GridConnection]]:
+    """
+    Returns:
+        connections grouped by their prediction type, in original order
+    """
+    if isinstance(connections, ConnectionRegistry):
+        return defaultdict(list, connections.group_by_prediction_type())
+
+    groups = defaultdict(list)
+    for connection in connections:
+        groups[connection.prediction_type].append(connection)
+    return groups
+
+
+def days_between(first_day: date, last_day: date) -> List[date]:
+    """
+    Returns:
+        consecutive days from first_day to last_day (inclusive)
+    """
+    return [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+
+
+def consecutive_runs(days: Sequence[date]) -> List[Tuple[date, date]]:
+    """
+    Returns:
+        (first, last) day of each run of consecutive days among the days
+    """
+    runs: List[Tuple[date, date]] = []
+    for day in sorted(set(days)):
+        if runs and day - runs[-1][1] == timedelta(days=1):
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+
+def hour_day_positions(hours: DatetimeIndex, days: Sequence[date]) -> np.ndarray:
+    """
+    Returns:
+        position in days of the local calendar day each UTC hour falls on
+    """
+    positions = {day: position for position, day in enumerate(days)}
+    local_days, hour_days = factorize(hours.tz_convert(default_timezone).date)
+    return np.array([positions[day] for day in hour_days], dtype=np.int64)[local_days]
+
+
+def last_weekdays_before(weekday: int, count: int, anchor: Optional[date] = None) -> List[date]:
+    """
+    Returns:
+        last `count` dates falling on the weekday before the anchor (today
+        by default), most recent first
+    """
+    last_weekday = last_weekday_before(weekday, anchor)
+    return [last_weekday - timedelta(weeks=weeks_ago) for weeks_ago in range(count)]
+
+
+def fleet_hours(days: Sequence[date]) -> DatetimeIndex:
+    """
+    Returns:
+        sorted UTC hours of all the given calendar days
+    """
+    hours = [get_prediction_hours(day) for day in sorted(set(days))]
+    if not hours:
+        return DatetimeIndex([], tz="UTC")
+    return hours[0].append(hours[1:])
@@ -0,0 +1,274 @@
+"""
+Incrementally maintained weekday profiles of regular connections.
+
+The regular algorithm averages the last 3 same weekdays. Every day only one
+new week enters that window and one old week drops out, so instead of
+refetching 3 days of 15 minute data per connection for every prediction,
+running sums and counts per (EAN, weekday, local hour slot) get updated as
+new metering data arrives. The hourly values of the days within the window
+are kept as well, so that late corrections of a day only rebuild the
+profile of its (EAN, weekday).
+
+Profiles of an EAN only stand in for its fetched history while they hold
+exactly the days the weekday selector would average (see selected_by):
+EANs not updated lately, or holding a holiday or a day with a metering
+anomaly, get their history fetched instead.
+"""
+
+from datetime import date, timedelta
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .connection_registry import ean_codes_of
+from .grid_connection import GridConnection
+from .historic_consumption_service import HistoricConsumptionService
+from .history_selection import WeekdaySelector
+from .utils.datetime import last_weekday_before, slots_per_day
+
+default_weeks = 3
+not_a_day = np.datetime64("NaT", "D")
+
+
+class RollingWeekdayProfiles:
+    """
+    Per EAN and weekday: hourly kWh (on local hour slots) of the last
+    `weeks` same weekdays, with their running sums and counts.
+    """
+
+    def __init__(self, weeks: int = default_weeks):
+        self.weeks = weeks
+        self.positions: Dict[str, int] = {}
+        # (EANs) last day of metering data each EAN got updated with
+        self.updated = np.full(0, not_a_day)
+        # (EANs, weekdays, weeks) days held, NaT for free places
+        self.days = np.full((0, 7, weeks), not_a_day)
+        # (EANs, weekdays, weeks, slots) hourly kWh of the days held
+        self.hourly = np.full((0, 7, weeks, slots_per_day), np.nan, dtype=np.float32)
+        # (EANs, weekdays, slots) running sums and counts over the days held
+        self.sums = np.zeros((0, 7, slots_per_day))
+        self.counts = np.zeros((0, 7, slots_per_day), dtype=np.int16)
+
+    def rows_of(self, ean_codes: Sequence[str]) -> np.ndarray:
+        """
+        Returns:
+            rows of the EANs, adding rows for EANs not seen before
+        """
+        new = [ean for ean in dict.fromkeys(ean_codes) if ean not in self.positions]
+        if new:
+            for ean in new:
+                self.positions[ean] = len(self.positions)
+            count = len(new)
+            self.updated = np.concatenate([self.updated, np.full(count, not_a_day)])
+            self.days = np.concatenate([self.days, np.full((count, 7, self.weeks), not_a_day)])
+            self.hourly = np.concatenate(
+                [
+                    self.hourly,
+                    np.full((count, 7, self.weeks, slots_per_day), np.nan, dtype=np.float32),
+                ]
+            )
+            self.sums = np.concatenate([self.sums, np.zeros((count, 7, slots_per_day))])
+            self.counts = np.concatenate(
+                [self.counts, np.zeros((count, 7, slots_per_day), dtype=np.int16)]
+            )
+        return np.array([self.positions[ean] for ean in ean_codes], dtype=np.int64)
+
+    def update(self, ean_codes: Sequence[str], day: date, hourly: np.ndarray):
+        """
+        Adds a day of metering data, dropping the oldest same weekday out
+        of the window. A day already within the window (a late correction)
+        replaces its earlier values; days older than the window are ignored.
+
+        Args:
+            ean_codes:
+            day: local calendar day
+            hourly: kWh of shape (EANs, slots_per_day), NaN where missing
+        """
+        rows = self.rows_of(ean_codes)
+        weekday = day.weekday()
+        day64 = np.datetime64(day, "D")
+        held = self.days[rows, weekday]
+
+        updated = self.updated[rows]
+        self.updated[rows] = np.where(np.isnat(updated) | (updated < day64), day64, updated)
+
+        corrected = (held == day64).any(axis=1)
+        if corrected.any():
+            self.correct(rows[corrected], weekday, day64, hourly[corrected])
+
+        # place of the oldest day held (free places are the oldest)
+        oldest = np.argmin(np.where(np.isnat(held), np.datetime64(0, "D"), held), axis=1)
+        oldest_days = held[np.arange(len(rows)), oldest]
+        newer = ~corrected & (np.isnat(oldest_days) | (oldest_days < day64))
+
+        rows, oldest, new_values = rows[newer], oldest[newer], hourly[newer]
+        old_values = self.hourly[rows, weekday, oldest]
+
+        self.sums[rows, weekday] += np.nan_to_num(new_values) - np.nan_to_num(old_values)
+        self.counts[rows, weekday] += (~np.isnan(new_values)).astype(np.int16)
+        self.counts[rows, weekday] -= (~np.isnan(old_values)).astype(np.int16)
+        self.hourly[rows, weekday, oldest] = new_values
+        self.days[rows, weekday, oldest] = day64
+
+    @property
+    def as_of(self) -> Optional[date]:
+        """
+        Last day of metering data all EANs got updated with.
+        """
+        if not len(self.updated) or np.isnat(self.updated).any():
+            return None
+        return self.updated.min().item()
+
+    def correct(self, rows: np.ndarray, weekday: int, day64: np.datetime64, hourly: np.ndarray):
+        """
+        Replaces values of a day within the window and rebuilds the
+        profiles of only the affected (EAN, weekday) pairs.
+        """
+        places = np.argmax(self.days[rows, weekday] == day64, axis=1)
+        self.hourly[rows, weekday, places] = hourly
+
+        held = self.hourly[rows, weekday]
+        self.sums[rows, weekday] = np.nansum(held, axis=1)
+        self.counts[rows, weekday] = (~np.isnan(held)).sum(axis=1)
+
+    def update_from(
+        self,
+        service: HistoricConsumptionService,
+        connections: Sequence[GridConnection],
+        day: date,
+    ):
+        """
+        Fetches a day of metering data of the connections and adds it
+        (see update).
+        """
+        hourly = service.get_hourly_consumption(connections, [day])[:, 0]
+        self.update(ean_codes_of(connections), day, hourly)
+
+    def is_current(self) -> bool:
+        """
+        Returns:
+            whether the profiles of all EANs hold data up to yesterday, so
+            that they match the windows of past weekdays as of today
+        """
+        return self.as_of is not None and self.as_of >= date.today() - timedelta(days=1)
+
+    def current(self, ean_codes: Sequence[str]) -> np.ndarray:
+        """
+        Returns:
+            (EANs) whether profiles of the EAN are held and hold data up to
+            yesterday
+        """
+        known, rows = self.known_rows(ean_codes)
+        if not self.positions:
+            return known
+        updated = self.updated[rows]
+        yesterday = np.datetime64(date.today() - timedelta(days=1), "D")
+        return known & ~np.isnat(updated) & (updated >= yesterday)
+
+    def selected_by(
+        self, selector: WeekdaySelector, ean_codes: Sequence[str], days: Sequence[date]
+    ) -> np.ndarray:
+        """
+        Args:
+            selector: selection of the days averaged from fetched history
+            ean_codes:
+            days: prediction days
+        Returns:
+            (EANs) whether, for the weekdays of all the days, the EAN holds
+            the very days the selector would average as of today: the last
+            same weekdays, none of them skipped (a holiday or a metering
+            anomaly) - so that its means match predictions from fetched
+            history
+        """
+        selected = self.current(ean_codes)
+        if selector.weekdays != self.weeks:
+            selected[:] = False
+        if not selected.any():
+            return selected
+
+        _, rows = self.known_rows(ean_codes)
+        for weekday in {day.weekday() for day in days}:
+            last = last_weekday_before(weekday)
+            expected = [last - timedelta(weeks=weeks) for weeks in reversed(range(self.weeks))]
+            held = self.days[rows, weekday]
+            order = np.argsort(held, axis=1)
+            held = np.take_along_axis(held, order, axis=1)
+            hourly = np.take_along_axis(
+                self.hourly[rows, weekday], order[..., np.newaxis], axis=1
+            ).astype(float)
+            selected &= (held == np.array(expected, dtype="datetime64[D]")).all(axis=1)
+            selected &= selector.good_days(hourly, expected).all(axis=1)
+        return selected
+
+    def means(
+        self, ean_codes: Sequence[str], days: Sequence[date]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Args:
+            ean_codes:
+            days: prediction days
+        Returns:
+            - mean kWh of shape (EANs, days, slots_per_day) over the same
+              weekdays held, NaN for slots without data
+            - (EANs, days) number of same weekdays with any data
+            - (EANs) whether profiles of the EAN are held at all
+        """
+        known, rows = self.known_rows(ean_codes)
+        weekdays = np.array([day.weekday() for day in days], dtype=np.int64)
+
+        sums = self.sums[rows[:, np.newaxis], weekdays[np.newaxis, :]]
+        counts = self.counts[rows[:, np.newaxis], weekdays[np.newaxis, :]]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(counts > 0, sums / counts, np.nan)
+
+        held = self.hourly[rows[:, np.newaxis], weekdays[np.newaxis, :]]
+        day_counts = (~np.isnan(held)).any(axis=3).sum(axis=2)
+
+        means[~known] = np.nan
+        day_counts[~known] = 0
+        return means, day_counts, known
+
+    def known_rows(self, ean_codes: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            - (EANs) whether profiles of the EAN are held
+            - rows of the EANs (0 for those not held)
+        """
+        known = np.array([ean in self.positions for ean in ean_codes], dtype=bool)
+        rows = np.array([self.positions.get(ean, 0) for ean in ean_codes], dtype=np.int64)
+        return known, rows
+
+    def save(self, path: str):
+        """
+        Persists the profiles (as .npz) to be loaded by the next run.
+        """
+        ean_codes = np.empty(len(self.positions), dtype=object)
+        for ean, row in self.positions.items():
+            ean_codes[row] = ean
+
+        np.savez(
+            path,
+            ean_codes=ean_codes.astype(str),
+            weeks=self.weeks,
+            updated=self.updated,
+            days=self.days,
+            hourly=self.hourly,
+            sums=self.sums,
+            counts=self.counts,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "RollingWeekdayProfiles":
+        with np.load(path) as stored:
+            profiles = cls(int(stored["weeks"]))
+            profiles.positions = {str(ean): row for row, ean in enumerate(stored["ean_codes"])}
+            if "updated" in stored:
+                profiles.updated = stored["updated"]
+            else:
+                # saved before updates got tracked per EAN
+                profiles.updated = np.full(len(profiles.positions), stored["as_of"])
+            profiles.days = stored["days"]
+            profiles.hourly = stored["hourly"]
+            profiles.sums = stored["sums"]
+            profiles.counts = stored["counts"]
+        return profiles
@@ -0,0 +1,132 @@
+"""
+Runs fleet predictions in chunks, in process or sharded across a pool of
+worker processes (each with its own PredictionService), streaming
+per-chunk results back as they finish.
+"""
+
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import date
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Set
+
+from pandas import DataFrame, Index, concat
+
+from .connection_registry import ean_codes_of
+from .consumption_cache import CachingHistoricConsumptionService
+from .consumption_coalescing import CoalescingHistoricConsumptionService
+from .grid_connection import GridConnection
+from .historic_consumption_service import HistoricConsumptionService
+from .instrumentation import Metrics
+from .prediction import PredictionService, fleet_hours
+from .solar_forecast import SolarForecastService
+from .solar_forecast_cache import CachedSolarForecastService
+from .solar_forecast_coalescing import CoalescingSolarForecastService
+
+default_chunk_size = 1000
+# Below this, starting worker processes costs more than it saves.
+min_parallel_connections = 5000
+
+# PredictionService of a worker process (see init_worker)
+worker_prediction_service: Optional[PredictionService] = None
+
+
+def default_prediction_service(metrics: Optional[Metrics] = None) -> PredictionService:
+    """
+    Returns:
+        PredictionService with caching services, caching historic
+        consumption on disk if DAY_AHEAD_ORDER_CACHE_DIR is set, and
+        coalescing concurrent cache misses
+    """
+    return PredictionService(
+        CachedSolarForecastService(CoalescingSolarForecastService(SolarForecastService())),
+        CachingHistoricConsumptionService(
+            CoalescingHistoricConsumptionService(HistoricConsumptionService()),
+            cache_dir=os.environ.get("DAY_AHEAD_ORDER_CACHE_DIR"),
+        ),
+        metrics=metrics,
+    )
+
+
+def init_worker(service_factory: Callable[[], PredictionService]):
+    global worker_prediction_service
+    worker_prediction_service = service_factory()
+
+
+def predict_chunk(connections: Sequence[GridConnection], days: Sequence[date]) -> DataFrame:
+    return worker_prediction_service.make_predictions_for_fleet(connections, days)
+
+
+def chunked(
+    connections: Iterable[GridConnection], chunk_size: int = default_chunk_size
+) -> Iterator[List[GridConnection]]:
+    iterator = iter(connections)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def predict_chunks(
+    chunks: Iterable[Sequence[GridConnection]],
+    days: Sequence[date],
+    workers: int = 1,
+    service_factory: Callable[[], PredictionService] = default_prediction_service,
+) -> Iterator[DataFrame]:
+    """
+    Predicts chunks of connections (see PredictionService.make_predictions_for_fleet).
+
+    Args:
+        chunks: lazily consumed - at most 2 chunks per worker are in flight
+        days:
+        workers: number of worker processes, 1 to predict in this process
+        service_factory: creates the PredictionService (once per worker);
+            has to be picklable (e.g. a module-level function)
+    Yields:
+        predictions of each chunk, in order of completion
+    """
+    if workers <= 1:
+        prediction_service = service_factory()
+        for chunk in chunks:
+            yield prediction_service.make_predictions_for_fleet(chunk, days)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(service_factory,)
+    ) as executor:
+        in_flight: Set[Future] = set()
+        for chunk in chunks:
+            if len(in_flight) >= 2 * workers:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            in_flight.add(executor.submit(predict_chunk, chunk, days))
+
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def predict_fleet(
+    connections: Sequence[GridConnection],
+    days: Sequence[date],
+    workers: int = 1,
+    chunk_size: int = default_chunk_size,
+    service_factory: Callable[[], PredictionService] = default_prediction_service,
+) -> DataFrame:
+    """
+    Same as PredictionService.make_predictions_for_fleet, but sharded across
+    worker processes for fleets of at least min_parallel_connections.
+    """
+    if len(connections) < min_parallel_connections:
+        workers = 1
+
+    predictions = list(
+        predict_chunks(chunked(connections, chunk_size), days, workers, service_factory)
+    )
+    if not predictions:
+        return DataFrame(columns=fleet_hours(days), dtype=float)
+
+    return concat(predictions).reindex(Index(ean_codes_of(connections), name="ean"))
@@ -0,0 +1,491 @@
+"""
+Long-running prediction server keeping PredictionService, its caches and
+the connection registry warm between requests.
+
+Predictions get served over HTTP on a local TCP port or a Unix socket:
+
+    GET  /health
+    GET  /metrics
+    GET  /connections/<EAN>/prediction?start=YYYY-MM-DD&days=N
+    POST /predictions   {"eans": [...], "start": "YYYY-MM-DD", "days": N}
+
+start defaults to tomorrow and days to default_days (at most max_days),
+invalid values get answered with 400 Bad Request (failures of predicting
+itself with 500 Internal Server Error, logged); a POST without eans
+predicts all connections of the registry. Hours are UTC, kWh values are
+null where not predicted.
+
+Requests are handled by threads, but predicted by a single batcher thread
+(so PredictionService never runs concurrently): requests arriving while a
+batch is being predicted (or within the linger) get predicted together,
+with one make_prediction_for_range call per (start, days) over the union
+of their connections.
+"""
+
+import json
+import logging
+import os
+import socket
+import stat
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from datetime import date, timedelta
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import BaseServer, ThreadingMixIn, UnixStreamServer
+from threading import Condition, Thread
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from pandas import DataFrame, concat
+
+from .connection_registry import ConnectionRegistry
+from .prediction import PredictionService
+from .runner import default_chunk_size
+
+# Number of days predicted when a request does not say.
+default_days = 2
+# Most days a request may ask for, so that no request holds up the
+# batcher (and every request batched with it) for long.
+max_days = 31
+# Seconds the batcher waits for more requests before predicting a batch.
+default_linger = 0.002
+
+logger = logging.getLogger(__name__)
+
+
+class PendingPrediction:
+    """
+    Prediction a request waits for.
+    """
+
+    def __init__(self, positions: np.ndarray, start_day: date, n_days: int):
+        """
+        Args:
+            positions: positions of the connections in the registry
+            start_day:
+            n_days:
+        """
+        self.positions = positions
+        self.start_day = start_day
+        self.n_days = n_days
+        self.future: "Future[DataFrame]" = Future()
+
+
+class PredictionBatcher:
+    """
+    Predicts requests of concurrent callers in batches, on a thread of its
+    own (see module docs).
+    """
+
+    def __init__(
+        self,
+        prediction_service: PredictionService,
+        registry: ConnectionRegistry,
+        linger: float = default_linger,
+        chunk_size: int = default_chunk_size,
+    ):
+        """
+        Args:
+            prediction_service:
+            registry: connections requests refer to
+            linger: (seconds) a batch waits for more requests to join it
+            chunk_size: max number of connections predicted at once
+        """
+        self.prediction_service = prediction_service
+        self.registry = registry
+        self.linger = linger
+        self.chunk_size = chunk_size
+        self.pending: List[PendingPrediction] = []
+        self.closed = False
+        self.condition = Condition()
+        self.thread = Thread(target=self.run, name="prediction-batcher", daemon=True)
+        self.thread.start()
+
+    def predict(self, positions: np.ndarray, start_day: date, n_days: int) -> DataFrame:
+        """
+        Args:
+            positions: positions of the connections in the registry
+            start_day: first calendar day in Netherlands to predict
+            n_days: number of days to predict
+        Returns:
+            DataFrame indexed by EAN code (in order of the positions),
+            columns are UTC hours of all days
+            (see PredictionService.make_prediction_for_range)
+        """
+        if n_days < 1:
+            raise ValueError(f"Expected to predict at least one day, got n_days={n_days}")
+
+        pending = PendingPrediction(np.asarray(positions, dtype=np.int64), start_day, n_days)
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Prediction batcher is closed")
+            self.pending.append(pending)
+            self.condition.notify()
+        return pending.future.result()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+            if self.linger:
+                time.sleep(self.linger)
+            with self.condition:
+                batch, self.pending = self.pending, []
+            # whatever goes wrong, the thread keeps serving and no request
+            # is left waiting
+            try:
+                self.predict_batch(batch)
+            except BaseException as error:
+                fail(batch, error)
+
+    def predict_batch(self, batch: Sequence[PendingPrediction]):
+        """
+        Predicts the union of connections of requests with the same days
+        at once and hands each request its rows.
+        """
+        metrics = self.prediction_service.metrics
+        metrics.count("server_batches_total")
+        metrics.count("server_batched_requests_total", len(batch))
+
+        groups: Dict[Tuple[date, int], List[PendingPrediction]] = defaultdict(list)
+        for pending in batch:
+            groups[(pending.start_day, pending.n_days)].append(pending)
+
+        for (start_day, n_days), group in groups.items():
+            try:
+                positions = np.unique(np.concatenate([pending.positions for pending in group]))
+                with metrics.stage("server_batch"):
+                    predictions = self.predict_positions(positions, start_day, n_days)
+                for pending in group:
+                    pending.future.set_result(
+                        predictions.iloc[np.searchsorted(positions, pending.positions)]
+                    )
+            except BaseException as error:
+                fail(group, error)
+
+    def predict_positions(self, positions: np.ndarray, start_day: date, n_days: int) -> DataFrame:
+        """
+        Returns:
+            predictions of the connections at the (sorted, unique)
+            positions, in their order
+        """
+        connections = self.registry.take(positions)
+        return concat(
+            [
+                self.prediction_service.make_prediction_for_range(
+                    connections[i : i + self.chunk_size], start_day, n_days
+                )
+                for i in range(0, max(len(connections), 1), self.chunk_size)
+            ]
+        )
+
+    def close(self):
+        """
+        Predicts requests still pending and stops the batcher thread.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+
+
+def fail(batch: Sequence[PendingPrediction], error: BaseException):
+    """
+    Hands the error to requests of the batch not answered yet.
+    """
+    for pending in batch:
+        if not pending.future.done():
+            pending.future.set_exception(error)
+
+
+class RequestError(Exception):
+    """
+    Request which cannot be answered, reported to the client with its
+    HTTP status.
+    """
+
+    def __init__(self, status: HTTPStatus, message: str, **details: Any):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+class PredictionServer:
+    """
+    Serves predictions of the connections of a registry (see module docs).
+    """
+
+    def __init__(
+        self,
+        prediction_service: PredictionService,
+        registry: ConnectionRegistry,
+        address: str,
+        linger: float = default_linger,
+        chunk_size: int = default_chunk_size,
+    ):
+        """
+        Args:
+            prediction_service:
+            registry: connections to serve predictions of
+            address: HOST:PORT to listen on, or path of a Unix socket
+                (see parse_address)
+            linger: see PredictionBatcher
+            chunk_size: see PredictionBatcher
+        """
+        self.registry = registry
+        self.batcher = PredictionBatcher(prediction_service, registry, linger, chunk_size)
+        self.address = parse_address(address)
+        self.server = make_socket_server(self.address, self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def shutdown(self):
+        """
+        Stops serve_forever (to be called from another thread).
+        """
+        self.server.shutdown()
+
+    def close(self):
+        self.server.server_close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+        self.batcher.close()
+
+    def warm_up(self, start_day: date, n_days: int = default_days):
+        """
+        Predicts all connections once, filling the caches of the prediction
+        service with their history.
+        """
+        self.batcher.predict(np.arange(len(self.registry)), start_day, n_days)
+
+    def positions_of(self, ean_codes: Sequence[str]) -> np.ndarray:
+        """
+        Raises:
+            RequestError: for EAN codes not in the registry
+        """
+        positions = [self.registry.positions.get(ean) for ean in ean_codes]
+        unknown = [ean for ean, position in zip(ean_codes, positions) if position is None]
+        if unknown:
+            raise RequestError(HTTPStatus.NOT_FOUND, "Unknown EAN codes", eans=unknown)
+        return np.array(positions, dtype=np.int64)
+
+    def predict(
+        self, ean_codes: Optional[Sequence[str]], start_day: date, n_days: int
+    ) -> DataFrame:
+        """
+        Args:
+            ean_codes: connections to predict, all of the registry if None
+            start_day:
+            n_days:
+        """
+        if ean_codes is None:
+            positions = np.arange(len(self.registry))
+        else:
+            positions = self.positions_of(ean_codes)
+        return self.batcher.predict(positions, start_day, n_days)
+
+
+class PredictionRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP endpoints of PredictionServer (see module docs).
+    """
+
+    server_version = "day-ahead-order"
+    # keep-alive, so that clients do not pay for a new connection per request
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def prediction_server(self) -> PredictionServer:
+        return self.server.prediction_server
+
+    def setup(self):
+        # headers and body get written separately, which would otherwise
+        # wait for delayed acknowledgements of TCP clients
+        self.disable_nagle_algorithm = self.server.address_family != socket.AF_UNIX
+        super().setup()
+
+    def do_GET(self):
+        self.respond(self.get)
+
+    def do_POST(self):
+        self.respond(self.post)
+
+    def get(self, path: List[str], query: Dict[str, List[str]]) -> Dict[str, Any]:
+        if path == ["health"]:
+            return {"status": "ok", "connections": len(self.prediction_server.registry)}
+        if path == ["metrics"]:
+            return self.prediction_server.batcher.prediction_service.metrics.snapshot()
+        if len(path) == 3 and path[0] == "connections" and path[2] == "prediction":
+            start_day, n_days = prediction_days(
+                query.get("start", [None])[-1], query.get("days", [None])[-1]
+            )
+            ean = path[1]
+            predictions = self.prediction_server.predict([ean], start_day, n_days)
+            return {
+                "ean": ean,
+                "hours": utc_hours(predictions),
+                "kwh": json_values(predictions.to_numpy())[0],
+            }
+        raise RequestError(HTTPStatus.NOT_FOUND, f"No such endpoint: GET /{'/'.join(path)}")
+
+    def post(self, path: List[str], query: Dict[str, List[str]]) -> Dict[str, Any]:
+        if path != ["predictions"]:
+            raise RequestError(HTTPStatus.NOT_FOUND, f"No such endpoint: POST /{'/'.join(path)}")
+
+        body = self.read_json()
+        eans = body.get("eans")
+        if eans is not None and not (
+            isinstance(eans, list) and all(isinstance(ean, str) for ean in eans)
+        ):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "eans should be a list of EAN codes")
+        start_day, n_days = prediction_days(body.get("start"), body.get("days"))
+
+        predictions = self.prediction_server.predict(eans, start_day, n_days)
+        return {
+            "start": start_day.isoformat(),
+            "days": n_days,
+            "hours": utc_hours(predictions),
+            "predictions": dict(
+                zip(predictions.index, json_values(predictions.to_numpy()))
+            ),
+        }
+
+    def read_json(self) -> Dict[str, Any]:
+        length = self.headers.get("Content-Length") or "0"
+        if not length.isdigit():
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"Invalid Content-Length: {length!r}")
+        try:
+            body = json.loads(self.rfile.read(int(length)) or b"{}")
+        except ValueError as error:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"Invalid JSON body: {error}")
+        if not isinstance(body, dict):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Expected a JSON object as body")
+        return body
+
+    def respond(self, handle):
+        url = urlsplit(self.path)
+        path = [part for part in url.path.split("/") if part]
+        try:
+            status, content = HTTPStatus.OK, handle(path, parse_qs(url.query))
+        except RequestError as error:
+            status, content = error.status, {"error": str(error), **error.details}
+        # anything else is a failure of the server, not of the request
+        except Exception as error:
+            logger.exception("Failed to handle %s %s", self.command, self.path)
+            status, content = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(error)}
+
+        body = json.dumps(content, allow_nan=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any):
+        logger.debug(format, *args)
+
+
+class PredictionHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], prediction_server: PredictionServer):
+        super().__init__(address, PredictionRequestHandler)
+        self.prediction_server = prediction_server
+
+
+class PredictionUnixServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, prediction_server: PredictionServer):
+        # a socket left behind by a server which did not shut down cleanly
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+        super().__init__(path, PredictionRequestHandler)
+        self.prediction_server = prediction_server
+
+
+def make_socket_server(
+    address: Union[Tuple[str, int], str], prediction_server: PredictionServer
+) -> BaseServer:
+    if isinstance(address, str):
+        return PredictionUnixServer(address, prediction_server)
+    return PredictionHTTPServer(address, prediction_server)
+
+
+def parse_address(address: str) -> Union[Tuple[str, int], str]:
+    """
+    Returns:
+        (host, port) for HOST:PORT, otherwise the address as a path of a
+        Unix socket
+    Raises:
+        ValueError: for a port which is not a number
+    """
+    host, separator, port = address.rpartition(":")
+    if not separator or "/" in address:
+        return address
+    if not port.isdigit():
+        raise ValueError(f"Expected HOST:PORT or a Unix socket path, got {address!r}")
+    return host or "127.0.0.1", int(port)
+
+
+def prediction_days(start: Any, days: Any) -> Tuple[date, int]:
+    """
+    Args:
+        start: ISO date (string), None for tomorrow
+        days: whole number (or a string of one, from a query), None for
+            default_days
+    Returns:
+        first day and number of days of a request
+    Raises:
+        RequestError: (400 Bad Request) for invalid values
+    """
+    if start is None:
+        start_day = date.today() + timedelta(days=1)
+    elif isinstance(start, str):
+        try:
+            start_day = date.fromisoformat(start)
+        except ValueError:
+            raise RequestError(
+                HTTPStatus.BAD_REQUEST, f"start should be an ISO date, got {start!r}"
+            ) from None
+    else:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"start should be an ISO date, got {start!r}")
+
+    if days is None:
+        n_days = default_days
+    elif isinstance(days, int) and not isinstance(days, bool):
+        n_days = days
+    elif isinstance(days, str) and days.isdigit():
+        n_days = int(days)
+    else:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"days should be a whole number, got {days!r}")
+    if not 1 <= n_days <= max_days:
+        raise RequestError(
+            HTTPStatus.BAD_REQUEST, f"days should be between 1 and {max_days}, got {n_days}"
+        )
+    return start_day, n_days
+
+
+def utc_hours(predictions: DataFrame) -> List[str]:
+    return list(predictions.columns.strftime("%Y-%m-%dT%H:%M:%SZ"))
+
+
+def json_values(values: np.ndarray) -> List[List[Optional[float]]]:
+    """
+    Returns:
+        rows of the values, None for NaN
+    """
+    return np.where(np.isnan(values), None, values).tolist()
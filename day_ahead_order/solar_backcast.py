@@ -0,0 +1,126 @@
+"""
+Solar backcast stage of the mixed solar/regular prediction pipeline.
+
+Mixed connections need solar production of the historic days which get
+averaged (see PredictionService.predict_mixed_fleet_consumption). Instead of
+asking SolarForecastService about every historic day separately, the whole
+window of the last weeks is requested once per connection and reused by
+all consecutive prediction days falling into it.
+"""
+
+from datetime import date, timedelta
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from pandas import DataFrame, Series, concat
+
+from .connection_registry import ean_codes_of
+from .grid_connection import GridConnection
+from .instrumentation import Metrics, null_metrics
+from .solar_forecast import SolarForecastService
+from .utils.cache import LruCache
+from .utils.datetime import get_prediction_range
+from .weekday_profile import align_local_hours
+
+default_backcast_weeks = 4
+default_max_entries = 100_000
+
+
+class SolarBackcast:
+    """
+    Keeps the solar backcast window (first day, last day, hourly Series)
+    of each mixed connection, refetching it only when asked about days
+    outside of it.
+    """
+
+    def __init__(
+        self,
+        solar_forecast_service: SolarForecastService,
+        weeks: int = default_backcast_weeks,
+        max_entries: int = default_max_entries,
+        metrics: Metrics = null_metrics,
+    ):
+        self.solar_forecast_service = solar_forecast_service
+        self.weeks = weeks
+        self.windows = LruCache(max_entries)
+        self.metrics = metrics
+
+    def hourly(
+        self,
+        connections: Sequence[GridConnection],
+        days: Sequence[date],
+        anchor: Optional[date] = None,
+    ) -> np.ndarray:
+        """
+        Args:
+            connections:
+            days: historic local days
+            anchor: see window_for
+        Returns:
+            solar kWh of shape (connections, days, slots_per_day), lined up
+            the same way as historic consumption (see align_local_hours)
+        """
+        ean_codes = ean_codes_of(connections)
+        if not days or not connections:
+            return align_local_hours(DataFrame(), ean_codes, days)
+
+        first_day, last_day = self.window_for(days, anchor)
+        frames = []
+        for connection in connections:
+            production = self.production(connection, first_day, last_day)
+            frames.append(
+                DataFrame(
+                    {
+                        "ean": connection.ean_code,
+                        "interval_start": production.index,
+                        "kwh": production.to_numpy(dtype=float),
+                    }
+                )
+            )
+
+        return align_local_hours(concat(frames, ignore_index=True), ean_codes, days)
+
+    def window_for(
+        self, days: Sequence[date], anchor: Optional[date] = None
+    ) -> Tuple[date, date]:
+        """
+        Args:
+            days: historic local days
+            anchor: day the prediction is made for (e.g. the target day of
+                a backtest), today by default
+        Returns:
+            (first, last) day of the window covering the last weeks before
+            the anchor, widened to cover all the days
+        """
+        if anchor is None:
+            anchor = date.today()
+        first_day = min(min(days), anchor - timedelta(weeks=self.weeks))
+        last_day = max(max(days), anchor - timedelta(days=1))
+        return first_day, last_day
+
+    def production(
+        self, connection: GridConnection, first_day: date, last_day: date
+    ) -> Series:
+        """
+        Returns:
+            hourly solar production of the connection between the days
+            (inclusive), fetched only if not covered by the kept window
+        """
+        kept: Optional[Tuple[date, date, Series]] = self.windows.get(connection.ean_code)
+        if kept is not None and kept[0] <= first_day and last_day <= kept[1]:
+            return kept[2]
+
+        time_start, _ = get_prediction_range(first_day)
+        _, time_end = get_prediction_range(last_day)
+        self.metrics.count("service_requests_total", service="solar_forecast")
+        production = self.solar_forecast_service.predict(
+            time_start,
+            time_end,
+            connection.latitude,
+            connection.longitude,
+            connection.solar_plane_declination,
+            connection.solar_plane_azimuth,
+            connection.solar_rated_power,
+        )
+        self.windows.put(connection.ean_code, (first_day, last_day, production))
+        return production
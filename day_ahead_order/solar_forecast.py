@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime
 
 from pandas import Series, date_range
@@ -37,9 +38,35 @@ class SolarForecastService:
         Returns:
 
         """
-        ix_range = date_range(time_start, time_end, freq='60T')
+        ix_range = date_range(time_start, time_end, freq='60min')
 
         # data is mocked for now
         data = [ix.hour for ix in ix_range]
 
         return Series(index=ix_range, data=data)
+
+    async def apredict(self,
+                       time_start: datetime,
+                       time_end: datetime,
+                       latitude: float,
+                       longitude: float,
+                       plane_declination: float,
+                       plane_azimuth: float,
+                       solar_rated_power: float) -> Series:
+        """
+        Async variant of predict.
+
+        The stub runs predict in the default executor; a client of the real
+        forecast provider would await its HTTP request here instead.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            None,
+            self.predict,
+            time_start,
+            time_end,
+            latitude,
+            longitude,
+            plane_declination,
+            plane_azimuth,
+            solar_rated_power,
+        )
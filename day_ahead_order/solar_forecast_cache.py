@@ -0,0 +1,141 @@
+"""
+Memoization of solar forecasts shared by connections with the same panel
+geometry.
+
+PV sites sharing a location grid cell and panel orientation only differ
+by rated power, so the forecast gets fetched once per (rounded location,
+orientation, time range) as a profile per kWp and scaled by
+solar_rated_power of each connection. Forecasts get revised over time,
+so cached profiles expire after a TTL. A connection without a known
+solar_rated_power cannot be scaled and gets rejected before fetching.
+"""
+
+import math
+from datetime import datetime
+from typing import Any, Hashable, Optional, Tuple
+
+from pandas import Series
+
+from .solar_forecast import SolarForecastService
+from .utils.cache import CacheStats, LruCache
+
+default_max_entries = 10_000
+# Forecast providers typically revise forecasts every hour or so.
+default_ttl = 60 * 60
+# ~1 km grid cells in Netherlands
+default_location_decimals = 2
+
+
+class CachedSolarForecastService(SolarForecastService):
+    """
+    SolarForecastService asking the wrapped service once per panel geometry
+    and time range (see module docs).
+    """
+
+    def __init__(
+        self,
+        service: SolarForecastService,
+        max_entries: int = default_max_entries,
+        ttl: float = default_ttl,
+        location_decimals: int = default_location_decimals,
+    ):
+        """
+        Args:
+            service: service to fetch from on cache misses
+            max_entries: number of per-kWp profiles to keep
+            ttl: (seconds) after which a cached profile gets fetched again
+            location_decimals: latitude and longitude get rounded to as
+                many decimal places to form grid cells sharing a forecast
+        """
+        super().__init__()
+        self.service = service
+        self.location_decimals = location_decimals
+        self.profiles = LruCache(max_entries, ttl)
+        self.stats = CacheStats()
+
+    def predict(self,
+                time_start: datetime,
+                time_end: datetime,
+                latitude: float,
+                longitude: float,
+                plane_declination: float,
+                plane_azimuth: float,
+                solar_rated_power: float) -> Series:
+        """
+        See SolarForecastService.predict
+        """
+        check_rated_power(solar_rated_power)
+        key = self.profile_key(
+            time_start, time_end, latitude, longitude, plane_declination, plane_azimuth
+        )
+        profile = self.lookup(key)
+        if profile is None:
+            profile = self.service.predict(*self.profile_request(key))
+            self.profiles.put(key, profile)
+
+        return profile * solar_rated_power
+
+    async def apredict(self,
+                       time_start: datetime,
+                       time_end: datetime,
+                       latitude: float,
+                       longitude: float,
+                       plane_declination: float,
+                       plane_azimuth: float,
+                       solar_rated_power: float) -> Series:
+        """
+        See SolarForecastService.apredict
+        """
+        check_rated_power(solar_rated_power)
+        key = self.profile_key(
+            time_start, time_end, latitude, longitude, plane_declination, plane_azimuth
+        )
+        profile = self.lookup(key)
+        if profile is None:
+            profile = await self.service.apredict(*self.profile_request(key))
+            self.profiles.put(key, profile)
+
+        return profile * solar_rated_power
+
+    def lookup(self, key: Tuple[Hashable, ...]) -> Optional[Series]:
+        profile = self.profiles.get(key)
+        if profile is None:
+            self.stats.add(misses=1)
+        else:
+            self.stats.add(memory_hits=1)
+        return profile
+
+    # noinspection PyMethodMayBeStatic
+    def profile_request(self, key: Tuple[Hashable, ...]) -> Tuple[Any, ...]:
+        """
+        Returns:
+            arguments of SolarForecastService.predict for a per-kWp profile
+        """
+        return (*key, 1.0)
+
+    def profile_key(self,
+                    time_start: datetime,
+                    time_end: datetime,
+                    latitude: float,
+                    longitude: float,
+                    plane_declination: float,
+                    plane_azimuth: float) -> Tuple[Hashable, ...]:
+        return (
+            time_start,
+            time_end,
+            round(latitude, self.location_decimals),
+            round(longitude, self.location_decimals),
+            plane_declination,
+            plane_azimuth,
+        )
+
+
+def check_rated_power(solar_rated_power: Optional[float]):
+    """
+    Raises:
+        ValueError: if solar_rated_power is not known (None or NaN)
+    """
+    if solar_rated_power is None or math.isnan(solar_rated_power):
+        raise ValueError(
+            f"solar_rated_power is required to scale a cached solar forecast, got {solar_rated_power}"
+        )
@@ -0,0 +1,70 @@
+"""
+Coalescing of concurrent identical requests to SolarForecastService.
+
+Meant to sit underneath CachedSolarForecastService: jobs missing the same
+per-kWp profile at the same moment (e.g. a day-ahead run and a backtest
+over the same sites) share one request instead of each making their own.
+"""
+
+from datetime import datetime
+
+from pandas import Series
+
+from .solar_forecast import SolarForecastService
+from .utils.single_flight import SingleFlight
+
+
+class CoalescingSolarForecastService(SolarForecastService):
+    """
+    SolarForecastService asking the wrapped service once per set of
+    arguments in flight, whether callers are threads or async tasks.
+    """
+
+    def __init__(self, service: SolarForecastService):
+        super().__init__()
+        self.service = service
+        self.flights = SingleFlight()
+
+    def predict(self,
+                time_start: datetime,
+                time_end: datetime,
+                latitude: float,
+                longitude: float,
+                plane_declination: float,
+                plane_azimuth: float,
+                solar_rated_power: float) -> Series:
+        """
+        See SolarForecastService.predict
+        """
+        args = (
+            time_start,
+            time_end,
+            latitude,
+            longitude,
+            plane_declination,
+            plane_azimuth,
+            solar_rated_power,
+        )
+        return self.flights.call(args, self.service.predict, *args)
+
+    async def apredict(self,
+                       time_start: datetime,
+                       time_end: datetime,
+                       latitude: float,
+                       longitude: float,
+                       plane_declination: float,
+                       plane_azimuth: float,
+                       solar_rated_power: float) -> Series:
+        """
+        See SolarForecastService.apredict
+        """
+        args = (
+            time_start,
+            time_end,
+            latitude,
+            longitude,
+            plane_declination,
+            plane_azimuth,
+            solar_rated_power,
+        )
+        return await self.flights.acall(args, self.service.apredict, *args)
@@ -0,0 +1,78 @@
+"""
+Helpers for async I/O with upstream services.
+"""
+
+import asyncio
+import random
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, Type
+
+
+class RetryPolicy:
+    """
+    Exponential backoff (with jitter) for transient upstream failures.
+    """
+
+    def __init__(
+        self,
+        attempts: int = 3,
+        base_delay: float = 0.1,
+        max_delay: float = 5.0,
+        retry_on: Tuple[Type[BaseException], ...] = (ConnectionError, TimeoutError),
+    ):
+        """
+        Args:
+            attempts: total number of attempts (1 disables retries)
+            base_delay: (seconds) to wait before the first retry, doubled
+                for every following one
+            max_delay: (seconds) upper bound of a single wait
+            retry_on: exceptions considered transient
+        """
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = retry_on
+
+    def delay(self, attempt: int) -> float:
+        """
+        Returns:
+            (seconds) to wait after the given (0-based) failed attempt
+        """
+        delay = min(self.max_delay, self.base_delay * 2**attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+
+async def call_with_retry(
+    policy: RetryPolicy, call: Callable[..., Awaitable[Any]], *args: Any
+) -> Any:
+    """
+    Awaits call(*args), retrying transient failures as per policy.
+    """
+    for attempt in range(policy.attempts):
+        try:
+            return await call(*args)
+        except policy.retry_on:
+            if attempt == policy.attempts - 1:
+                raise
+            await asyncio.sleep(policy.delay(attempt))
+
+
+class HostConnectionLimits:
+    """
+    Bounds the number of concurrent requests to each upstream host,
+    the same way an HTTP connection pool per host would.
+    """
+
+    def __init__(self, max_connections_per_host: int):
+        self.max_connections_per_host = max_connections_per_host
+        self.semaphores: Dict[Hashable, asyncio.Semaphore] = {}
+
+    @asynccontextmanager
+    async def connection(self, host: Hashable):
+        semaphore = self.semaphores.get(host)
+        if semaphore is None:
+            semaphore = self.semaphores[host] = asyncio.Semaphore(
+                self.max_connections_per_host
+            )
+        async with semaphore:
+            yield
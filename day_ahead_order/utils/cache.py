@@ -0,0 +1,93 @@
+"""
+Generic in-process caching helpers.
+"""
+
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable, Optional
+
+
+class CacheStats:
+    """
+    Hit/miss counters of a (possibly multi-level) cache, shared by the
+    threads using it.
+    """
+
+    def __init__(self):
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def add(self, memory_hits: int = 0, disk_hits: int = 0, misses: int = 0):
+        with self.lock:
+            self.memory_hits += memory_hits
+            self.disk_hits += disk_hits
+            self.misses += misses
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Returns:
+            share (0..1) of lookups answered from cache, 0 if there were none
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __repr__(self):
+        return (
+            f"CacheStats(memory_hits={self.memory_hits}, disk_hits={self.disk_hits}, "
+            f"misses={self.misses})"
+        )
+
+
+class LruCache:
+    """
+    Thread-safe mapping which evicts least recently used entries once it
+    holds more than max_entries of them and, if ttl is given, entries
+    older than ttl seconds.
+    """
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (moment of caching, value)
+        self.entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Returns:
+            cached value (marking it as recently used) or None
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            cached_at, value = entry
+            if self.ttl is not None and time.monotonic() - cached_at > self.ttl:
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,167 @@
+"""
+Precomputed, DST-aware table of local days and their UTC hours.
+
+Instead of a time zone lookup, two localize calls and a date_range for
+every prediction (see utils.datetime.get_prediction_range), the hours of
+a multi-year span get computed once per time zone. Each local day maps to
+its UTC hour boundaries and its 23/24/25 hour slot layout, and repeated
+lookups hand out the very same DatetimeIndex objects. Days also get
+classified once (public holidays, DST transitions, see utils.day_classes),
+so that whole arrays of days can be classified with one lookup.
+
+The table only holds NumPy arrays and a DatetimeIndex, so it is cheap to
+pickle to worker processes (or to share copy-on-write after a fork).
+"""
+
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, Sequence, Tuple
+
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from pandas import DatetimeIndex, date_range
+
+from .datetime import default_timezone, get_prediction_hours, local_hour_slots
+from .day_classes import DayClass, dutch_public_holidays
+
+default_first_day = date(2015, 1, 1)
+# The span covers history and horizon of any run while keeping the table
+# small (~200k hours); callers handle days outside of it on their own (see
+# CalendarIndex.covers).
+default_last_day = date(2037, 12, 31)
+
+
+class CalendarIndex:
+    """
+    UTC hours of every local day in [first_day, last_day] of a time zone.
+    """
+
+    def __init__(
+        self,
+        first_day: date = default_first_day,
+        last_day: date = default_last_day,
+        tzone: str = default_timezone,
+    ):
+        self.first_day = first_day
+        self.last_day = last_day
+        self.tzone = tzone
+
+        assumed_tz = ZoneInfo(tzone)
+        begins = datetime.combine(first_day, time.min, tzinfo=assumed_tz).astimezone(timezone.utc)
+        ends = datetime.combine(
+            last_day + timedelta(days=1), time.min, tzinfo=assumed_tz
+        ).astimezone(timezone.utc)
+        periods = int((ends - begins) / timedelta(hours=1))
+
+        # all UTC hours of the span
+        self.hours = date_range(begins, periods=periods, freq="1h")
+        # slot of each hour on its local day (see utils.datetime.slots_per_day)
+        self.slots = local_hour_slots(self.hours, tzone)
+
+        local_days = np.asarray(
+            self.hours.tz_convert(tzone).tz_localize(None).normalize(),
+            dtype="datetime64[D]",
+        )
+        day_numbers = (local_days - np.datetime64(first_day, "D")).astype(np.int64)
+        # position of the first hour of each day (and one past the last day)
+        self.day_starts = np.searchsorted(
+            day_numbers, np.arange((last_day - first_day).days + 2)
+        )
+
+        # DayClass flags of each day (Dutch holidays, whatever the time zone)
+        hours_per_day = np.diff(self.day_starts)
+        self.day_classes = np.where(
+            hours_per_day != 24, int(DayClass.dst_transition), int(DayClass.normal)
+        ).astype(np.uint8)
+        for year in range(first_day.year, last_day.year + 1):
+            for holiday in dutch_public_holidays(year):
+                if self.covers(holiday):
+                    self.day_classes[(holiday - first_day).days] |= DayClass.holiday
+
+        self.day_hours: Dict[date, DatetimeIndex] = {}
+        self.day_ranges: Dict[date, Tuple[datetime, datetime]] = {}
+
+    def covers(self, day: date) -> bool:
+        return self.first_day <= day <= self.last_day
+
+    def positions_of(self, day: date) -> slice:
+        """
+        Returns:
+            positions of the hours of the day within hours and slots
+        """
+        number = (day - self.first_day).days
+        return slice(self.day_starts[number], self.day_starts[number + 1])
+
+    def hours_of(self, day: date) -> DatetimeIndex:
+        """
+        Returns:
+            UTC hours of the day, same as utils.datetime.get_prediction_hours
+        """
+        hours = self.day_hours.get(day)
+        if hours is None:
+            hours = self.day_hours[day] = self.hours[self.positions_of(day)]
+        return hours
+
+    def slots_of(self, day: date) -> np.ndarray:
+        """
+        Returns:
+            (read-only view) slots of the hours of the day
+        """
+        return self.slots[self.positions_of(day)]
+
+    def classes_of(self, days: Sequence[date]) -> np.ndarray:
+        """
+        Returns:
+            DayClass flags (uint8) of the days, looked up at once for days
+            within the span
+        """
+        numbers = (
+            np.asarray(days, dtype="datetime64[D]") - np.datetime64(self.first_day, "D")
+        ).astype(np.int64)
+        inside = (numbers >= 0) & (numbers < len(self.day_classes))
+        classes = np.zeros(len(numbers), dtype=np.uint8)
+        classes[inside] = self.day_classes[numbers[inside]]
+        for position in np.flatnonzero(~inside):
+            classes[position] = calendar_day_class(days[position], self.tzone)
+        return classes
+
+    def range_of(self, day: date) -> Tuple[datetime, datetime]:
+        """
+        Returns:
+            same as utils.datetime.get_prediction_range
+        """
+        day_range = self.day_ranges.get(day)
+        if day_range is None:
+            positions = self.positions_of(day)
+            begins = self.hours[positions.start].to_pydatetime().astimezone(timezone.utc)
+            next_day_begins = self.hours[positions.stop - 1] + timedelta(hours=1)
+            ends = next_day_begins.to_pydatetime().astimezone(timezone.utc) - timedelta(
+                microseconds=1
+            )
+            day_range = self.day_ranges[day] = (begins, ends)
+        return day_range
+
+
+def calendar_day_class(day: date, tzone: str = default_timezone) -> DayClass:
+    """
+    Returns:
+        calendar classes of a day (outside of the span of CalendarIndex)
+    """
+    day_class = DayClass.normal
+    if day in dutch_public_holidays(day.year):
+        day_class |= DayClass.holiday
+    if len(get_prediction_hours(day, tzone)) != 24:
+        day_class |= DayClass.dst_transition
+    return day_class
+
+
+@lru_cache(maxsize=None)
+def calendar_index(tzone: str = default_timezone) -> CalendarIndex:
+    """
+    Returns:
+        shared CalendarIndex of the time zone (built on first use)
+    """
+    index = CalendarIndex(tzone=tzone)
+    index.slots.setflags(write=False)
+    return index
@@ -3,12 +3,15 @@ A bag of useful helpers to be sorted out to separate modules in case it grows
 either too big or too heterogenic.
 """
 
-import pytz
-from datetime import date, datetime, time
+from datetime import date, datetime, time, timedelta, timezone
+from typing import TYPE_CHECKING, Optional, Tuple, Union
+from zoneinfo import ZoneInfo
 
-from typing import Optional, Tuple
-
-# from pandas import date_range, DatetimeIndex
+# NumPy and pandas get imported by the functions needing them, so that
+# modules only using calendar helpers (e.g. grid_connection) load quickly.
+if TYPE_CHECKING:
+    import numpy as np
+    from pandas import DatetimeIndex
 
 # TODO: should we allow to override it via ENV variable?
 default_timezone = "Europe/Amsterdam"
@@ -34,12 +37,83 @@ def get_prediction_range(
     # to requested results:
     # calendar_day = datetime.combine(day, time.min)
     # return date_range(start=calendar_day, freq="D", periods=2, tz=tzone)
-    assumed_tz = pytz.timezone(tzone)
+    # Days within the precomputed span are looked up (see utils.calendar_index)
+    from .calendar_index import calendar_index
+
+    index = calendar_index(tzone)
+    if index.covers(day):
+        return index.range_of(day)
+
+    assumed_tz = ZoneInfo(tzone)
+
+    begins = datetime.combine(day, time.min, tzinfo=assumed_tz)
+    ends = datetime.combine(day, time.max, tzinfo=assumed_tz)
+
+    return (begins.astimezone(timezone.utc), ends.astimezone(timezone.utc))
+
+
+def get_prediction_hours(day: date, tzone=default_timezone) -> "DatetimeIndex":
+    """
+    Args:
+        day: (naive) calendar day, as experienced in assumed time zone
+        tzone: by default, Amsterdam time
+    Returns:
+        UTC DatetimeIndex marking the beginning of each hour of the day
+        (23, 24 or 25 items, depending on daylight saving status on given day)
+    """
+    from .calendar_index import calendar_index
+
+    index = calendar_index(tzone)
+    if index.covers(day):
+        return index.hours_of(day)
+
+    from pandas import date_range
+
+    predict_from, predict_to = get_prediction_range(day, tzone)
+    return date_range(predict_from, predict_to, freq="1h")
 
-    begins = assumed_tz.localize(datetime.combine(day, time.min))
-    ends = assumed_tz.localize(datetime.combine(day, time.max))
 
-    return (begins.astimezone(pytz.utc), ends.astimezone(pytz.utc))
+# Local hours of a day get lined up on 25 slots: slots 0..23 for wall clock
+# hours and an extra slot for the second occurrence of the hour repeated
+# when daylight saving time ends (02:00 - 02:59 in Netherlands).
+slots_per_day = 25
+repeated_hour_slot = 24
+
+
+def local_hour_slots(moments: "DatetimeIndex", tzone=default_timezone) -> "np.ndarray":
+    """
+    Args:
+        moments: timezone-aware moments (e.g. beginnings of hours or of
+            15 minute intervals)
+        tzone: time zone the days get experienced in
+    Returns:
+        slot (0..24, see slots_per_day) each moment falls into on its local day
+    """
+    import numpy as np
+    from pandas import Timedelta
+
+    local = moments.tz_convert(tzone)
+    hour_ago = (moments - Timedelta(hours=1)).tz_convert(tzone)
+
+    slots = np.asarray(local.hour, dtype=np.int64)
+    # Only within the repeated hour it was the same wall clock hour an hour ago
+    slots[np.asarray(hour_ago.hour) == slots] = repeated_hour_slot
+    return slots
+
+
+def as_calendar_day(moment: Union[date, datetime], tzone=default_timezone) -> date:
+    """
+    Args:
+        moment: either a calendar date or a (naive or timezone-aware) datetime
+        tzone: time zone to express timezone-aware datetimes in
+    Returns:
+        calendar day the moment falls on in the assumed time zone
+    """
+    if isinstance(moment, datetime):
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(ZoneInfo(tzone))
+        return moment.date()
+    return moment
 
 
 def last_weekday_before(weekday: int, anchor: Optional[date] = None) -> date:
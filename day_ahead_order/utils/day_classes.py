@@ -0,0 +1,78 @@
+"""
+Classes of days whose consumption tends to differ from the same weekday
+in other weeks.
+"""
+
+from datetime import date, timedelta
+from enum import IntFlag
+from typing import List
+
+
+class DayClass(IntFlag):
+    """
+    Flags of a day (several may apply at once). Calendar classes are the
+    same for all connections (see utils.calendar_index), anomalies get
+    detected in the history of each connection (see history_selection).
+    """
+
+    normal = 0
+    # public holiday in Netherlands
+    holiday = 1
+    # day of 23 or 25 hours
+    dst_transition = 2
+    # some (but not all) hours of the day missing
+    gap = 4
+    # several consecutive hours of exactly zero consumption
+    zero_run = 8
+
+
+def easter_sunday(year: int) -> date:
+    """
+    Returns:
+        Easter Sunday of the (Gregorian) year, by the anonymous Gregorian
+        algorithm
+    """
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    weekday_shift = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * weekday_shift) // 451
+    month, day = divmod(h + weekday_shift - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def dutch_public_holidays(year: int) -> List[date]:
+    """
+    Returns:
+        public holidays in Netherlands (including those on a Sunday):
+        New Year's Day, Easter, King's (Queen's) Day, Liberation Day (a day
+        off every five years), Ascension Day, Whitsun and Christmas
+    """
+    easter = easter_sunday(year)
+
+    if year >= 2014:
+        kings_day = date(year, 4, 27)
+    else:
+        kings_day = date(year, 4, 30)
+    # moved to Saturday when falling on a Sunday
+    if kings_day.weekday() == 6:
+        kings_day -= timedelta(days=1)
+
+    holidays = [
+        date(year, 1, 1),
+        easter,
+        easter + timedelta(days=1),
+        kings_day,
+        easter + timedelta(days=39),
+        easter + timedelta(days=49),
+        easter + timedelta(days=50),
+        date(year, 12, 25),
+        date(year, 12, 26),
+    ]
+    if year % 5 == 0:
+        holidays.append(date(year, 5, 5))
+    return sorted(holidays)
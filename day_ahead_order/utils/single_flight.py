@@ -0,0 +1,118 @@
+"""
+Sharing of calls in flight between concurrent callers, be they threads or
+async tasks: the first caller asking for a key makes the call, the ones
+asking for the same key meanwhile wait for its outcome.
+"""
+
+import asyncio
+from concurrent.futures import Future
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class FlightAbandoned(Exception):
+    """
+    The caller making a call got cancelled (or interrupted) before it
+    finished; callers waiting for it make the call again.
+    """
+
+
+def flight_future() -> Future:
+    """
+    Returns:
+        future for the outcome of a call in flight, which callers giving up
+        on waiting for it (e.g. cancelled async tasks) cannot cancel
+    """
+    future = Future()
+    future.set_running_or_notify_cancel()
+    return future
+
+
+def settle(future: Future, error: BaseException):
+    """
+    Passes a failure of the call to the callers waiting for it (or tells
+    them to make the call again, if the caller making it got cancelled or
+    interrupted).
+    """
+    future.set_exception(error if isinstance(error, Exception) else FlightAbandoned())
+
+
+class SingleFlight:
+    """
+    Calls in flight by key. Keys must identify calls completely (e.g. all
+    arguments of a request), results get shared as they are.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.flights: Dict[Hashable, Future] = {}
+
+    def join(self, key: Hashable) -> Tuple[Future, bool]:
+        """
+        Returns:
+            future of the call in flight for the key and whether the caller
+            has to make it (no call for the key was in flight)
+        """
+        with self.lock:
+            future = self.flights.get(key)
+            if future is not None:
+                return future, False
+            future = self.flights[key] = flight_future()
+            return future, True
+
+    def land(self, key: Hashable):
+        with self.lock:
+            del self.flights[key]
+
+    def call(self, key: Hashable, function: Callable[..., Any], *args: Any) -> Any:
+        """
+        Returns:
+            function(*args), or the outcome of the same call in flight
+        """
+        while True:
+            future, leading = self.join(key)
+            if leading:
+                break
+            try:
+                return future.result()
+            except FlightAbandoned:
+                continue
+
+        try:
+            result = function(*args)
+        except BaseException as error:
+            self.land(key)
+            settle(future, error)
+            raise
+        self.land(key)
+        future.set_result(result)
+        return result
+
+    async def acall(
+        self, key: Hashable, function: Callable[..., Awaitable[Any]], *args: Any
+    ) -> Any:
+        """
+        Async variant of call.
+
+        Waiting for a call made by another thread does not block the event
+        loop. A thread must not wait for a call made by a task of an event
+        loop it is blocking.
+        """
+        while True:
+            future, leading = self.join(key)
+            if leading:
+                break
+            try:
+                return await asyncio.wrap_future(future)
+            except FlightAbandoned:
+                continue
+
+        try:
+            result = await function(*args)
+        except BaseException as error:
+            self.land(key)
+            settle(future, error)
+            raise
+        self.land(key)
+        future.set_result(result)
+        return result
@@ -0,0 +1,155 @@
+"""
+NumPy-backed engine for averaging hourly consumption of past same weekdays
+for a whole batch of connections at once.
+
+Historic days get lined up on a local hour axis of 25 slots
+(see utils.datetime.slots_per_day), so that days of 23, 24 or 25 hours
+(depending on daylight saving time) can be compared slot by slot.
+"""
+
+from datetime import date
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+from pandas import DataFrame, DatetimeIndex, Index, factorize
+
+from .utils.datetime import (
+    default_timezone,
+    local_hour_slots,
+    repeated_hour_slot,
+    slots_per_day,
+)
+
+
+def align_local_hours(
+    consumption: DataFrame,
+    ean_codes: Sequence[str],
+    days: Sequence[date],
+    tzone=default_timezone,
+) -> np.ndarray:
+    """
+    Sums 15 minute consumption into hourly slots of local days.
+
+    Args:
+        consumption: long-format frame, as returned by
+            HistoricConsumptionService.get_consumption_many
+        ean_codes: connections to line up (rows of the result)
+        days: local calendar days to line up (second axis of the result)
+        tzone: time zone the days are experienced in
+    Returns:
+        array of shape (connections, days, slots_per_day) with hourly kWh,
+        NaN for hours without any data
+    """
+    shape = (len(ean_codes), len(days), slots_per_day)
+    if consumption.empty:
+        return np.full(shape, np.nan)
+
+    kwh = consumption["kwh"].to_numpy(dtype=float)
+
+    # The same interval starts repeat for every connection, so time zone
+    # arithmetic only gets done for the unique ones.
+    interval_codes, interval_starts = factorize(consumption["interval_start"])
+    interval_starts = DatetimeIndex(interval_starts)
+    local_days = interval_starts.tz_convert(tzone).date
+    day_positions = Index(days).get_indexer(local_days)[interval_codes]
+    slots = local_hour_slots(interval_starts, tzone)[interval_codes]
+
+    rows = Index(ean_codes).get_indexer(consumption["ean"])
+
+    valid = (rows >= 0) & (day_positions >= 0) & ~np.isnan(kwh)
+    flat = np.ravel_multi_index(
+        (rows[valid], day_positions[valid], slots[valid]), shape
+    )
+    size = int(np.prod(shape))
+    sums = np.bincount(flat, weights=kwh[valid], minlength=size)
+    counts = np.bincount(flat, minlength=size)
+
+    return np.where(counts > 0, sums, np.nan).reshape(shape)
+
+
+def masked_weekday_mean(
+    hourly: np.ndarray, windows: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Averages the hourly slots of historic days within each window, ignoring
+    missing (NaN) values.
+
+    Args:
+        hourly: (connections, days, slots_per_day), see align_local_hours
+        windows: boolean (prediction days, days) - which historic days to
+            average for each prediction day, or (connections, prediction
+            days, days) when selected per connection
+    Returns:
+        - mean kWh of shape (connections, prediction days, slots_per_day),
+          NaN where no historic day had data for the slot
+        - number of historic days with any data, for each (connection,
+          prediction day)
+    """
+    # Prediction days of the same weekday mostly average the same historic
+    # days (e.g. over a horizon longer than a week), so each distinct
+    # window gets averaged once.
+    per_connection = windows.ndim == 3
+    days_axis = 1 if per_connection else 0
+    prediction_days = windows.shape[days_axis]
+    packed = np.packbits(
+        np.moveaxis(windows, days_axis, 0).reshape(prediction_days, -1), axis=1
+    )
+    # packed window -> position of the first prediction day with it
+    first_of_window: Dict[bytes, int] = {}
+    for position, window in enumerate(packed):
+        first_of_window.setdefault(window.tobytes(), position)
+    if len(first_of_window) < prediction_days:
+        means, day_counts = masked_weekday_mean(
+            hourly, np.take(windows, list(first_of_window.values()), axis=days_axis)
+        )
+        unique_of_window = {window: unique for unique, window in enumerate(first_of_window)}
+        window_of_day = [unique_of_window[window.tobytes()] for window in packed]
+        return means[:, window_of_day], day_counts[:, window_of_day]
+
+    present = ~np.isnan(hourly)
+    weights = windows.astype(float)
+    subscripts = "cpd" if per_connection else "pd"
+
+    sums = np.einsum(f"cds,{subscripts}->cps", np.where(present, hourly, 0.0), weights)
+    counts = np.einsum(f"cds,{subscripts}->cps", present.astype(float), weights)
+    day_counts = np.einsum(
+        f"cd,{subscripts}->cp", present.any(axis=2).astype(float), weights
+    )
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(counts > 0, sums / counts, np.nan)
+
+    return means, day_counts.astype(np.int64)
+
+
+def profile_for_hours(
+    means: np.ndarray,
+    day_positions: np.ndarray,
+    hours: DatetimeIndex,
+    tzone=default_timezone,
+) -> np.ndarray:
+    """
+    Picks slots of averaged profiles for the hours of prediction days, for
+    all the days in one go.
+
+    Args:
+        means: (connections, prediction days, slots_per_day)
+        day_positions: prediction day (position) each hour falls on
+        hours: UTC hours of the prediction days
+    Returns:
+        (connections, hours) kWh. The repeated hour at the end of daylight
+        saving time falls back to the same wall clock hour when history
+        has no such slot.
+    """
+    slots = local_hour_slots(hours, tzone)
+    values = means[:, day_positions, slots]
+
+    repeated = slots == repeated_hour_slot
+    if repeated.any():
+        wall_clock_hours = np.asarray(hours.tz_convert(tzone).hour)[repeated]
+        missing = np.isnan(values[:, repeated])
+        values[:, repeated] = np.where(
+            missing, means[:, day_positions[repeated], wall_clock_hours], values[:, repeated]
+        )
+
+    return values
@@ -0,0 +1,138 @@
+import asyncio
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+from pandas import DatetimeIndex
+
+from day_ahead_order.async_prediction import AsyncPredictionService
+from day_ahead_order.consumption_cache import CachingHistoricConsumptionService
+from day_ahead_order.fakes import LatencyHistoricConsumptionService, LatencySolarForecastService
+from day_ahead_order.grid_connection import GridConnection, PredictionType
+from day_ahead_order.historic_consumption_service import HistoricConsumptionService
+from day_ahead_order.prediction import PredictionService
+from day_ahead_order.solar_forecast import SolarForecastService
+from day_ahead_order.solar_forecast_cache import CachedSolarForecastService
+from day_ahead_order.utils.aio import HostConnectionLimits, RetryPolicy, call_with_retry
+from day_ahead_order.utils.datetime import default_timezone
+
+prediction_types = list(PredictionType)
+
+
+def fleet(size):
+    return [
+        GridConnection(
+            f"c{i}", f"87{i:016d}", date(2020, 1, 1), None, prediction_types[i % 3], 1000,
+            52 + i / 10, 5.5, 35, 180, 3.0,
+        )
+        for i in range(size)
+    ]
+
+
+def upcoming_days(count):
+    tomorrow = date.today() + timedelta(days=1)
+    return [tomorrow + timedelta(days=i) for i in range(count)]
+
+
+def test_async_predictions_equal_sync_predictions():
+    connections, days = fleet(9), upcoming_days(2)
+    history, solar = LatencyHistoricConsumptionService(), LatencySolarForecastService()
+    service = AsyncPredictionService(solar, history, batch_size=2)
+
+    predictions = asyncio.run(service.make_predictions_for_fleet(connections, days))
+    calls = (history.calls, solar.calls)
+    # a second run finds everything in the caches
+    asyncio.run(service.make_predictions_for_fleet(connections, days))
+
+    # the stub forecast ignores rated power, which the cache scales by
+    expected = PredictionService(
+        CachedSolarForecastService(SolarForecastService()),
+        CachingHistoricConsumptionService(HistoricConsumptionService()),
+    ).make_predictions_for_fleet(connections, days)
+    np.testing.assert_allclose(predictions.to_numpy(), expected.to_numpy())
+    assert (history.calls, solar.calls) == calls
+
+
+class OutageService(LatencyHistoricConsumptionService):
+    """
+    Metering outage (zero kWh) of one connection for most of a day.
+    """
+
+    def __init__(self, ean_code, day):
+        super().__init__()
+        self.ean_code = ean_code
+        self.day = day
+
+    async def aget_consumption_batch(self, connections, windows):
+        consumption = await super().aget_consumption_batch(connections, windows)
+        local = DatetimeIndex(consumption["interval_start"]).tz_convert(default_timezone)
+        outage = (consumption["ean"] == self.ean_code).to_numpy() & (local.date == self.day)
+        consumption.loc[outage & (local.hour >= 2), "kwh"] = 0.0
+        return consumption
+
+    def get_consumption_batch(self, connections, windows):
+        return asyncio.run(self.aget_consumption_batch(connections, windows))
+
+
+def test_history_replacing_skipped_days_is_prefetched():
+    connections, days = fleet(6), upcoming_days(1)
+    regular = connections[0]
+    history = OutageService(regular.ean_code, date.today() - timedelta(days=6))
+    service = AsyncPredictionService(LatencySolarForecastService(), history)
+
+    asyncio.run(service.prefetch(connections, days))
+    calls = history.calls
+    predictions = service.prediction_service.make_predictions_for_fleet(connections, days)
+
+    # the rest of the days in reach got fetched for the connection with the outage
+    assert calls > 1
+    assert history.calls == calls
+    assert predictions.notna().all(axis=None)
+
+
+def test_range_of_a_single_connection():
+    service = AsyncPredictionService(LatencySolarForecastService(), LatencyHistoricConsumptionService())
+    connection = fleet(1)[0]
+    days = upcoming_days(3)
+
+    series = asyncio.run(service.make_prediction_for_range(connection, days[0], 3))
+
+    assert len(series) == sum(
+        len(service.prediction_service.make_prediction_for_day(connection, day)) for day in days
+    )
+
+
+def test_transient_failures_are_retried():
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("reset")
+        return "ok"
+
+    policy = RetryPolicy(attempts=3, base_delay=0)
+    assert asyncio.run(call_with_retry(policy, flaky)) == "ok"
+
+    attempts.clear()
+    with pytest.raises(ConnectionError):
+        asyncio.run(call_with_retry(RetryPolicy(attempts=2, base_delay=0), flaky))
+    assert len(attempts) == 2
+
+
+def test_requests_per_host_are_bounded():
+    limits = HostConnectionLimits(2)
+    in_flight, peak = {"a": 0, "b": 0}, {"a": 0, "b": 0}
+
+    async def request(host):
+        async with limits.connection(host):
+            in_flight[host] += 1
+            peak[host] = max(peak[host], in_flight[host])
+            await asyncio.sleep(0.001)
+            in_flight[host] -= 1
+
+    async def requests():
+        await asyncio.gather(*(request(host) for host in "ab" * 10))
+
+    asyncio.run(requests())
+    assert peak == {"a": 2, "b": 2}
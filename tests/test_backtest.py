@@ -0,0 +1,108 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from day_ahead_order.backtest import backtest, backtest_history_days
+from day_ahead_order.grid_connection import GridConnection, PredictionType
+from day_ahead_order.historic_consumption_service import HistoricConsumptionService
+from day_ahead_order.prediction import PredictionService
+from day_ahead_order.solar_forecast import SolarForecastService
+from day_ahead_order.utils.datetime import get_prediction_range
+
+from .test_solar_backcast import PastAndFutureSolarForecastService
+
+
+def connections_of_each_type():
+    return [
+        GridConnection("r", "870000000000000001", date(2020, 1, 1), None, PredictionType.regular, 1000),
+        GridConnection(
+            "s", "870000000000000002", date(2020, 1, 1), None, PredictionType.solar, -1000,
+            52.5, 5.5, 35, 180, 4.0,
+        ),
+        GridConnection(
+            "m", "870000000000000003", date(2020, 1, 1), None,
+            PredictionType.mixed_solar_regular, 1000, 52.5, 5.5, 35, 180, 4.0,
+        ),
+    ]
+
+
+def prediction_service():
+    return PredictionService(SolarForecastService(), HistoricConsumptionService())
+
+
+def test_weekday_pattern_is_predicted_exactly():
+    # the mocked history repeats every week
+    report = backtest(
+        prediction_service(), connections_of_each_type()[:1], date(2024, 6, 3), date(2024, 6, 9)
+    )
+
+    summary = report.summary()
+    assert summary.loc["regular", "connections"] == 1
+    assert summary.loc["regular", "hours"] == 7 * 24
+    assert summary.loc["regular", "mae"] == pytest.approx(0.0)
+    assert summary.loc["regular", "bias"] == pytest.approx(0.0)
+
+
+def test_hours_of_dst_days_are_compared():
+    report = backtest(
+        prediction_service(), connections_of_each_type()[:1], date(2024, 3, 30), date(2024, 3, 31)
+    )
+    assert report.summary().loc["regular", "hours"] == 24 + 23
+
+    report = backtest(
+        prediction_service(), connections_of_each_type()[:1], date(2024, 10, 27), date(2024, 10, 27)
+    )
+    assert report.summary().loc["regular", "hours"] == 25
+
+
+def test_solar_errors_are_labelled_as_backcast():
+    report = backtest(
+        prediction_service(), connections_of_each_type(), date(2024, 6, 3), date(2024, 6, 4)
+    )
+
+    summary = report.summary()
+    assert list(summary.index) == ["regular", "solar", "mixed_solar_regular"]
+    assert summary["solar"].tolist() == ["none", "backcast", "backcast"]
+    assert (summary["hours"] == 48).all()
+
+
+def test_backcast_window_ends_at_the_backtested_period():
+    solar = PastAndFutureSolarForecastService()
+    service = PredictionService(solar, HistoricConsumptionService())
+    first_day, last_day = date(2024, 6, 3), date(2024, 6, 4)
+
+    backtest(service, connections_of_each_type()[2:], first_day, last_day)
+
+    history_days = backtest_history_days([first_day, last_day], 8)
+    backcast_window = (
+        get_prediction_range(history_days[0])[0], get_prediction_range(last_day)[1]
+    )
+    assert backcast_window in solar.requests
+    assert max(time_end for _, time_end in solar.requests) == get_prediction_range(last_day)[1]
+
+
+def test_connections_are_compared_only_while_active():
+    connection = connections_of_each_type()[0]
+    connection.active_until = date(2024, 6, 4)
+
+    report = backtest(prediction_service(), [connection], date(2024, 6, 3), date(2024, 6, 6))
+
+    # active_until is inclusive
+    assert report.summary().loc["regular", "hours"] == 48
+
+
+def test_history_reaches_back_from_the_first_order_day():
+    days = backtest_history_days([date(2024, 6, 3), date(2024, 6, 4)], weeks_back=2)
+    assert (days[0], days[-1], len(days)) == (date(2024, 5, 19), date(2024, 6, 4), 17)
+
+
+def test_empty_period_is_rejected():
+    with pytest.raises(ValueError):
+        backtest(prediction_service(), [], date(2024, 6, 4), date(2024, 6, 3))
+
+
+def test_summary_of_no_connections_is_empty():
+    report = backtest(prediction_service(), [], date(2024, 6, 3), date(2024, 6, 3))
+    assert report.summary().empty
+    assert np.isnan(report.errors_of(PredictionType.regular).mae)
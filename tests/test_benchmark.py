@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import pytest
+from pandas import DataFrame
+
+from day_ahead_order.benchmark import (
+    compare,
+    next_day_with_hours,
+    run_benchmarks,
+    run_scenario,
+    solar_sites,
+    synthetic_fleet,
+)
+from day_ahead_order.fakes import LatencyHistoricConsumptionService, LatencySolarForecastService
+from day_ahead_order.grid_connection import PredictionType
+from day_ahead_order.utils.datetime import get_prediction_hours, get_prediction_range
+
+
+def test_synthetic_fleet_is_reproducible_and_shares_solar_sites():
+    fleet = synthetic_fleet(2000)
+
+    assert [c.ean_code for c in fleet] == [c.ean_code for c in synthetic_fleet(2000)]
+    assert len({c.ean_code for c in fleet}) == 2000
+    solar = [c for c in fleet if c.prediction_type != PredictionType.regular]
+    assert 0.1 < len(solar) / len(fleet) < 0.3
+    assert len({(c.latitude, c.longitude) for c in solar}) <= solar_sites
+    assert all(c.latitude is None for c in fleet if c.prediction_type == PredictionType.regular)
+
+
+@pytest.mark.parametrize("hours", [23, 25])
+def test_next_dst_day_is_found(hours):
+    day = next_day_with_hours(hours)
+    assert day > date.today()
+    assert len(get_prediction_hours(day)) == hours
+
+
+def test_scenarios_report_time_memory_and_requests():
+    result = run_scenario("single-mixed", latency=0.0)
+    assert result["seconds"] > 0
+    assert result["peak_rss_mb"] > 0
+    assert (result["historic_calls"], result["solar_calls"]) == (1, 2)
+
+    results = run_benchmarks(["single-regular"])
+    assert list(results.index) == ["single-regular"]
+
+
+def test_stub_services_count_requests_of_concurrent_threads():
+    historic, solar = LatencyHistoricConsumptionService(), LatencySolarForecastService()
+    connections = synthetic_fleet(1)
+    window = get_prediction_range(date(2024, 6, 3))
+
+    def request(_):
+        for _ in range(200):
+            historic.get_consumption_batch(connections, [window])
+            solar.predict(*window, 52.5, 5.5, 35, 180, 4.0)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(request, range(8)))
+
+    assert (historic.calls, solar.calls) == (1600, 1600)
+
+
+def test_slower_runs_than_baseline_are_regressions():
+    baseline = DataFrame({"seconds": [1.0, 1.0]}, index=["fast", "slow"])
+    results = DataFrame({"seconds": [1.1, 1.5]}, index=["fast", "slow"])
+
+    compared = compare(results, baseline, tolerance=1.2)
+
+    assert compared["regression"].tolist() == [False, True]
+    assert compared["ratio"].tolist() == pytest.approx([1.1, 1.5])
+
+
+def test_async_fleet_scenario_fetches_history_at_once():
+    result = run_scenario("async-fleet-1k", latency=0.0)
+    assert result["historic_calls"] == 1
+    assert result["solar_calls"] == run_scenario("fleet-1k", latency=0.0)["solar_calls"]
@@ -0,0 +1,76 @@
+from datetime import date, timedelta
+
+import numpy as np
+from pandas import date_range
+
+from day_ahead_order.utils.calendar_index import CalendarIndex, calendar_index
+from day_ahead_order.utils.datetime import (
+    get_prediction_hours,
+    get_prediction_range,
+    last_weekday_before,
+    local_hour_slots,
+    repeated_hour_slot,
+)
+from day_ahead_order.utils.day_classes import DayClass
+
+
+def test_days_have_23_24_or_25_hours():
+    index = calendar_index()
+    days = [date(2024, 3, 30), date(2024, 3, 31), date(2024, 10, 27), date(2024, 10, 28)]
+
+    assert [len(index.hours_of(day)) for day in days] == [24, 23, 25, 24]
+    assert index.hours_of(date(2024, 3, 31))[0].isoformat() == "2024-03-30T23:00:00+00:00"
+    assert index.hours_of(date(2024, 10, 27))[-1].isoformat() == "2024-10-27T22:00:00+00:00"
+
+
+def test_lookups_equal_a_table_of_a_different_span():
+    # a table starting elsewhere computes each day on its own boundaries
+    index = calendar_index()
+    other = CalendarIndex(date(2024, 3, 1), date(2024, 11, 30))
+    for day in [date(2024, 3, 1) + timedelta(days=i) for i in range(275)]:
+        assert index.hours_of(day).equals(other.hours_of(day))
+        assert index.range_of(day) == other.range_of(day)
+        np.testing.assert_array_equal(index.slots_of(day), other.slots_of(day))
+
+
+def test_days_outside_of_the_span_are_computed():
+    # DST of 2040 ends on 28 October
+    hours = get_prediction_hours(date(2040, 10, 28))
+    begins, ends = get_prediction_range(date(2040, 10, 28))
+
+    assert not calendar_index().covers(date(2040, 10, 28))
+    assert len(hours) == 25
+    assert (hours[0], hours[-1]) == (begins, ends.replace(minute=0, second=0, microsecond=0))
+
+
+def test_repeated_hour_gets_its_own_slot():
+    slots = local_hour_slots(get_prediction_hours(date(2024, 10, 27)))
+    assert slots.tolist() == [0, 1, 2, repeated_hour_slot] + list(range(3, 24))
+
+    quarters = date_range("2024-10-27 00:00", periods=8, freq="15min", tz="UTC")
+    assert local_hour_slots(quarters).tolist() == [2] * 4 + [repeated_hour_slot] * 4
+
+    assert local_hour_slots(get_prediction_hours(date(2024, 3, 31))).tolist() == [0, 1] + list(
+        range(3, 24)
+    )
+
+
+def test_days_are_classified_inside_and_outside_of_the_span():
+    index = calendar_index()
+    days = [date(2024, 3, 31), date(2024, 4, 1), date(2024, 4, 2), date(2040, 12, 25), date(2040, 10, 28)]
+
+    classes = index.classes_of(days)
+
+    assert classes.tolist() == [
+        DayClass.dst_transition | DayClass.holiday,  # Easter Sunday
+        DayClass.holiday,
+        DayClass.normal,
+        DayClass.holiday,
+        DayClass.dst_transition,
+    ]
+
+
+def test_last_weekday_before_skips_the_anchor_day():
+    monday = date(2024, 6, 3)
+    assert last_weekday_before(0, monday) == date(2024, 5, 27)
+    assert last_weekday_before(6, monday) == date(2024, 6, 2)
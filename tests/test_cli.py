@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+from pandas import read_csv
+
+from day_ahead_order.benchmark import measure_startup
+
+package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_cli(*args):
+    return subprocess.run(
+        [sys.executable, "-m", "day_ahead_order", *args],
+        cwd=package_parent,
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_help_does_not_import_numpy_or_pandas():
+    assert run_cli("--help").returncode == 0
+    assert measure_startup()["heavy_imports"] == 0
+
+
+def test_invalid_arguments_are_reported():
+    completed = run_cli("--days", "0")
+    assert completed.returncode == 2
+    assert "--days should be at least 1" in completed.stderr
+
+
+def test_example_connections_get_predicted(tmp_path):
+    completed = run_cli()
+    assert completed.returncode == 0, completed.stderr
+    assert "NaN" not in completed.stdout
+
+    assert run_cli("--output", str(tmp_path / "predictions.csv")).returncode == 0
+    predictions = read_csv(tmp_path / "predictions.csv")
+    assert len(predictions) == 3 * 48
+    assert np.isfinite(predictions["kwh"]).all()
+
+
+def test_predictions_and_order_get_written(tmp_path):
+    connections = tmp_path / "connections.csv"
+    connections.write_text(
+        "name,ean_code,prediction_type,standard_yearly_consumption,balancing_portfolio\n"
+        "a,870000000000000001,regular,8760,north\n"
+        "b,870000000000000002,regular,17520,north\n"
+    )
+
+    completed = run_cli(
+        "--connections", str(connections),
+        "--days", "1",
+        "--output", str(tmp_path / "predictions.csv"),
+        "--order", str(tmp_path / "order.csv"),
+    )
+
+    assert completed.returncode == 0, completed.stderr
+    predictions = read_csv(tmp_path / "predictions.csv")
+    order = read_csv(tmp_path / "order.csv")
+    assert set(predictions["ean"].astype(str)) == {"870000000000000001", "870000000000000002"}
+    assert set(order["balancing_portfolio"]) == {"north"}
+    assert len(order) == len(predictions) // 2
@@ -0,0 +1,192 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+from day_ahead_order.consumption_coalescing import (
+    CoalescingHistoricConsumptionService,
+    covers,
+    merge_windows,
+)
+from day_ahead_order.fakes import LatencyHistoricConsumptionService, LatencySolarForecastService
+from day_ahead_order.grid_connection import GridConnection, PredictionType
+from day_ahead_order.solar_forecast_coalescing import CoalescingSolarForecastService
+from day_ahead_order.utils.single_flight import SingleFlight
+
+day_start = datetime(2024, 6, 3, tzinfo=timezone.utc)
+
+
+def window(first_hour, last_hour):
+    return (
+        day_start + timedelta(hours=first_hour),
+        day_start + timedelta(hours=last_hour, minutes=45),
+    )
+
+
+def regular_connections(count):
+    return [
+        GridConnection(f"c{i}", str(i), date(2020, 1, 1), None, PredictionType.regular, 1000)
+        for i in range(count)
+    ]
+
+
+def concurrently(*calls):
+    with ThreadPoolExecutor(len(calls)) as executor:
+        futures = [executor.submit(call) for call in calls]
+        return [future.result() for future in futures]
+
+
+def rows(consumption):
+    # the order of rows is not part of get_consumption_many's contract
+    return consumption.sort_values(["ean", "interval_start"], ignore_index=True)
+
+
+def test_overlapping_windows_get_merged():
+    assert merge_windows([window(5, 8), window(0, 2), window(2, 3)]) == (
+        (window(0, 0)[0], window(3, 3)[1]),
+        window(5, 8),
+    )
+    assert covers(merge_windows([window(0, 3), window(5, 8)]), window(6, 7))
+    assert not covers(merge_windows([window(0, 3), window(5, 8)]), window(3, 5))
+
+
+def test_concurrent_callers_share_one_request():
+    upstream = LatencyHistoricConsumptionService(latency=0.1)
+    service = CoalescingHistoricConsumptionService(upstream, linger=0.2)
+    connections = regular_connections(3)
+    # every EAN ends up with the same merged windows, fetched in one request
+    requests = [
+        (connections, [window(0, 5)]),
+        (connections, [window(3, 9)]),
+        (connections, [window(0, 1), window(12, 13)]),
+    ]
+
+    results = concurrently(
+        *(lambda c=c, w=w: service.get_consumption_many(c, w) for c, w in requests)
+    )
+
+    assert upstream.calls == 1
+    direct = LatencyHistoricConsumptionService()
+    for (group, windows), result in zip(requests, results):
+        assert_frame_equal(rows(result), rows(direct.get_consumption_many(group, windows)))
+
+
+def test_windows_covered_by_a_flight_in_the_air_are_not_fetched_again():
+    upstream = LatencyHistoricConsumptionService(latency=0.3)
+    service = CoalescingHistoricConsumptionService(upstream)
+    connections = regular_connections(2)
+
+    def later():
+        time.sleep(0.1)
+        return service.get_consumption_many(connections[:1], [window(2, 3)])
+
+    whole, part = concurrently(
+        lambda: service.get_consumption_many(connections, [window(0, 23)]), later
+    )
+
+    assert upstream.calls == 1
+    assert_frame_equal(part, upstream.get_consumption_many(connections[:1], [window(2, 3)]))
+    assert len(whole) == 2 * 96
+    assert not service.flights
+
+
+def test_async_callers_share_one_request():
+    upstream = LatencyHistoricConsumptionService(latency=0.1)
+    service = CoalescingHistoricConsumptionService(upstream, linger=0.05)
+    connections = regular_connections(2)
+
+    async def predict():
+        return await asyncio.gather(
+            service.aget_consumption_many(connections, [window(0, 5)]),
+            service.aget_consumption_many(connections[:1], [window(2, 4)]),
+        )
+
+    whole, part = asyncio.run(predict())
+
+    assert upstream.calls == 1
+    assert len(whole) == 2 * 24
+    assert_frame_equal(part, LatencyHistoricConsumptionService().get_consumption_many(
+        connections[:1], [window(2, 4)]))
+
+
+def test_failures_reach_every_caller():
+    class FailingService(LatencyHistoricConsumptionService):
+        def get_consumption_batch(self, connections, windows):
+            super().get_consumption_batch(connections, windows)
+            raise ConnectionError("platform down")
+
+    upstream = FailingService(latency=0.2)
+    service = CoalescingHistoricConsumptionService(upstream, linger=0.1)
+    connections = regular_connections(1)
+
+    def fetch():
+        try:
+            service.get_consumption_many(connections, [window(0, 1)])
+        except ConnectionError as error:
+            return error
+
+    errors = concurrently(fetch, fetch)
+
+    assert upstream.calls == 1
+    assert all(isinstance(error, ConnectionError) for error in errors)
+    assert not service.flights
+
+
+def test_single_flight_calls_once_per_key():
+    flights = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def slow(value):
+        calls.append(value)
+        started.set()
+        time.sleep(0.2)
+        return value * 2
+
+    def follower():
+        started.wait()
+        return flights.call("key", slow, 21)
+
+    assert concurrently(lambda: flights.call("key", slow, 21), follower) == [42, 42]
+    assert calls == [21]
+    assert flights.call("key", slow, 1) == 2
+
+
+def test_single_flight_is_made_again_when_the_caller_making_it_gets_interrupted():
+    flights = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    def interrupted():
+        calls.append("interrupted")
+        started.set()
+        time.sleep(0.2)
+        raise KeyboardInterrupt
+
+    def follower():
+        started.wait()
+        return flights.call("key", lambda: calls.append("retried") or "done")
+
+    def leader():
+        with pytest.raises(KeyboardInterrupt):
+            flights.call("key", interrupted)
+
+    assert concurrently(leader, follower)[1] == "done"
+    assert calls == ["interrupted", "retried"]
+
+
+def test_identical_solar_requests_share_one_call():
+    upstream = LatencySolarForecastService(latency=0.2)
+    service = CoalescingSolarForecastService(upstream)
+    args = (window(0, 23)[0], window(0, 23)[1], 52.5, 5.5, 35, 180, 4.0)
+
+    first, second = concurrently(lambda: service.predict(*args), lambda: service.predict(*args))
+
+    assert upstream.calls == 1
+    assert first.equals(second)
+    service.predict(*args)
+    assert upstream.calls == 2
@@ -0,0 +1,104 @@
+import json
+from datetime import date
+
+import pytest
+
+from day_ahead_order.connection_loader import load_connections
+from day_ahead_order.grid_connection import PredictionType
+
+csv_header = (
+    "name,ean_code,active_from,active_until,prediction_type,standard_yearly_consumption,"
+    "latitude,longitude,solar_plane_declination,solar_plane_azimuth,solar_rated_power,"
+    "balancing_portfolio\n"
+)
+
+
+def write_csv(path, rows):
+    path.write_text(csv_header + "".join(row + "\n" for row in rows))
+    return str(path)
+
+
+def test_csv_is_loaded_in_chunks(tmp_path):
+    path = write_csv(
+        tmp_path / "connections.csv",
+        [f"c{i},87{i:016d},2020-01-01,,regular,1000,,,,,,north" for i in range(5)]
+        + ["s,8799999999999999999,2020-01-01,2025-01-01,solar,-500,52.5,5.5,35,180,4,"],
+    )
+
+    chunks = list(load_connections(path, chunk_size=4))
+
+    assert [len(chunk) for chunk in chunks] == [4, 2]
+    first, solar = chunks[0][0], chunks[1][-1]
+    assert (first.ean_code, first.active_from, first.active_until) == (
+        "870000000000000000", date(2020, 1, 1), None
+    )
+    assert first.balancing_portfolio == "north"
+    assert solar.prediction_type == PredictionType.solar
+    assert (solar.solar_rated_power, solar.balancing_portfolio) == (4.0, None)
+
+
+def test_jsonl_is_loaded(tmp_path):
+    path = tmp_path / "connections.jsonl"
+    path.write_text(
+        json.dumps({
+            "name": "c",
+            "ean_code": "870000000000000001",
+            "prediction_type": "regular",
+            "standard_yearly_consumption": 1000,
+        })
+        + "\n\n"
+    )
+
+    (chunk,) = load_connections(str(path))
+
+    assert chunk[0].ean_code == "870000000000000001"
+    assert chunk[0].active_from is None
+
+
+@pytest.mark.parametrize(
+    "row, message",
+    [
+        ("c,870000000000000001,2020-01-01,,hourly,1000,,,,,,", "prediction_type should be one of"),
+        ("c,870000000000000001,2020-01-01,,,1000,,,,,,", "prediction_type is required"),
+        ("c,870000000000000001,2020-01-01,,solar,1000,52.5,,35,180,4,", "longitude"),
+        ("c,,2020-01-01,,regular,1000,,,,,,", "ean_code is required"),
+        ("c,870000000000000001,yesterday,,regular,1000,,,,,,", "yesterday"),
+    ],
+)
+def test_invalid_row_is_reported_with_its_line(tmp_path, row, message):
+    path = write_csv(tmp_path / "connections.csv", ["c,870000000000000000,,,regular,1000,,,,,,", row])
+
+    with pytest.raises(ValueError, match=f"connections.csv:3: .*{message}"):
+        list(load_connections(path))
+
+
+@pytest.mark.parametrize("row", ['["c", "870000000000000001"]', '"c"', "null"])
+def test_json_row_which_is_not_an_object_is_reported_with_its_line(tmp_path, row):
+    path = tmp_path / "connections.jsonl"
+    path.write_text(row + "\n")
+
+    with pytest.raises(ValueError, match="connections.jsonl:1: expected an object"):
+        list(load_connections(str(path)))
+
+
+def test_duplicate_ean_is_rejected_across_chunks(tmp_path):
+    path = write_csv(
+        tmp_path / "connections.csv",
+        [f"c{i},87{i:016d},,,regular,1000,,,,,," for i in range(3)]
+        + ["again,870000000000000001,,,regular,1000,,,,,,"],
+    )
+
+    chunks = load_connections(path, chunk_size=2)
+
+    assert len(next(chunks)) == 2
+    with pytest.raises(
+        ValueError, match="connections.csv:5: duplicate ean_code 870000000000000001, first on line 3"
+    ):
+        next(chunks)
+
+
+def test_unsupported_file_is_rejected(tmp_path):
+    path = tmp_path / "connections.xlsx"
+    path.write_text("")
+    with pytest.raises(ValueError, match="Unsupported connection file"):
+        list(load_connections(str(path)))
@@ -0,0 +1,81 @@
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from day_ahead_order.connection_registry import ConnectionRegistry, activity_matrix
+from day_ahead_order.grid_connection import GridConnection, PredictionType
+from day_ahead_order.historic_consumption_service import HistoricConsumptionService
+from day_ahead_order.prediction import PredictionService
+from day_ahead_order.solar_forecast import SolarForecastService
+
+
+def connections():
+    return [
+        GridConnection("r", "1", date(2024, 1, 1), None, PredictionType.regular, 1000,
+                       balancing_portfolio="north"),
+        GridConnection("s", "2", None, date(2024, 6, 30), PredictionType.solar, -500,
+                       52.5, 5.5, 35, 180, 4.0),
+        # 2024-01-31 23:30 UTC is already 1 February in Netherlands
+        GridConnection("m", "3", datetime(2024, 1, 31, 23, 30, tzinfo=timezone.utc), None,
+                       PredictionType.mixed_solar_regular, 800, 52.0, 5.0, 20, 90, 2.5),
+    ]
+
+
+def attributes(connection):
+    return {name: getattr(connection, name) for name in GridConnection.__slots__}
+
+
+def test_views_equal_the_connections():
+    registry = ConnectionRegistry.from_connections(connections())
+
+    assert len(registry) == 3
+    assert attributes(registry[0]) == attributes(connections()[0])
+    assert attributes(registry[1]) == attributes(connections()[1])
+    assert registry.by_ean("3").active_from == date(2024, 2, 1)
+    assert registry.by_ean("4") is None
+    assert connections()[2] in registry
+    assert [connection.ean_code for connection in registry[1:]] == ["2", "3"]
+
+
+def test_activity_equals_is_active_on():
+    days = [date(2023, 12, 31), date(2024, 1, 1), date(2024, 1, 31), date(2024, 2, 1),
+            date(2024, 6, 30), date(2024, 7, 1)]
+    registry = ConnectionRegistry.from_connections(connections())
+
+    expected = [[connection.is_active_on(day) for day in days] for connection in connections()]
+
+    assert registry.activity_matrix(days).tolist() == expected
+    assert activity_matrix(connections(), days).tolist() == expected
+    assert registry.active_on(date(2024, 1, 15)).tolist() == [True, True, False]
+
+
+def test_duplicate_ean_codes_are_rejected():
+    with pytest.raises(ValueError, match="unique"):
+        ConnectionRegistry.from_connections(connections() + connections()[:1])
+
+
+def test_connections_are_grouped_by_prediction_type():
+    groups = ConnectionRegistry.from_connections(connections()).group_by_prediction_type()
+    assert {prediction_type: list(group.ean_codes) for prediction_type, group in groups.items()} == {
+        PredictionType.regular: ["1"],
+        PredictionType.solar: ["2"],
+        PredictionType.mixed_solar_regular: ["3"],
+    }
+
+
+def test_registry_predicts_the_same_as_a_list():
+    service = PredictionService(SolarForecastService(), HistoricConsumptionService())
+    fleet = [
+        GridConnection(str(i), str(i), date(2020, 1, 1), None, connection.prediction_type, 1000,
+                       52.5, 5.5, 35, 180, 4.0)
+        for i, connection in enumerate(connections() * 2)
+    ]
+    days = [date.today() + timedelta(days=1)]
+
+    registry = ConnectionRegistry.from_connections(fleet)
+
+    np.testing.assert_allclose(
+        service.make_predictions_for_fleet(registry, days).to_numpy(),
+        service.make_predictions_for_fleet(fleet, days).to_numpy(),
+    )
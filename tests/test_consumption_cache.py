@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+
+from day_ahead_order.consumption_cache import CachingHistoricConsumptionService, utc_datetime64
+from day_ahead_order.fakes import LatencyHistoricConsumptionService
+from day_ahead_order.grid_connection import GridConnection, PredictionType
+from day_ahead_order.utils.cache import CacheStats
+from day_ahead_order.utils.datetime import get_prediction_range
+
+
+def regular_connections(count):
+    return [
+        GridConnection(f"c{i}", f"87{i:016d}", date(2020, 1, 1), None, PredictionType.regular, 1000)
+        for i in range(count)
+    ]
+
+
+class GappyService(LatencyHistoricConsumptionService):
+    """
+    Returns no data for some EANs, and only the first `kept` intervals of
+    a day for others.
+    """
+
+    def __init__(self, empty=(), partial=(), kept=10):
+        super().__init__()
+        self.empty = set(empty)
+        self.partial = set(partial)
+        self.kept = kept
+
+    def get_consumption_batch(self, connections, windows):
+        consumption = super().get_consumption_batch(connections, windows)
+        keep = ~consumption["ean"].isin(self.empty).to_numpy()
+        partial = consumption["ean"].isin(self.partial).to_numpy()
+        keep &= ~partial | (consumption.groupby("ean").cumcount().to_numpy() < self.kept)
+        return consumption[keep].reset_index(drop=True)
+
+
+def rows_of(consumption):
+    return sorted(
+        zip(
+            consumption["ean"].astype(str),
+            utc_datetime64(consumption["interval_start"]).tolist(),
+            consumption["kwh"].tolist(),
+        )
+    )
+
+
+def windows_of(days):
+    return [get_prediction_range(day) for day in days]
+
+
+def test_settled_days_get_fetched_once():
+    service = LatencyHistoricConsumptionService()
+    cache = CachingHistoricConsumptionService(service)
+    connections = regular_connections(3)
+    # spring and autumn DST transitions as well
+    days = [date(2024, 3, 30), date(2024, 3, 31), date(2024, 10, 27)]
+
+    first = cache.get_consumption_many(connections, windows_of(days))
+    calls = service.calls
+    second = cache.get_consumption_many(connections, windows_of(days))
+
+    assert service.calls == calls
+    assert len(first) == 3 * (96 + 92 + 100)
+    assert rows_of(second) == rows_of(first)
+    assert cache.stats.memory_hits == 9
+    assert cache.stats.misses == 9
+
+
+def test_days_within_the_settling_period_are_always_fetched():
+    service = LatencyHistoricConsumptionService()
+    cache = CachingHistoricConsumptionService(service, settling_days=2)
+    connections = regular_connections(1)
+    today = date.today()
+    recent = [today - timedelta(days=2), today - timedelta(days=1)]
+
+    cache.get_consumption_many(connections, windows_of(recent))
+    calls = service.calls
+    cache.get_consumption_many(connections, windows_of(recent))
+
+    assert service.calls > calls
+    settled = today - timedelta(days=3)
+    assert cache.is_cacheable(settled, get_prediction_range(settled))
+
+
+def test_empty_and_partial_days_are_not_cached():
+    connections = regular_connections(3)
+    service = GappyService(empty=[connections[0].ean_code], partial=[connections[1].ean_code])
+    cache = CachingHistoricConsumptionService(service)
+    days = [date(2024, 5, 6)]
+
+    first = cache.get_consumption_many(connections, windows_of(days))
+    service.empty = service.partial = set()
+    second = cache.get_consumption_many(connections, windows_of(days))
+
+    assert first.groupby("ean").size().to_dict() == {
+        connections[1].ean_code: 10,
+        connections[2].ean_code: 96,
+    }
+    assert second.groupby("ean").size().to_dict() == {c.ean_code: 96 for c in connections}
+    assert cache.stats.memory_hits == 1
+
+
+def test_windows_on_the_same_day_are_all_fetched():
+    service = LatencyHistoricConsumptionService()
+    cache = CachingHistoricConsumptionService(service)
+    connections = regular_connections(1)
+    day_start = get_prediction_range(date(2024, 5, 6))[0]
+    windows = [
+        (day_start, day_start + timedelta(minutes=60)),
+        (day_start + timedelta(hours=2), day_start + timedelta(hours=3)),
+    ]
+
+    consumption = cache.get_consumption_many(connections, windows)
+
+    assert len(consumption) == 10
+    assert rows_of(consumption) == rows_of(service.get_consumption_many(connections, windows))
+
+
+def test_disk_store_outlives_the_process_cache(tmp_path):
+    connections = regular_connections(2)
+    days = [date(2024, 5, 6), date(2024, 5, 7)]
+    CachingHistoricConsumptionService(
+        LatencyHistoricConsumptionService(), cache_dir=str(tmp_path)
+    ).get_consumption_many(connections, windows_of(days))
+
+    service = LatencyHistoricConsumptionService()
+    cache = CachingHistoricConsumptionService(service, cache_dir=str(tmp_path))
+    hourly = cache.get_hourly_consumption(connections, days)
+
+    assert service.calls == 0
+    assert cache.stats.disk_hits == 4
+    assert np.array_equal(hourly, service.get_hourly_consumption(connections, days), equal_nan=True)
+
+
+def test_stats_add_up_across_threads():
+    stats = CacheStats()
+
+    def count(_):
+        for _ in range(1000):
+            stats.add(memory_hits=1, misses=2)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(count, range(8)))
+
+    assert (stats.memory_hits, stats.misses) == (8000, 16000)
+    assert stats.hit_rate == 1 / 3
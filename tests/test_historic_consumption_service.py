@@ -0,0 +1,70 @@
+from datetime import date
+
+import numpy as np
+
+from day_ahead_order.grid_connection import GridConnection, PredictionType
+from day_ahead_order.historic_consumption_service import HistoricConsumptionService
+from day_ahead_order.utils.datetime import get_prediction_range, repeated_hour_slot
+
+
+class CountingHistoricConsumptionService(HistoricConsumptionService):
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def get_consumption_batch(self, connections, windows):
+        self.batches.append(len(connections))
+        return super().get_consumption_batch(connections, windows)
+
+
+def regular_connections(count):
+    return [
+        GridConnection(f"c{i}", f"87{i:016d}", date(2020, 1, 1), None, PredictionType.regular, 1000)
+        for i in range(count)
+    ]
+
+
+windows = [get_prediction_range(date(2024, 3, 31)), get_prediction_range(date(2024, 10, 27))]
+
+
+def test_bulk_fetch_equals_fetches_per_connection_and_window():
+    connections = regular_connections(3)
+    service = HistoricConsumptionService()
+
+    consumption = service.get_consumption_many(connections, windows)
+
+    for connection in connections:
+        rows = consumption[consumption["ean"] == connection.ean_code]
+        single = [service.get_consumption(connection, *window) for window in windows]
+        assert rows["kwh"].tolist() == [kwh for series in single for kwh in series]
+        assert rows["interval_start"].tolist() == [t for series in single for t in series.index]
+
+
+def test_connections_are_fetched_in_batches():
+    service = CountingHistoricConsumptionService()
+
+    consumption = service.get_consumption_many(regular_connections(5), windows, batch_size=2)
+
+    assert service.batches == [2, 2, 1]
+    assert consumption.equals(
+        HistoricConsumptionService().get_consumption_many(regular_connections(5), windows)
+    )
+
+
+def test_nothing_to_fetch_gives_typed_empty_frame():
+    consumption = HistoricConsumptionService().get_consumption_many([], windows)
+
+    assert consumption.empty
+    assert list(consumption.columns) == ["ean", "interval_start", "kwh"]
+    assert str(consumption["interval_start"].dt.tz) == "UTC"
+
+
+def test_hourly_consumption_is_lined_up_on_local_hour_slots():
+    days = [date(2024, 3, 31), date(2024, 10, 27)]
+
+    hourly = HistoricConsumptionService().get_hourly_consumption(regular_connections(2), days)
+
+    assert hourly.shape == (2, 2, 25)
+    # 02:00 does not exist when summer time starts, and happens twice when it ends
+    assert np.isnan(hourly[:, 0, 2]).all() and np.isnan(hourly[:, 0, repeated_hour_slot]).all()
+    assert not np.isnan(hourly[:, 1]).any()
@@ -0,0 +1,96 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from day_ahead_order.history_selection import WeekdaySelector, detect_anomalies, expected_slots
+from day_ahead_order.utils.day_classes import DayClass
+
+# predicting Monday 5 and Tuesday 6 April 2027, a week after Easter Monday
+anchor = date(2027, 4, 4)
+days = [date(2027, 4, 5), date(2027, 4, 6)]
+easter_monday = date(2027, 3, 29)
+
+
+def regular_history(reach, connections=3):
+    hourly = np.where(expected_slots(reach)[np.newaxis], 1.0, np.nan)
+    return hourly.repeat(connections, axis=0)
+
+
+def selected(windows, reach, connection, day):
+    return [reach[i] for i in np.flatnonzero(windows[connection, day])]
+
+
+def test_reach_covers_max_weeks_back_of_each_weekday():
+    reach = WeekdaySelector().reach_days(days, anchor)
+
+    assert len(reach) == 16
+    assert reach == sorted(reach)
+    assert (reach[0], reach[-1]) == (date(2027, 2, 8), date(2027, 3, 30))
+
+
+def test_holidays_are_skipped():
+    selector = WeekdaySelector()
+
+    first_choice = selector.first_choice_days(days, anchor)
+
+    assert easter_monday not in first_choice
+    assert [day for day in first_choice if day.weekday() == 0] == [
+        date(2027, 3, 8), date(2027, 3, 15), date(2027, 3, 22)
+    ]
+
+
+def test_gaps_and_zero_runs_are_detected():
+    reach = WeekdaySelector().reach_days(days, anchor)
+    hourly = regular_history(reach)
+    hourly[1, reach.index(date(2027, 3, 22)), 3] = np.nan
+    hourly[2, reach.index(date(2027, 3, 30)), 2:9] = 0.0
+    # shorter than a zero run
+    hourly[2, reach.index(date(2027, 3, 23)), 2:7] = 0.0
+
+    anomalies = detect_anomalies(hourly, reach)
+
+    assert anomalies[0].tolist() == [0] * len(reach)
+    assert anomalies[1, reach.index(date(2027, 3, 22))] == DayClass.gap
+    assert anomalies[2, reach.index(date(2027, 3, 30))] == DayClass.zero_run
+    assert anomalies[2, reach.index(date(2027, 3, 23))] == 0
+    assert np.count_nonzero(anomalies) == 2
+
+
+def test_missing_hour_of_a_dst_day_is_not_a_gap():
+    reach = [date(2027, 3, 28), date(2027, 10, 31)]
+    hourly = regular_history(reach, connections=1)
+
+    assert expected_slots(reach).sum(axis=1).tolist() == [23, 25]
+    assert detect_anomalies(hourly, reach).tolist() == [[0, 0]]
+
+
+def test_anomalous_days_get_replaced_by_older_ones():
+    selector = WeekdaySelector()
+    reach = selector.reach_days(days, anchor)
+    hourly = regular_history(reach)
+    hourly[1, reach.index(date(2027, 3, 22)), 3] = np.nan
+    hourly[2, reach.index(date(2027, 3, 30)), 2:9] = 0.0
+
+    windows = selector.windows(hourly, reach, days, anchors=[anchor] * 2)
+
+    assert selected(windows, reach, 0, 0) == [date(2027, 3, 8), date(2027, 3, 15), date(2027, 3, 22)]
+    assert selected(windows, reach, 1, 0) == [date(2027, 3, 1), date(2027, 3, 8), date(2027, 3, 15)]
+    assert selected(windows, reach, 2, 1) == [date(2027, 3, 9), date(2027, 3, 16), date(2027, 3, 23)]
+    assert not selector.short_of_days(hourly, reach, days).any()
+
+
+def test_history_without_good_days_falls_back_to_the_blind_selection():
+    selector = WeekdaySelector()
+    reach = selector.reach_days(days, anchor)
+    hourly = np.full_like(regular_history(reach), np.nan)
+
+    windows = selector.windows(hourly, reach, days, anchors=[anchor] * 2)
+
+    assert selected(windows, reach, 0, 0) == [date(2027, 3, 15), date(2027, 3, 22), easter_monday]
+    assert selector.short_of_days(hourly, reach, days).all()
+
+
+def test_reach_is_at_least_the_number_of_weekdays():
+    with pytest.raises(ValueError, match="max_weeks_back"):
+        WeekdaySelector(weekdays=3, max_weeks_back=2)
@@ -0,0 +1,114 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from day_ahead_order.grid_connection import GridConnection, PredictionType
+from day_ahead_order.historic_consumption_service import HistoricConsumptionService
+from day_ahead_order.history_store import HistoryStore, StoredHistoricConsumptionService
+from day_ahead_order.utils.datetime import get_prediction_range
+
+
+def regular_connections(count):
+    return [
+        GridConnection(f"c{i}", f"87{i:016d}", date(2020, 1, 1), None, PredictionType.regular, 1000)
+        for i in range(count)
+    ]
+
+
+# days around both switches of daylight saving time in 2024
+days = [date(2024, 3, 30), date(2024, 3, 31), date(2024, 10, 27), date(2024, 10, 28)]
+
+
+def test_days_take_92_96_or_100_intervals(tmp_path):
+    store = HistoryStore(str(tmp_path), first_day=date(2024, 1, 1))
+    store.ingest(HistoricConsumptionService(), regular_connections(1), days)
+
+    ean = regular_connections(1)[0].ean_code
+    assert [len(store.day_values(ean, day)) for day in days] == [96, 92, 100, 96]
+    assert [len(store.hourly(ean, day)) for day in days] == [24, 23, 25, 24]
+    # days never written are NaN, not missing
+    assert np.isnan(store.day_values(ean, date(2024, 3, 29))).all()
+
+
+def test_stored_history_equals_the_service(tmp_path):
+    connections = regular_connections(3)
+    service = HistoricConsumptionService()
+    store = HistoryStore(str(tmp_path), first_day=date(2024, 1, 1))
+    store.ingest(service, connections, days)
+
+    stored = StoredHistoricConsumptionService(store)
+
+    np.testing.assert_array_equal(
+        stored.get_hourly_consumption(connections, days),
+        service.get_hourly_consumption(connections, days),
+    )
+    time_start, time_end = get_prediction_range(days[1])
+    fetched = service.get_consumption(connections[0], time_start, time_end)
+    assert stored.get_consumption(connections[0], time_start, time_end).tolist() == fetched.tolist()
+
+
+def test_hourly_history_of_many_days_equals_day_by_day(tmp_path):
+    connections = regular_connections(2)
+    store = HistoryStore(str(tmp_path), first_day=date(2024, 3, 30))
+    store.ingest(HistoricConsumptionService(), connections[:1], days[:2])
+    # a single interval of an hour, then the end of the timeline
+    partial = HistoricConsumptionService().get_consumption_many(
+        connections[:1], [get_prediction_range(days[2])]
+    ).iloc[40:41]
+    store.append(partial)
+    ean_codes = [connection.ean_code for connection in connections]
+    # before the first day, written, partially written, never written
+    requested = [date(2024, 3, 29)] + days
+
+    hourly = StoredHistoricConsumptionService(store).get_hourly_consumption(
+        connections, requested
+    )
+
+    assert hourly.shape == (2, 5, 25)
+    for row, ean in enumerate(ean_codes):
+        for column, day in enumerate(requested):
+            slots = store.calendar.slots_of(day)
+            expected = store.hourly(ean, day) if day >= store.first_day else np.nan
+            np.testing.assert_array_equal(hourly[row, column, slots], expected)
+    assert np.count_nonzero(~np.isnan(hourly[0, 3])) == 1
+    assert np.isnan(hourly[1]).all()
+
+
+def test_late_correction_overwrites_the_intervals(tmp_path):
+    connection = regular_connections(1)[0]
+    store = HistoryStore(str(tmp_path), first_day=date(2024, 1, 1))
+    store.ingest(HistoricConsumptionService(), [connection], days[:2])
+    correction = HistoricConsumptionService().get_consumption_many(
+        [connection], [get_prediction_range(days[0])]
+    )
+    correction["kwh"] = 1.0
+
+    store.append(correction)
+
+    assert (store.day_values(connection.ean_code, days[0]) == 1.0).all()
+    assert not (store.day_values(connection.ean_code, days[1]) == 1.0).all()
+
+
+def test_store_is_reopened_from_its_metadata(tmp_path):
+    connection = regular_connections(1)[0]
+    HistoryStore(str(tmp_path), first_day=date(2024, 1, 1)).ingest(
+        HistoricConsumptionService(), [connection], days
+    )
+
+    store = HistoryStore(str(tmp_path))
+
+    assert store.first_day == date(2024, 1, 1)
+    assert len(store.hourly(connection.ean_code, days[2])) == 25
+    with pytest.raises(ValueError):
+        HistoryStore(str(tmp_path), first_day=date(2023, 1, 1))
+
+
+def test_days_outside_of_the_calendar_index_are_rejected(tmp_path):
+    store = HistoryStore(str(tmp_path), first_day=date(2024, 1, 1))
+    ean = regular_connections(1)[0].ean_code
+
+    with pytest.raises(ValueError, match="2038-01-01 is outside of the calendar index"):
+        store.day_values(ean, date(2038, 1, 1))
+    with pytest.raises(ValueError, match="outside of the calendar index"):
+        store.hourly(ean, date(2038, 1, 1))
@@ -0,0 +1,72 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+from pandas import concat
+
+from day_ahead_order.fakes import LatencyHistoricConsumptionService, LatencySolarForecastService
+from day_ahead_order.grid_connection import PredictionType
+from day_ahead_order.prediction import PredictionService, consecutive_runs, days_between
+
+from .test_prediction import connection, prediction_service, upcoming_days
+
+
+def fleet():
+    return [
+        connection("1", PredictionType.regular),
+        connection("2", PredictionType.solar),
+        connection("3", PredictionType.mixed_solar_regular),
+    ]
+
+
+def test_range_equals_predictions_day_by_day():
+    service = prediction_service()
+    days = upcoming_days(9)
+
+    predictions = service.make_prediction_for_range(fleet(), days[0], len(days))
+
+    expected = concat(
+        [service.make_predictions_for_fleet(fleet(), [day]) for day in days], axis=1
+    )
+    assert predictions.columns.equals(expected.columns)
+    np.testing.assert_allclose(predictions.to_numpy(), expected.to_numpy())
+
+
+def test_range_over_dst_changes():
+    service = prediction_service()
+
+    predictions = service.make_prediction_for_range(fleet()[0], date(2024, 10, 26), 3)
+
+    assert len(predictions) == 24 + 25 + 24
+    assert predictions.notna().all()
+
+
+def test_requests_do_not_grow_with_the_horizon():
+    def requests(n_days):
+        history, solar = LatencyHistoricConsumptionService(), LatencySolarForecastService()
+        PredictionService(solar, history).make_prediction_for_range(
+            fleet(), upcoming_days(1)[0], n_days
+        )
+        return history.calls, solar.calls
+
+    assert requests(14) == requests(1)
+
+
+def test_horizon_has_at_least_one_day():
+    with pytest.raises(ValueError, match="at least one day"):
+        prediction_service().make_prediction_for_range(fleet(), upcoming_days(1)[0], 0)
+
+
+def test_days_are_split_into_consecutive_runs():
+    first = date(2024, 3, 30)
+    assert days_between(first, first + timedelta(days=2)) == [
+        first, first + timedelta(days=1), first + timedelta(days=2)
+    ]
+    assert days_between(first, first - timedelta(days=1)) == []
+
+    days = [first + timedelta(days=i) for i in (4, 0, 1, 2, 2, 6)]
+    assert consecutive_runs(days) == [
+        (first, first + timedelta(days=2)),
+        (first + timedelta(days=4), first + timedelta(days=4)),
+        (first + timedelta(days=6), first + timedelta(days=6)),
+    ]
@@ -0,0 +1,92 @@
+import json
+from threading import Thread
+
+from day_ahead_order.instrumentation import (
+    JsonLinesSink,
+    Metrics,
+    PrometheusTextFileSink,
+    null_metrics,
+)
+from day_ahead_order.utils.cache import CacheStats
+
+
+def metric_families(text):
+    """
+    Returns:
+        metric names in order of their TYPE lines, and the TYPE line
+        preceding each sample
+    """
+    typed, sample_types = [], []
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            typed.append(line.split()[2])
+        else:
+            sample_types.append((line.split("{")[0].split()[0], typed[-1]))
+    return typed, sample_types
+
+
+def test_prometheus_samples_follow_the_type_of_their_metric(tmp_path):
+    metrics = Metrics([PrometheusTextFileSink(str(tmp_path / "metrics.prom"))], buckets=(0.1, 1.0))
+    # interleaved, so that the snapshot lists the counters of a name apart
+    metrics.count("service_requests_total", service="history")
+    metrics.count("fallback_total", tier="blind")
+    metrics.count("service_requests_total", service="solar_forecast")
+    metrics.observe("stage_seconds", 0.05, stage="historic_fetch")
+    metrics.observe("stage_seconds", 2.0, stage="averaging")
+    stats = CacheStats()
+    stats.add(memory_hits=3, misses=1)
+    metrics.watch_cache("consumption", stats)
+
+    metrics.flush()
+
+    text = (tmp_path / "metrics.prom").read_text()
+    typed, sample_types = metric_families(text)
+    assert typed == [
+        "day_ahead_order_stage_seconds",
+        "day_ahead_order_service_requests_total",
+        "day_ahead_order_fallback_total",
+        "day_ahead_order_cache_hit_ratio",
+    ]
+    assert all(sample.startswith(family) for sample, family in sample_types)
+    assert 'day_ahead_order_stage_seconds_bucket{stage="averaging",le="+Inf"} 1' in text
+    assert 'day_ahead_order_stage_seconds_bucket{stage="historic_fetch",le="0.1"} 1' in text
+    assert 'day_ahead_order_cache_hit_ratio{cache="consumption"} 0.75' in text
+
+
+def test_counts_from_threads_add_up():
+    metrics = Metrics()
+
+    def count():
+        for _ in range(1000):
+            metrics.count("requests_total")
+            with metrics.stage("work"):
+                pass
+
+    threads = [Thread(target=count) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == [{"name": "requests_total", "labels": {}, "value": 8000}]
+    assert snapshot["histograms"][0]["count"] == 8000
+
+
+def test_json_lines_sink_appends_snapshots(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    metrics = Metrics([JsonLinesSink(str(path))])
+    metrics.count("requests_total")
+    metrics.flush()
+    metrics.count("requests_total")
+    metrics.flush()
+
+    snapshots = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [snapshot["counters"][0]["value"] for snapshot in snapshots] == [1, 2]
+
+
+def test_null_metrics_record_nothing():
+    with null_metrics.stage("work"):
+        null_metrics.count("requests_total")
+    assert null_metrics.snapshot()["counters"] == []
+    assert null_metrics.snapshot()["histograms"] == []
@@ -0,0 +1,105 @@
+from datetime import date, timedelta
+
+import numpy as np
+from pandas import DataFrame, Timestamp
+
+from day_ahead_order.grid_connection import GridConnection, PredictionType
+from day_ahead_order.intraday import IntradayPredictor, interval
+from day_ahead_order.prediction import PredictionService
+from day_ahead_order.solar_forecast import SolarForecastService
+from day_ahead_order.utils.datetime import get_prediction_hours, get_prediction_range
+
+from .test_prediction import ConstantHistoricConsumptionService
+
+
+class RecordingHistoricConsumptionService(ConstantHistoricConsumptionService):
+    def __init__(self, kwh_per_interval):
+        super().__init__(kwh_per_interval)
+        self.windows = []
+
+    def get_consumption_batch(self, connections, windows):
+        self.windows.extend(windows)
+        return super().get_consumption_batch(connections, windows)
+
+
+def regular_connections(count):
+    return [
+        GridConnection(f"c{i}", str(i), date(2020, 1, 1), None, PredictionType.regular, 8760)
+        for i in range(count)
+    ]
+
+
+def predictor(day=None, late_intervals=0):
+    day = date.today() if day is None else day
+    history = RecordingHistoricConsumptionService({"0": 0.25, "1": 0.5})
+    service = PredictionService(SolarForecastService(), history)
+    # 2 kWh every hour of the day ahead
+    baseline = DataFrame(2.0, index=["0"], columns=get_prediction_hours(day))
+    return (
+        IntradayPredictor(service, regular_connections(2), day, baseline, late_intervals),
+        history,
+        Timestamp(get_prediction_range(day)[0]),
+    )
+
+
+def test_measured_quarters_replace_their_share_of_the_baseline():
+    intraday, _, day_start = predictor()
+
+    predictions = intraday.refresh(day_start + timedelta(minutes=80))
+
+    # quarters completed by 1:20 local: all of the first hour, the first one of the second
+    assert predictions.loc["0"].iloc[:3].tolist() == [1.0, 0.25 + 3 * 0.5, 2.0]
+    assert intraday.measured_hours()[0, :2].tolist() == [True, False]
+    # connections missing from the baseline get predicted
+    assert predictions.loc["1"].iloc[2] == 2.0
+
+
+def test_refresh_fetches_only_new_intervals():
+    intraday, history, day_start = predictor(late_intervals=1)
+
+    intraday.refresh(day_start + timedelta(minutes=30))
+    intraday.refresh(day_start + timedelta(minutes=40))
+    intraday.refresh(day_start + timedelta(minutes=60))
+
+    fetched = [
+        ((Timestamp(start) - day_start) // interval, (Timestamp(end) - day_start) // interval)
+        for start, end in history.windows[-3:]
+    ]
+    # (first, last) quarter of each fetch, one late quarter fetched again
+    assert fetched == [(0, 1), (1, 1), (1, 3)]
+
+
+def test_whole_dst_day_gets_measured():
+    day = date(2024, 10, 27)
+    intraday, _, day_start = predictor(day)
+
+    predictions = intraday.refresh(day_start + timedelta(hours=26))
+
+    assert predictions.shape == (2, 25)
+    assert (predictions.loc["0"] == 1.0).all()
+    assert intraday.measured_hours().all()
+
+
+def test_state_is_saved_and_loaded(tmp_path):
+    intraday, _, day_start = predictor()
+    predictions = intraday.refresh(day_start + timedelta(minutes=70))
+    path = str(tmp_path / "intraday.npz")
+
+    intraday.save(path)
+    loaded = IntradayPredictor.load(path, intraday.prediction_service, intraday.connections)
+
+    assert loaded.fetch_from == intraday.fetch_from
+    np.testing.assert_array_equal(loaded.predictions().to_numpy(), predictions.to_numpy())
+    assert IntradayPredictor.load(path, intraday.prediction_service, regular_connections(3)) is None
+
+
+def test_state_path_without_extension_is_kept(tmp_path):
+    intraday, _, day_start = predictor()
+    predictions = intraday.refresh(day_start + timedelta(minutes=70))
+    path = tmp_path / "state"
+
+    intraday.save(str(path))
+    loaded = IntradayPredictor.load(str(path), intraday.prediction_service, intraday.connections)
+
+    assert [file.name for file in tmp_path.iterdir()] == ["state"]
+    np.testing.assert_array_equal(loaded.predictions().to_numpy(), predictions.to_numpy())
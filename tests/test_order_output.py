@@ -0,0 +1,84 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from day_ahead_order.order_output import OrderOutput, TableWriter, order_columns
+from day_ahead_order.prediction import fleet_hours
+
+pyarrow = pytest.importorskip("pyarrow")
+
+
+def predictions_of(ean_codes, values):
+    hours = fleet_hours([date(2024, 3, 31)])
+    return pd.DataFrame(
+        np.asarray(values, dtype=float) * np.ones((len(ean_codes), len(hours))),
+        index=pd.Index(ean_codes, name="ean"),
+        columns=hours,
+    )
+
+
+def read(path):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    if path.endswith(".csv"):
+        return pd.read_csv(path)
+    return pyarrow.ipc.open_file(path).read_all().to_pandas()
+
+
+@pytest.mark.parametrize("extension", [".parquet", ".arrow", ".csv"])
+def test_nothing_written_leaves_empty_files(tmp_path, extension):
+    predictions_path = str(tmp_path / f"predictions{extension}")
+    order_path = str(tmp_path / f"order{extension}")
+
+    with OrderOutput(predictions_path, order_path):
+        pass
+
+    assert read(predictions_path).empty
+    order = read(order_path)
+    assert order.empty
+    assert list(order.columns) == list(order_columns)
+
+
+@pytest.mark.parametrize("extension", [".parquet", ".arrow", ".csv"])
+def test_order_sums_predictions_per_portfolio(tmp_path, extension):
+    predictions_path = str(tmp_path / f"predictions{extension}")
+    order_path = str(tmp_path / f"order{extension}")
+
+    with OrderOutput(predictions_path, order_path) as output:
+        output.write(predictions_of(["a", "b"], [[1.0], [2.0]]), ["p", None])
+        output.write(predictions_of(["c"], [[4.0]]), ["p"])
+
+    # spring DST transition: 23 hours
+    assert len(read(predictions_path)) == 3 * 23
+    order = read(order_path)
+    totals = order.groupby("balancing_portfolio")["kwh"].sum()
+    assert totals.to_dict() == {"p": 5.0 * 23, "unassigned": 2.0 * 23}
+
+
+def test_missing_predictions_are_left_out(tmp_path):
+    path = str(tmp_path / "predictions.parquet")
+    predictions = predictions_of(["a"], [[1.0]])
+    predictions.iloc[0, :3] = np.nan
+
+    with OrderOutput(path) as output:
+        output.write(predictions, ["p"])
+
+    assert len(read(path)) == 20
+
+
+def test_order_is_not_written_on_failure(tmp_path):
+    order_path = tmp_path / "order.parquet"
+
+    with pytest.raises(RuntimeError):
+        with OrderOutput(order_path=str(order_path)) as output:
+            output.write(predictions_of(["a"], [[1.0]]), ["p"])
+            raise RuntimeError("prediction failed")
+
+    assert not order_path.exists()
+
+
+def test_unsupported_extension():
+    with pytest.raises(ValueError):
+        TableWriter("predictions.xlsx", order_columns)
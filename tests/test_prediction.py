@@ -0,0 +1,117 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+from pandas import DataFrame
+
+from day_ahead_order.grid_connection import GridConnection, PredictionType
+from day_ahead_order.historic_consumption_service import (
+    HistoricConsumptionService,
+    window_intervals,
+)
+from day_ahead_order.prediction import PredictionService, fleet_hours
+from day_ahead_order.solar_forecast import SolarForecastService
+from day_ahead_order.utils.datetime import get_prediction_hours
+
+
+class ConstantHistoricConsumptionService(HistoricConsumptionService):
+    """
+    History of each connection is the same kWh every 15 minutes.
+    """
+
+    def __init__(self, kwh_per_interval):
+        super().__init__()
+        self.kwh_per_interval = kwh_per_interval
+
+    def get_consumption_batch(self, connections, windows):
+        intervals = window_intervals(windows)
+        return DataFrame(
+            {
+                "ean": np.repeat([c.ean_code for c in connections], len(intervals)),
+                "interval_start": intervals[np.tile(np.arange(len(intervals)), len(connections))],
+                "kwh": np.repeat(
+                    [self.kwh_per_interval[c.ean_code] for c in connections], len(intervals)
+                ),
+            }
+        )
+
+
+def connection(ean_code, prediction_type, active_from=date(2020, 1, 1), active_until=None):
+    solar = (52.5, 5.5, 35, 180, 4.0) if prediction_type != PredictionType.regular else ()
+    return GridConnection(
+        f"connection {ean_code}", ean_code, active_from, active_until, prediction_type, 8760, *solar
+    )
+
+
+def prediction_service(historic_consumption_service=None):
+    return PredictionService(
+        SolarForecastService(), historic_consumption_service or HistoricConsumptionService()
+    )
+
+
+def upcoming_days(count):
+    tomorrow = date.today() + timedelta(days=1)
+    return [tomorrow + timedelta(days=i) for i in range(count)]
+
+
+def test_fleet_predictions_equal_predictions_per_connection_and_day():
+    connections = [
+        connection("1", PredictionType.regular),
+        connection("2", PredictionType.solar),
+        connection("3", PredictionType.mixed_solar_regular),
+        connection("4", PredictionType.regular),
+    ]
+    days = upcoming_days(3)
+    service = prediction_service()
+
+    predictions = service.make_predictions_for_fleet(connections, days)
+
+    assert list(predictions.index) == ["1", "2", "3", "4"]
+    assert predictions.columns.equals(fleet_hours(days))
+    for row, grid_connection in enumerate(connections):
+        for day in days:
+            single = service.make_prediction_for_day(grid_connection, day)
+            np.testing.assert_allclose(predictions.iloc[row][single.index], single)
+
+
+def test_constant_history_is_predicted_on_every_hour_of_dst_days():
+    connections = [connection("1", PredictionType.regular), connection("2", PredictionType.regular)]
+    service = prediction_service(ConstantHistoricConsumptionService({"1": 0.25, "2": 1.0}))
+    # days of both DST switches, beyond the span of the calendar index
+    days = [date(2040, 3, 25), date(2040, 10, 28), date(2041, 3, 31), date(2041, 10, 27)]
+
+    predictions = service.make_predictions_for_fleet(connections, days)
+
+    assert predictions.shape[1] == 23 + 25 + 23 + 25
+    assert (predictions.loc["1"] == 1.0).all()
+    assert (predictions.loc["2"] == 4.0).all()
+
+
+def test_hours_of_inactive_days_are_not_predicted():
+    days = upcoming_days(3)
+    predictions = prediction_service().make_predictions_for_fleet(
+        [connection("1", PredictionType.regular, active_until=days[0])], days
+    )
+
+    first_day_hours = get_prediction_hours(days[0])
+    assert not predictions.loc["1", first_day_hours].isna().any()
+    assert predictions.loc["1"].drop(first_day_hours).isna().all()
+
+
+def test_connection_without_history_gets_its_yearly_average():
+    days = upcoming_days(2)
+    predictions = prediction_service().make_predictions_for_fleet(
+        [connection("1", PredictionType.regular, active_from=days[0])], days
+    )
+    assert (predictions.loc["1"] == 1.0).all()
+
+
+def test_range_of_a_single_connection_is_a_series():
+    service = prediction_service()
+    days = upcoming_days(3)
+
+    series = service.make_prediction_for_range(connection("1", PredictionType.regular), days[0], 3)
+
+    assert series.index.equals(fleet_hours(days))
+    with pytest.raises(ValueError):
+        service.make_prediction_for_range([], days[0], 0)
@@ -0,0 +1,146 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from day_ahead_order.fakes import LatencyHistoricConsumptionService
+from day_ahead_order.grid_connection import GridConnection, PredictionType
+from day_ahead_order.history_selection import WeekdaySelector
+from day_ahead_order.prediction import PredictionService
+from day_ahead_order.rolling_profile import RollingWeekdayProfiles
+from day_ahead_order.solar_forecast import SolarForecastService
+from day_ahead_order.utils.datetime import slots_per_day
+
+
+def regular_connections(count):
+    return [
+        GridConnection(f"c{i}", f"87{i:016d}", date(2020, 1, 1), None, PredictionType.regular, 1000)
+        for i in range(count)
+    ]
+
+
+def past_days(first_ago, last_ago):
+    today = date.today()
+    return [today - timedelta(days=ago) for ago in range(first_ago, last_ago - 1, -1)]
+
+
+def constant_hourly(count, value):
+    hourly = np.full((count, slots_per_day), value)
+    hourly[:, -1] = np.nan
+    return hourly
+
+
+def test_update_keeps_days_of_the_window_and_running_sums():
+    profiles = RollingWeekdayProfiles(weeks=2)
+    monday = date(2024, 1, 1)
+    for weeks, value in enumerate([1.0, 2.0, 3.0]):
+        profiles.update(["a"], monday + timedelta(weeks=weeks), constant_hourly(1, value))
+
+    means, day_counts, known = profiles.means(["a", "b"], [date(2024, 1, 22)])
+
+    assert known.tolist() == [True, False]
+    assert means[0, 0, 0] == 2.5
+    assert day_counts.tolist() == [[2], [0]]
+    assert np.isnan(means[1]).all()
+
+
+def test_late_correction_replaces_the_day():
+    profiles = RollingWeekdayProfiles(weeks=2)
+    monday = date(2024, 1, 1)
+    profiles.update(["a"], monday, constant_hourly(1, 1.0))
+    profiles.update(["a"], monday + timedelta(weeks=1), constant_hourly(1, 3.0))
+    profiles.update(["a"], monday, constant_hourly(1, 5.0))
+
+    means, day_counts, _ = profiles.means(["a"], [date(2024, 1, 15)])
+
+    assert means[0, 0, 0] == 4.0
+    assert day_counts.tolist() == [[2]]
+
+
+def test_as_of_is_the_least_recent_update_of_all_eans():
+    profiles = RollingWeekdayProfiles()
+    yesterday, before = past_days(2, 1)[::-1]
+    profiles.update(["a", "b"], before, constant_hourly(2, 1.0))
+    profiles.update(["a"], yesterday, constant_hourly(1, 1.0))
+
+    assert profiles.as_of == before
+    assert not profiles.is_current()
+    assert profiles.current(["a", "b", "c"]).tolist() == [True, False, False]
+
+
+def test_stale_eans_get_their_history_fetched():
+    connections = regular_connections(4)
+    service = LatencyHistoricConsumptionService()
+    profiles = RollingWeekdayProfiles()
+    for day in past_days(21, 1):
+        profiles.update_from(service, connections[:2], day)
+    # made up values, not updated with yesterday
+    for day in past_days(21, 2):
+        profiles.update([c.ean_code for c in connections[2:]], day, constant_hourly(2, 1.0))
+
+    days = [date.today() + timedelta(days=i) for i in range(1, 8)]
+    fetched = PredictionService(SolarForecastService(), service).make_predictions_for_fleet(
+        connections, days
+    )
+    service.calls = 0
+    profiled = PredictionService(
+        SolarForecastService(), service, weekday_profiles=profiles
+    ).make_predictions_for_fleet(connections, days)
+
+    assert service.calls > 0
+    assert np.allclose(profiled.to_numpy(), fetched.to_numpy(), equal_nan=True)
+
+
+def test_profiles_holding_an_anomaly_are_not_selected():
+    connections = regular_connections(2)
+    service = LatencyHistoricConsumptionService()
+    profiles = RollingWeekdayProfiles()
+    for day in past_days(21, 1):
+        profiles.update_from(service, connections, day)
+    yesterday = date.today() - timedelta(days=1)
+    zero_run = service.get_hourly_consumption(connections[:1], [yesterday])[:, 0]
+    zero_run[:, 2:10] = 0.0
+    profiles.update([connections[0].ean_code], yesterday, zero_run)
+
+    ean_codes = [c.ean_code for c in connections]
+    tomorrow_week = [date.today() + timedelta(days=i) for i in range(1, 8)]
+    selected = profiles.selected_by(WeekdaySelector(), ean_codes, tomorrow_week)
+
+    assert selected.tolist() == [False, True]
+    # selection averaging a different number of weekdays never matches
+    assert not profiles.selected_by(WeekdaySelector(weekdays=2), ean_codes, tomorrow_week).any()
+
+
+def test_save_and_load(tmp_path):
+    profiles = RollingWeekdayProfiles()
+    yesterday, before = past_days(2, 1)[::-1]
+    profiles.update(["a", "b"], before, constant_hourly(2, 1.0))
+    profiles.update(["a"], yesterday, constant_hourly(1, 2.0))
+    path = str(tmp_path / "profiles.npz")
+    profiles.save(path)
+
+    loaded = RollingWeekdayProfiles.load(path)
+
+    assert loaded.as_of == before
+    assert loaded.current(["a", "b"]).tolist() == [True, False]
+    assert np.array_equal(loaded.sums, profiles.sums, equal_nan=True)
+
+
+def test_load_profiles_saved_with_a_single_as_of(tmp_path):
+    profiles = RollingWeekdayProfiles()
+    day = date(2024, 1, 1)
+    profiles.update(["a", "b"], day, constant_hourly(2, 1.0))
+    path = str(tmp_path / "profiles.npz")
+    np.savez(
+        path,
+        ean_codes=np.array(["a", "b"]),
+        weeks=profiles.weeks,
+        as_of=np.datetime64(day, "D"),
+        days=profiles.days,
+        hourly=profiles.hourly,
+        sums=profiles.sums,
+        counts=profiles.counts,
+    )
+
+    loaded = RollingWeekdayProfiles.load(path)
+
+    assert loaded.as_of == day
@@ -0,0 +1,51 @@
+from datetime import date, timedelta
+
+import numpy as np
+from pandas import concat
+
+from day_ahead_order.grid_connection import GridConnection, PredictionType
+from day_ahead_order.prediction import fleet_hours
+from day_ahead_order.runner import chunked, default_prediction_service, predict_chunks, predict_fleet
+
+
+def regular_connections(count):
+    return [
+        GridConnection(f"c{i}", f"87{i:016d}", date(2020, 1, 1), None, PredictionType.regular, 1000 + i)
+        for i in range(count)
+    ]
+
+
+def upcoming_days(count):
+    tomorrow = date.today() + timedelta(days=1)
+    return [tomorrow + timedelta(days=i) for i in range(count)]
+
+
+def test_connections_are_chunked_lazily():
+    chunks = chunked(iter(regular_connections(5)), chunk_size=2)
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+
+
+def test_worker_processes_predict_the_same_as_one_process(monkeypatch):
+    monkeypatch.delenv("DAY_AHEAD_ORDER_CACHE_DIR", raising=False)
+    connections, days = regular_connections(7), upcoming_days(2)
+
+    sharded = concat(predict_chunks(chunked(connections, 2), days, workers=2)).sort_index()
+
+    expected = default_prediction_service().make_predictions_for_fleet(connections, days)
+    np.testing.assert_allclose(sharded.to_numpy(), expected.to_numpy())
+
+
+def test_fleet_predictions_keep_the_order_of_connections():
+    connections, days = regular_connections(5)[::-1], upcoming_days(1)
+
+    predictions = predict_fleet(connections, days, chunk_size=2)
+
+    assert list(predictions.index) == [connection.ean_code for connection in connections]
+    assert predictions.columns.equals(fleet_hours(days))
+
+
+def test_empty_fleet_has_the_hours_as_columns():
+    days = upcoming_days(2)
+    predictions = predict_fleet([], days)
+    assert predictions.empty
+    assert predictions.columns.equals(fleet_hours(days))
@@ -0,0 +1,185 @@
+import http.client
+import json
+import socket
+from contextlib import contextmanager
+from datetime import date
+from threading import Thread
+
+import numpy as np
+import pytest
+
+from day_ahead_order.connection_registry import ConnectionRegistry
+from day_ahead_order.fakes import LatencyHistoricConsumptionService, LatencySolarForecastService
+from day_ahead_order.grid_connection import GridConnection, PredictionType
+from day_ahead_order.prediction import PredictionService
+from day_ahead_order.server import PredictionBatcher, PredictionServer, max_days
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX)
+        self.sock.connect(self.socket_path)
+
+
+class FailingPredictionService(PredictionService):
+    """
+    Fails the first `failures` predictions with the error (by default one
+    escaping `except Exception`).
+    """
+
+    def __init__(self, failures, error=KeyboardInterrupt("interrupted")):
+        super().__init__(LatencySolarForecastService(), LatencyHistoricConsumptionService())
+        self.failures = failures
+        self.error = error
+
+    def make_prediction_for_range(self, grid_connections, start_day, n_days):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        return super().make_prediction_for_range(grid_connections, start_day, n_days)
+
+
+def regular_registry(count):
+    return ConnectionRegistry.from_connections(
+        GridConnection(f"c{i}", f"87{i:016d}", date(2020, 1, 1), None, PredictionType.regular, 1000)
+        for i in range(count)
+    )
+
+
+def prediction_service():
+    return PredictionService(LatencySolarForecastService(), LatencyHistoricConsumptionService())
+
+
+@contextmanager
+def running_server(service, registry, transport, tmp_path):
+    address = "127.0.0.1:0" if transport == "tcp" else str(tmp_path / "server.sock")
+    server = PredictionServer(service, registry, address)
+    thread = Thread(target=server.serve_forever)
+    thread.start()
+    if transport == "tcp":
+        connection = http.client.HTTPConnection(*server.server.server_address)
+    else:
+        connection = UnixHTTPConnection(address)
+
+    def call(method, path, body=None):
+        connection.request(method, path, None if body is None else json.dumps(body))
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    try:
+        yield call
+    finally:
+        connection.close()
+        server.shutdown()
+        thread.join()
+        server.close()
+
+
+@pytest.fixture(params=["tcp", "unix"])
+def client(request, tmp_path):
+    registry = regular_registry(3)
+    with running_server(prediction_service(), registry, request.param, tmp_path) as call:
+        yield call, registry
+
+
+def test_health(client):
+    call, _ = client
+    assert call("GET", "/health") == (200, {"status": "ok", "connections": 3})
+
+
+def test_single_prediction_equals_direct_prediction(client):
+    call, registry = client
+    ean = registry.ean_codes[1]
+
+    status, body = call("GET", f"/connections/{ean}/prediction?start=2024-03-31&days=2")
+
+    assert status == 200
+    assert body["ean"] == ean
+    # 23-hour day of the switch to summer time
+    assert len(body["hours"]) == 23 + 24
+    assert body["hours"][0] == "2024-03-30T23:00:00Z"
+    direct = prediction_service().make_prediction_for_range(registry.take([1]), date(2024, 3, 31), 2)
+    np.testing.assert_allclose(np.array(body["kwh"], dtype=float), direct.to_numpy()[0])
+
+
+def test_batch_prediction(client):
+    call, registry = client
+    eans = [registry.ean_codes[2], registry.ean_codes[0]]
+
+    status, body = call("POST", "/predictions", {"eans": eans, "start": "2024-10-27", "days": 1})
+
+    assert status == 200
+    assert (body["start"], body["days"]) == ("2024-10-27", 1)
+    # 25-hour day of the switch to winter time
+    assert len(body["hours"]) == 25
+    assert list(body["predictions"]) == eans
+
+
+def test_all_connections_predicted_without_eans(client):
+    call, registry = client
+    status, body = call("POST", "/predictions", {"start": "2024-01-01"})
+    assert status == 200
+    assert sorted(body["predictions"]) == sorted(registry.ean_codes)
+
+
+def test_unknown_ean_is_not_found(client):
+    call, _ = client
+    status, body = call("POST", "/predictions", {"eans": ["nope"]})
+    assert status == 404
+    assert body["eans"] == ["nope"]
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"start": 5},
+        {"start": "tomorrow"},
+        {"days": 1.5},
+        {"days": True},
+        {"days": 0},
+        {"days": max_days + 1},
+        {"eans": "8700000000000000000"},
+    ],
+)
+def test_invalid_batch_request_is_bad_request(client, body):
+    call, _ = client
+    status, content = call("POST", "/predictions", body)
+    assert status == 400
+    assert "error" in content
+
+
+@pytest.mark.parametrize("query", ["days=1.5", "days=true", "days=-1", f"days={max_days + 1}"])
+def test_invalid_query_is_bad_request(client, query):
+    call, registry = client
+    status, _ = call("GET", f"/connections/{registry.ean_codes[0]}/prediction?{query}")
+    assert status == 400
+
+
+def test_failed_prediction_is_server_error(tmp_path, caplog):
+    registry = regular_registry(1)
+    service = FailingPredictionService(failures=1, error=ValueError("no history"))
+
+    with running_server(service, registry, "tcp", tmp_path) as call:
+        status, content = call("POST", "/predictions", {"start": "2024-01-01", "days": 1})
+        assert call("POST", "/predictions", {"start": "2024-01-01", "days": 1})[0] == 200
+
+    assert status == 500
+    assert content == {"error": "no history"}
+    assert "Failed to handle POST /predictions" in caplog.text
+
+
+def test_batcher_survives_failed_batch():
+    registry = regular_registry(2)
+    batcher = PredictionBatcher(FailingPredictionService(failures=1), registry, linger=0)
+    try:
+        with pytest.raises(KeyboardInterrupt):
+            batcher.predict(np.array([0]), date(2024, 1, 1), 1)
+        predictions = batcher.predict(np.array([1, 0]), date(2024, 1, 1), 1)
+    finally:
+        batcher.close()
+
+    assert list(predictions.index) == [registry.ean_codes[1], registry.ean_codes[0]]
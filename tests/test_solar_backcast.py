@@ -0,0 +1,89 @@
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+from pandas import Series, date_range
+
+from day_ahead_order.grid_connection import GridConnection, PredictionType
+from day_ahead_order.historic_consumption_service import HistoricConsumptionService
+from day_ahead_order.prediction import PredictionService
+from day_ahead_order.solar_backcast import SolarBackcast
+from day_ahead_order.solar_forecast import SolarForecastService
+
+from .test_prediction import ConstantHistoricConsumptionService
+
+
+class PastAndFutureSolarForecastService(SolarForecastService):
+    """
+    Produces 1 kWh per kWp every hour of the past and 2 kWh per kWp every
+    hour from now on, and remembers the requested ranges.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    def predict(self, time_start, time_end, latitude, longitude, plane_declination,
+                plane_azimuth, solar_rated_power):
+        self.requests.append((time_start, time_end))
+        hours = date_range(time_start, time_end, freq="60min")
+        now = datetime.now(timezone.utc)
+        return Series(np.where(hours < now, 1.0, 2.0) * solar_rated_power, index=hours)
+
+
+def mixed_connection(ean_code="1", solar_rated_power=0.5):
+    return GridConnection(
+        "mixed", ean_code, date(2020, 1, 1), None, PredictionType.mixed_solar_regular, 8760,
+        52.5, 5.5, 35, 180, solar_rated_power,
+    )
+
+
+def upcoming_days(count):
+    tomorrow = date.today() + timedelta(days=1)
+    return [tomorrow + timedelta(days=i) for i in range(count)]
+
+
+def test_backcast_is_subtracted_and_forecast_added():
+    service = PredictionService(
+        PastAndFutureSolarForecastService(), ConstantHistoricConsumptionService({"1": 0.25})
+    )
+
+    predictions = service.make_predictions_for_fleet([mixed_connection()], upcoming_days(2))
+
+    # (1 kWh consumed - 0.5 kWh backcast) averaged + 1 kWh forecast
+    np.testing.assert_allclose(predictions.loc["1"], 1.5)
+
+
+def test_backcast_window_is_fetched_once_for_consecutive_days():
+    solar = PastAndFutureSolarForecastService()
+    backcast = SolarBackcast(solar)
+    connections = [mixed_connection("1"), mixed_connection("2")]
+    today = date.today()
+
+    for weeks_ago in (3, 2, 1):
+        backcast.hourly(connections, [today - timedelta(weeks=weeks_ago)])
+    assert len(solar.requests) == 2
+
+    # days before the window get it widened
+    backcast.hourly(connections, [today - timedelta(weeks=8)])
+    assert len(solar.requests) == 4
+
+
+def test_backcast_is_lined_up_on_local_hour_slots():
+    backcast = SolarBackcast(PastAndFutureSolarForecastService())
+    # summer time ended on that day
+    hourly = backcast.hourly([mixed_connection()], [date(2024, 10, 27)])
+
+    assert hourly.shape == (1, 1, 25)
+    np.testing.assert_allclose(hourly[0, 0], 0.5)
+
+
+def test_mixed_prediction_predicts_both_parts_with_the_default_services():
+    days = upcoming_days(2)
+    service = PredictionService(SolarForecastService(), HistoricConsumptionService())
+
+    mixed = service.make_predictions_for_fleet([mixed_connection()], days)
+
+    assert not mixed.isna().any().any()
+    assert mixed.shape[1] == sum(
+        len(service.make_prediction_for_day(mixed_connection(), day)) for day in days
+    )
@@ -0,0 +1,48 @@
+import asyncio
+import math
+from datetime import datetime, timezone
+
+import pytest
+
+from day_ahead_order.fakes import LatencySolarForecastService
+from day_ahead_order.solar_forecast_cache import CachedSolarForecastService
+
+time_start = datetime(2024, 6, 1, 22, tzinfo=timezone.utc)
+time_end = datetime(2024, 6, 2, 22, tzinfo=timezone.utc)
+
+
+def test_nearby_sites_with_same_orientation_share_a_forecast():
+    service = LatencySolarForecastService()
+    cache = CachedSolarForecastService(service)
+
+    small = cache.predict(time_start, time_end, 52.0901, 5.1201, 35, 180, 2.0)
+    large = cache.predict(time_start, time_end, 52.0899, 5.1199, 35, 180, 6.0)
+    cache.predict(time_start, time_end, 52.0901, 5.1201, 20, 180, 2.0)
+
+    assert service.calls == 2
+    assert (large == 3 * small).all()
+    assert (cache.stats.memory_hits, cache.stats.misses) == (1, 2)
+
+
+def test_expired_forecast_gets_fetched_again():
+    service = LatencySolarForecastService()
+    cache = CachedSolarForecastService(service, ttl=0)
+
+    cache.predict(time_start, time_end, 52.09, 5.12, 35, 180, 2.0)
+    cache.predict(time_start, time_end, 52.09, 5.12, 35, 180, 2.0)
+
+    assert service.calls == 2
+
+
+@pytest.mark.parametrize("solar_rated_power", [None, math.nan])
+def test_unknown_rated_power_is_rejected_before_fetching(solar_rated_power):
+    service = LatencySolarForecastService()
+    cache = CachedSolarForecastService(service)
+
+    with pytest.raises(ValueError, match="solar_rated_power"):
+        cache.predict(time_start, time_end, 52.09, 5.12, 35, 180, solar_rated_power)
+    with pytest.raises(ValueError, match="solar_rated_power"):
+        asyncio.run(cache.apredict(time_start, time_end, 52.09, 5.12, 35, 180, solar_rated_power))
+
+    assert service.calls == 0
+    assert cache.stats.misses == 0
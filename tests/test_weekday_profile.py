@@ -0,0 +1,68 @@
+from datetime import date
+
+import numpy as np
+from pandas import DataFrame, date_range
+
+from day_ahead_order.utils.datetime import get_prediction_hours, repeated_hour_slot, slots_per_day
+from day_ahead_order.weekday_profile import align_local_hours, masked_weekday_mean, profile_for_hours
+
+
+def test_quarters_are_summed_into_local_hour_slots():
+    # 00:00 - 04:00 UTC on the day summer time ends (02:00 local happens twice)
+    intervals = date_range("2024-10-27 00:00", periods=16, freq="15min", tz="UTC")
+    consumption = DataFrame(
+        {"ean": ["a"] * 16 + ["b"], "interval_start": list(intervals) + [intervals[0]], "kwh": 1.0}
+    )
+    consumption.loc[3, "kwh"] = np.nan
+
+    hourly = align_local_hours(consumption, ["a", "b", "c"], [date(2024, 10, 27)])
+
+    assert hourly.shape == (3, 1, slots_per_day)
+    assert hourly[0, 0, [2, repeated_hour_slot, 3, 4]].tolist() == [3.0, 4.0, 4.0, 4.0]
+    assert np.isnan(hourly[0, 0, :2]).all()
+    assert hourly[1, 0, 2] == 1.0
+    assert np.isnan(hourly[2]).all()
+
+
+def test_mean_ignores_missing_hours_and_counts_days_with_data():
+    hourly = np.full((1, 3, slots_per_day), np.nan)
+    hourly[0, 0, :] = 1.0
+    hourly[0, 1, :12] = 3.0
+    windows = np.array([[True, True, True], [False, False, True]])
+
+    means, day_counts = masked_weekday_mean(hourly, windows)
+
+    assert means[0, 0, 0] == 2.0
+    assert means[0, 0, 20] == 1.0
+    assert np.isnan(means[0, 1]).all()
+    assert day_counts.tolist() == [[2, 0]]
+
+
+def test_repeated_windows_average_like_distinct_ones():
+    rng = np.random.default_rng(0)
+    hourly = rng.random((4, 6, slots_per_day))
+    hourly[rng.random(hourly.shape) < 0.2] = np.nan
+    windows = rng.random((4, 5, 6)) < 0.5
+    windows[:, 3] = windows[:, 0]
+
+    means, day_counts = masked_weekday_mean(hourly, windows)
+
+    for connection in range(4):
+        for day in range(5):
+            selected = hourly[connection, windows[connection, day]]
+            present = ~np.isnan(selected)
+            with np.errstate(invalid="ignore"):
+                expected = np.nansum(selected, axis=0) / present.sum(axis=0)
+            np.testing.assert_allclose(means[connection, day], expected)
+            assert day_counts[connection, day] == present.any(axis=1).sum()
+
+
+def test_repeated_hour_falls_back_to_the_wall_clock_hour():
+    hours = get_prediction_hours(date(2024, 10, 27))
+    means = np.arange(slots_per_day, dtype=float)[np.newaxis, np.newaxis].repeat(2, axis=0)
+    means[1, 0, repeated_hour_slot] = np.nan
+
+    values = profile_for_hours(means, np.zeros(len(hours), dtype=np.int64), hours)
+
+    assert values[0].tolist() == [0, 1, 2, repeated_hour_slot] + list(range(3, 24))
+    assert values[1].tolist() == [0, 1, 2, 2] + list(range(3, 24))